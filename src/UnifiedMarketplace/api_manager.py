@@ -1,7 +1,14 @@
 import requests
 import logging
 import os
+import threading
+import time
 from datetime import datetime
+from requests.adapters import HTTPAdapter
+
+from circuit_breaker import CLOSED, CircuitOpen, backoff_delay, get_breaker
+from product_model import normalize_products
+from rate_limiter import PRIORITY_INTERACTIVE, RateLimited, rate_limiter
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG, format="%(asctime)s - %(levelname)s - %(message)s")
@@ -13,9 +20,226 @@ HEADERS = {
     "x-rapidapi-host": "real-time-product-search.p.rapidapi.com"
 }
 
+# Connection pool and timeout settings for the product search client
+POOL_CONNECTIONS = int(os.environ.get("RAPIDAPI_POOL_CONNECTIONS", 4))  # Number of hosts to keep pools for
+POOL_MAXSIZE = int(os.environ.get("RAPIDAPI_POOL_MAXSIZE", 10))  # Max open connections per host
+POOL_BLOCK = os.environ.get("RAPIDAPI_POOL_BLOCK", "true").lower() == "true"  # Wait instead of opening extra connections
+CONNECT_TIMEOUT = float(os.environ.get("RAPIDAPI_CONNECT_TIMEOUT", 3.05))  # Seconds
+READ_TIMEOUT = float(os.environ.get("RAPIDAPI_READ_TIMEOUT", 15))  # Seconds
+
+# Retries of failures that are safe to retry: connection errors and RETRY_STATUSES
+RETRY_ATTEMPTS = int(os.environ.get("RAPIDAPI_RETRY_ATTEMPTS", 2))  # Retries after the first try
+RETRY_BASE_DELAY = float(os.environ.get("RAPIDAPI_RETRY_BASE_DELAY", 0.2))  # Seconds, doubled per retry
+RETRY_MAX_DELAY = float(os.environ.get("RAPIDAPI_RETRY_MAX_DELAY", 2))  # Seconds
+RETRY_BUDGET = float(os.environ.get("RAPIDAPI_RETRY_BUDGET", 5))  # No retry starts this many seconds after the first try
+RETRY_STATUSES = {500, 502, 503, 504}
+
+# Products per page - the search page shows 50, the API returns at most 100
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 100
+
+
+class ProductSearchError(Exception):
+    """Raised when the product search API request fails"""
+
+
+class RetryableSearchError(ProductSearchError):
+    """Raised when a request failed in a way that is safe to retry"""
+
+
+class ProductSearchClient:
+    """
+    HTTP client for the RapidAPI product search endpoint.
+    
+    Owns a keep-alive requests.Session so repeated searches reuse the same
+    TCP+TLS connection instead of opening a new one per call. Every request
+    first takes a token from the rate limiter, and every response updates it.
+    Connection errors and 5xx responses are retried with jittered exponential
+    backoff and counted by the endpoint's circuit breaker; while the circuit
+    is open, searches fail at once with CircuitOpen.
+    """
+    
+    def __init__(self, api_url=API_URL, headers=None, pool_connections=POOL_CONNECTIONS,
+                 pool_maxsize=POOL_MAXSIZE, pool_block=POOL_BLOCK,
+                 connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT, limiter=rate_limiter,
+                 retry_attempts=RETRY_ATTEMPTS, retry_budget=RETRY_BUDGET):
+        """
+        Args:
+            api_url (str): The product search endpoint
+            headers (dict): Headers sent with every request
+            pool_connections (int): Number of per-host connection pools to cache
+            pool_maxsize (int): Maximum connections kept open to a single host
+            pool_block (bool): Block when the per-host pool is exhausted rather than
+                opening throwaway connections beyond pool_maxsize
+            connect_timeout (float): Seconds to wait for the connection to open
+            read_timeout (float): Seconds to wait between bytes of the response
+            limiter (RateLimiter): Upstream rate limiter shared by all clients
+            retry_attempts (int): Retries after the first try of a retryable failure
+            retry_budget (float): Seconds after the first try when no more retries start
+        """
+        self.api_url = api_url
+        self.timeout = (connect_timeout, read_timeout)
+        self.limiter = limiter
+        self.breaker = get_breaker(api_url)
+        self.retry_attempts = retry_attempts
+        self.retry_budget = retry_budget
+        
+        self.session = requests.Session()
+        self.session.headers.update(headers if headers is not None else HEADERS)
+        
+        # Mount a pooled adapter for both schemes so all hosts share the limits
+        adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=pool_block
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+    
+    def search(self, params, priority=PRIORITY_INTERACTIVE):
+        """
+        Run a product search, retrying failures that are safe to retry.
+        
+        Args:
+            params (dict): Query parameters for the search endpoint
+            priority (int): Rate limiter priority, see rate_limiter
+            
+        Returns:
+            list: List of Product objects
+            
+        Raises:
+            CircuitOpen: If the endpoint's circuit breaker is open
+            RateLimited: If the rate limiter sheds the request
+            ProductSearchError: If the request fails or returns a non-200 status
+        """
+        start = time.monotonic()
+        retry = 0
+        while True:
+            try:
+                return self._search_once(params, priority)
+            except RetryableSearchError as e:
+                if retry >= self.retry_attempts or time.monotonic() - start >= self.retry_budget:
+                    raise
+                delay = backoff_delay(retry, RETRY_BASE_DELAY, RETRY_MAX_DELAY)
+                logging.warning(f"Retrying product search in {delay:.2f}s after: {e}")
+                time.sleep(delay)
+                retry += 1
+    
+    def _search_once(self, params, priority):
+        """Make one request, recording its outcome with the circuit breaker"""
+        probe = self.breaker.before_call()
+        try:
+            return self._request(params, priority, probe)
+        except BaseException:
+            # Outcomes are recorded where they are known; this frees a half-open probe slot
+            # after a shed call or anything unexpected, which would otherwise reject every later call
+            self.breaker.release(probe)
+            raise
+    
+    def _request(self, params, priority, probe=None):
+        """Take a rate limiter token, make the request and record its outcome under the probe token"""
+        if self.limiter is not None:
+            self.limiter.acquire(priority)  # A shed call never reached the API - released above
+        
+        try:
+            response = self.session.get(self.api_url, params=params, timeout=self.timeout)
+        except requests.ConnectionError as e:
+            # Refused, reset or timed out connecting - retrying the GET is safe
+            self.breaker.record_failure(probe)
+            raise RetryableSearchError(f"Request to product search API failed: {e}") from e
+        except requests.RequestException as e:
+            self.breaker.record_failure(probe)
+            raise ProductSearchError(f"Request to product search API failed: {e}") from e
+        
+        if self.limiter is not None:
+            self.limiter.observe(response.headers, response.status_code)
+        
+        if response.status_code != 200:
+            logging.error(f"API request failed! Status code: {response.status_code}")
+            logging.error(f"Error details: {response.text}")
+            if response.status_code in RETRY_STATUSES:
+                self.breaker.record_failure(probe)
+                raise RetryableSearchError(f"Product search API returned status {response.status_code}")
+            if response.status_code == 429:
+                self.breaker.release(probe)  # Throttled, not down - the rate limiter backs off
+            else:
+                self.breaker.record_success(probe)
+            raise ProductSearchError(f"Product search API returned status {response.status_code}")
+        
+        try:
+            response_data = response.json()
+        except ValueError as e:
+            self.breaker.record_failure(probe)
+            raise ProductSearchError(f"Product search API returned invalid JSON: {e}") from e
+        self.breaker.record_success(probe)
+        
+        # Normalize at ingestion so nothing downstream holds the raw nested payload
+        return normalize_products(response_data.get("data", {}).get("products", []))
+    
+    def close(self):
+        """Close all pooled connections"""
+        self.session.close()
+
+
+# One client per process - created lazily so forked workers never share sockets
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """
+    Get the process-wide product search client, creating it on first use.
+    
+    Returns:
+        ProductSearchClient: The shared client for this process
+    """
+    global _client, _client_pid
+    
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                _client = ProductSearchClient()
+                _client_pid = pid
+                logging.info(f"Created product search client for process {pid}")
+    return _client
+
+def upstream_degraded():
+    """
+    Check whether the product search API is failing in this process.
+    
+    Returns:
+        bool: True while the endpoint's circuit breaker is open or probing
+    """
+    return get_breaker(API_URL).state != CLOSED
+
+def build_params(query, page=1, sort_by="BEST_MATCH", product_condition="NEW",
+                 min_rating="ANY", min_price="0", max_price="1000000",
+                 stores="Amazon", country="us", language="en", limit=DEFAULT_LIMIT):
+    """
+    Build the query parameters for the product search endpoint.
+    
+    Returns:
+        dict: Query parameters ready to send with the request
+    """
+    return {
+        "q": query,
+        "country": country,
+        "language": language,
+        "page": page,
+        "limit": str(min(int(limit), MAX_LIMIT)),
+        "sort_by": sort_by,
+        "product_condition": product_condition,
+        "min_rating": min_rating,
+        "min_price": min_price,
+        "max_price": max_price,
+        "stores": stores
+    }
+
 def get_products(query, page=1, sort_by="BEST_MATCH", product_condition="NEW", 
                 min_rating="ANY", min_price="0", max_price="1000000", 
-                stores="Amazon", country="us", language="en"):
+                stores="Amazon", country="us", language="en", limit=DEFAULT_LIMIT,
+                priority=PRIORITY_INTERACTIVE, raise_errors=False):
     """
     Fetch products from the RapidAPI product search endpoint
     
@@ -30,9 +254,14 @@ def get_products(query, page=1, sort_by="BEST_MATCH", product_condition="NEW",
         stores (str): Comma-separated list of stores to search
         country (str): Country code
         language (str): Language code
+        limit (int): Products per page, at most MAX_LIMIT
+        priority (int): Rate limiter priority - background and prefetch calls are
+            shed first when the upstream limits are tight
+        raise_errors (bool): Re-raise failures after logging them instead of returning [],
+            for callers that treat errors differently from empty results
         
     Returns:
-        list: List of product dictionaries
+        list: List of Product objects
     """
     if not query:
         logging.warning("Empty query provided")
@@ -44,37 +273,28 @@ def get_products(query, page=1, sort_by="BEST_MATCH", product_condition="NEW",
                      f"condition: {product_condition}, stores: {stores}, country: {country}")
         
         # API query parameters
-        params = {
-            "q": query,
-            "country": country,
-            "language": language,
-            "page": page,
-            "limit": "50",
-            "sort_by": sort_by,
-            "product_condition": product_condition,
-            "min_rating": min_rating,
-            "min_price": min_price,
-            "max_price": max_price,
-            "stores": stores
-        }
-
-        # API request
-        response = requests.get(API_URL, headers=HEADERS, params=params)
+        params = build_params(
+            query, page=page, sort_by=sort_by, product_condition=product_condition,
+            min_rating=min_rating, min_price=min_price, max_price=max_price,
+            stores=stores, country=country, language=language, limit=limit
+        )
+
+        # API request through the pooled, keep-alive client
+        products = get_client().search(params, priority=priority)
         
-        # Handle response
-        if response.status_code == 200:
-            response_data = response.json()
-            products = response_data.get("data", {}).get("products", [])
-            
-            # Log the number of products fetched
-            logging.info(f"Successfully fetched {len(products)} products")
-            
-            return products
-        else:
-            logging.error(f"API request failed! Status code: {response.status_code}")
-            logging.error(f"Error details: {response.text}")
-            return []
+        # Log the number of products fetched
+        logging.info(f"Successfully fetched {len(products)} products")
+        
+        return products
+    
+    except (RateLimited, CircuitOpen) as e:
+        logging.warning(f"Skipped API request for query {query}: {e}")
+        if raise_errors:
+            raise
+        return []
             
     except Exception as e:
         logging.error(f"Error fetching products: {str(e)}")
+        if raise_errors:
+            raise
         return []
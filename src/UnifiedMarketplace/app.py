@@ -1,7 +1,7 @@
 import os
 import logging
 import threading
-import time
+import click
 from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
@@ -10,13 +10,10 @@ from werkzeug.security import check_password_hash, generate_password_hash
 from werkzeug.middleware.proxy_fix import ProxyFix
 from datetime import datetime, timedelta
 import json
+from urllib.parse import parse_qsl
 
 # Import Supabase client
-from supabase_client import (
-    supabase_client, get_user_by_email, get_user_by_username, 
-    create_user, get_search_history, save_search,
-    get_cached_search, cache_search_results, clear_expired_cache
-)
+from supabase_client import get_supabase_client
 
 # Initialize logging
 logging.basicConfig(level=logging.DEBUG, format="%(asctime)s - %(levelname)s - %(message)s")
@@ -98,43 +95,232 @@ login_manager.login_message_category = 'info'
 # Import after initializing db to avoid circular imports
 from models import User, SearchHistory
 from forms import RegistrationForm, LoginForm
-from api_manager import get_products
-from cache_manager import get_cached_results, cache_results
+from api_manager import ProductSearchError, get_products, upstream_degraded
+from cache_manager import (cache_results, get_cached_entry, get_cached_results, get_expired_entry, get_refined_entry,
+                           queue_cache_results, remember_refined, l1_cache, refined_cache, negative_cache,
+                           EMPTY, ERROR)
+from singleflight import search_flight
+from cache_keys import canonical_query_args, lookup_keys
+from refresh_scheduler import refresh_scheduler
+from write_behind import write_queue
+from maintenance import maintenance_scheduler
+from user_cache import SessionUser, load_session_user, invalidate_user, user_cache
+from storage import get_storage
+from product_model import serialize_products
+from search_api import MAX_PAGE, parse_fields, parse_limit, project_product, encode_cursor, decode_cursor
+from http_cache import conditional_response, templates_modified_at
+from product_query import ProductTable, local_only_filter, refine_cached, upstream_params
+from product_index import product_index, search_index
+from rate_limiter import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, PRIORITY_PREFETCH, RateLimited, rate_limiter
+from circuit_breaker import CircuitOpen, breaker_stats
+from prefetcher import ALREADY_CACHED, FETCHED, SHED, prefetcher
+from search_engine import FANOUT_STORES, fan_out_search, store_list
+from search_log import log_search
 
 @login_manager.user_loader
 def load_user(user_id):
-    return db.session.get(User, int(user_id))
+    # Served from the user cache, so most page views don't query the database
+    return load_session_user(int(user_id))
 
-# Create tables when app starts - with error handling
-try:
-    with app.app_context():
-        logging.info("Attempting to create database tables...")
-        db.create_all()
-        logging.info("Database tables created successfully")
-except Exception as e:
-    logging.error(f"Error creating database tables: {e}")
-    logging.warning("Application will continue, but database functionality may be limited")
-    
-# Background task to clear expired cache entries
-def clear_cache_periodically():
-    """Run a background thread that clears expired cache every hour"""
-    from cache_manager import clear_old_cache
-    
-    while True:
-        time.sleep(3600)  # Run every hour (3600 seconds)
-        with app.app_context():
+def save_search_history_batch(items):
+    """Write-behind handler: save a batch of search history rows"""
+    try:
+        get_storage().save_searches(items)
+    except Exception as e:
+        logging.error(f"Error saving search history: {e}")
+        return len(items)
+
+write_queue.register("history", save_search_history_batch)
+
+# Background services start with the first request rather than at import, so importing
+# the app (CLI commands, a preloading gunicorn master) does no I/O and starts no threads
+_services_started = False
+_services_lock = threading.Lock()
+
+def start_background_services():
+    """Start this process's background services, once"""
+    global _services_started
+    
+    with _services_lock:
+        if _services_started:
+            return
+        _services_started = True
+        
+    # Start the maintenance scheduler (cache purge, partitions, stats) if running in production.
+    # Every worker runs it, but only the elected leader runs jobs.
+    if not app.debug or os.environ.get("FLASK_ENV") == "production":
+        maintenance_scheduler.start()
+
+@app.before_request
+def start_services_on_first_request():
+    if not _services_started:
+        start_background_services()
+
+def search_products(search_params, force_reload=False, base_params=None, priority=PRIORITY_INTERACTIVE):
+    """
+    Get the products for a search from the cache, calling the API on a miss.
+    
+    A miss that only narrows the filters or changes the sort order of the
+    search being refined (base_params), or of a complete cached page, is
+    answered by filtering those products locally. Such results are kept in
+    memory only, never cached as the narrower search's own. Searches
+    that recently came back empty or failed aren't sent to the API again until
+    their negative cache entry expires. Searches of several stores are
+    sent as one cached search per store, run concurrently and merged; if a
+    store gets no answer the merged results are served but not cached.
+    While the API is unavailable, the last cached results are returned even if they have
+    expired; the entry's expired flag tells the caller to mark them stale.
+    
+    Args:
+        search_params (dict): get_products arguments (query, page, sort_by, ..., limit),
+            plus the local-only free_shipping
+        force_reload (bool): Skip the cache and call the API
+        base_params (dict): Parameters of the search being refined, tried as a local source
+        priority (int): Rate limiter priority of an API call on a miss
+        
+    Returns:
+        tuple: (list of Product objects, canonical cache key, CachedResults entry
+            holding them or None if they weren't cached)
+    """
+    # Generate a canonical cache key, plus the legacy key while old rows are still live
+    cache_key, *legacy_keys = lookup_keys(search_params)
+    
+    def fetch_and_cache(priority=PRIORITY_INTERACTIVE, reload=False, write_now=False):
+        """Call the API and cache the results, or remember that there were none"""
+        if FANOUT_STORES and len(store_list(search_params)) > 1:
+            # One cached search per store, searched at once - stores shared with other searches are reused
+            result = fan_out_search(search_params, lambda shard_params: search_shard(shard_params, priority, reload))
+            if result.partial:
+                return result.products  # Served, but neither cached nor remembered as empty
+            products = result.products
+        else:
             try:
-                logging.info("Running scheduled cache cleanup")
-                clear_old_cache()
-            except Exception as e:
-                logging.error(f"Error in scheduled cache cleanup: {e}")
+                products = get_products(**upstream_params(search_params), priority=priority, raise_errors=True)
+            except (RateLimited, CircuitOpen):
+                return []  # Never reached the API - nothing to remember about the search
+            except Exception:
+                negative_cache.set(cache_key, ERROR, shared=write_now)
+                return []
+        
+        # Apply what the API can't filter on
+        product_filter = local_only_filter(search_params)
+        if products and product_filter:
+            products = ProductTable(products).query(product_filter)
+        
+        # Cache the results - in memory now, in the database and product index in the background,
+        # unless workers waiting on this call will look for them (or for no results) in the database
+        if products and write_now:
+            cache_results(cache_key, products, search_params=search_params)
+        elif products:
+            queue_cache_results(cache_key, products, search_params=search_params)
+        else:
+            negative_cache.set(cache_key, EMPTY, shared=write_now)
+        return products
+    
+    def recheck():
+        """Results another worker's call cached, [] if it found none, None if it hasn't finished"""
+        products = get_cached_results(cache_key)
+        if products:
+            return products
+        return [] if negative_cache.get_shared(cache_key) is not None else None
+    
+    # Only if "apply_filters" is true or cache doesn't exist, call the API
+    if force_reload:
+        logging.info(f"Applying filters or forced reload for: {cache_key}")
+        products = fetch_and_cache(priority, reload=True)
+    else:
+        # Try to get cached results
+        logging.info(f"Looking for cached results for: {cache_key}")
+        entry = get_cached_entry(cache_key, fallback_keys=legacy_keys,
+                                 refresh=lambda: fetch_and_cache(PRIORITY_BACKGROUND, reload=True))
+        if entry and entry.products:
+            logging.info(f"Found cached results for: {cache_key}")
+            prefetcher.record_hit(search_params)
+            return entry.products, cache_key, entry
+        
+        # Narrower filters or another sort of a cached search don't need the API. Those results
+        # are only the top of this search, so they stay in memory under their own key
+        entry = get_refined_entry(cache_key)
+        if entry is None:
+            refined = refine_cached(search_params, base_params)
+            if refined is not None:
+                entry = remember_refined(cache_key, *refined)
+        if entry is not None:
+            return entry.products, cache_key, entry
+        
+        # Searches the local product index fully covers don't need the API either
+        indexed = search_index(search_params)
+        if indexed:
+            products = indexed
+            queue_cache_results(cache_key, products)
+        elif negative_cache.get(cache_key) is not None:
+            # This search recently came back empty or failed - don't ask again yet
+            logging.info(f"Negative cache hit for: {cache_key}")
+            products = []
+        else:
+            # If cache miss, call the API - identical concurrent misses share one call
+            logging.info(f"Cache miss for: {cache_key}, calling API")
+            products = search_flight.do(
+                cache_key,
+                lambda: fetch_and_cache(priority, write_now=search_flight.crosses_processes()),
+                recheck=recheck
+            )
+    
+    # Serve the last known results, however old, rather than nothing during an outage
+    if not products and upstream_degraded():
+        entry = get_expired_entry(cache_key, fallback_keys=legacy_keys)
+        if entry and entry.products:
+            logging.warning(f"API unavailable, serving expired results for: {cache_key}")
+            return entry.products, cache_key, entry
+    
+    # Fresh results were just put in the memory cache, read back for their timestamps
+    entry = get_cached_entry(cache_key) if products else None
+    return products, cache_key, entry
 
-# Start the background task if running in production
-if not app.debug or os.environ.get("FLASK_ENV") == "production":
-    cache_cleaner = threading.Thread(target=clear_cache_periodically)
-    cache_cleaner.daemon = True  # Thread will exit when the main process exits
-    cache_cleaner.start()
-    logging.info("Started background cache cleaning thread")
+def search_shard(shard_params, priority, reload=False):
+    """
+    Search one shard of a fanned-out search, on a fan-out worker thread.
+    
+    Args:
+        shard_params (dict): The search narrowed to one store, page and country
+        priority (int): Rate limiter priority of an API call on a miss
+        reload (bool): Skip the shard's cached results
+        
+    Returns:
+        list: The shard's products
+        
+    Raises:
+        ProductSearchError: If the shard got no fresh answer, so the merged results are partial
+    """
+    with app.app_context():
+        products, cache_key, entry = search_products(shard_params, force_reload=reload, priority=priority)
+        remembered = negative_cache.get(cache_key)
+        if not products and (remembered is None or remembered.outcome != EMPTY):
+            raise ProductSearchError(f"No answer for shard: {cache_key}")
+        if entry is not None and entry.expired:
+            raise ProductSearchError(f"Only expired results for shard: {cache_key}")
+        return products
+
+def prefetch_page(search_params):
+    """
+    Fetch and cache a page of a search ahead of the user, at prefetch priority.
+    
+    Args:
+        search_params (dict): The search, with the page to fetch
+        
+    Returns:
+        str: ALREADY_CACHED if the page was cached or known to be empty, SHED if the
+            API call was turned away by the rate limiter or circuit breaker, else FETCHED
+    """
+    cache_key, *legacy_keys = lookup_keys(search_params)
+    if get_cached_entry(cache_key, fallback_keys=legacy_keys) or negative_cache.get(cache_key):
+        return ALREADY_CACHED
+    logging.info(f"Prefetching page {search_params.get('page')} for: {cache_key}")
+    products, _, entry = search_products(search_params, priority=PRIORITY_PREFETCH)
+    # Nothing remembered about the search, and no results or only expired ones, means the API never answered
+    if negative_cache.get(cache_key) is None and (not products or (entry is not None and entry.expired)):
+        return SHED
+    return FETCHED
 
 # Routes
 @app.route("/", methods=["GET", "POST"])
@@ -166,50 +352,60 @@ def index():
     stores = "Amazon"
     country = "us"
     language = "en"
+    free_shipping = False
     products = []
     total_pages = 100
     
     # Cache key will be used for both server and client-side caching
     cache_key = None
+    # Cache entry the results came from, for the HTTP validators
+    entry = None
+    search_params = None
     
-    if request.method == "POST":
-        # Get form parameters
-        query = request.form.get("query", "")
-        page = int(request.form.get("page", 1))
-        sort_by = request.form.get("sort_by", "BEST_MATCH")
-        product_condition = request.form.get("product_condition", "NEW")
-        min_rating = request.form.get("min_rating", "ANY")
-        min_price = request.form.get("min_price", "0")
-        max_price = request.form.get("max_price", "1000000")
-        stores = request.form.get("stores", "Amazon")
-        country = request.form.get("country", "us")
-        language = request.form.get("language", "en")
+    if request.method == "POST" or "query" in request.args:
+        # Get search parameters - from the form, or from the URL it redirects to
+        values = request.form if request.method == "POST" else request.args
+        query = values.get("query", "")
+        page = values.get("page", 1, type=int)
+        sort_by = values.get("sort_by", "BEST_MATCH")
+        product_condition = values.get("product_condition", "NEW")
+        min_rating = values.get("min_rating", "ANY")
+        min_price = values.get("min_price", "0")
+        max_price = values.get("max_price", "1000000")
+        stores = values.get("stores", "Amazon")
+        country = values.get("country", "us")
+        language = values.get("language", "en")
+        free_shipping = values.get("free_shipping") in ("true", "True", "on")
         
-        # Generate cache key
-        cache_key = f"{query}_{page}_{sort_by}_{product_condition}_{min_rating}_{min_price}_{max_price}_{stores}_{country}_{language}"
+        search_params = {
+            "query": query,
+            "page": page,
+            "sort_by": sort_by,
+            "product_condition": product_condition,
+            "min_rating": min_rating,
+            "min_price": min_price,
+            "max_price": max_price,
+            "stores": stores,
+            "country": country,
+            "language": language,
+            "free_shipping": free_shipping
+        }
         
-        # Only if "apply_filters" is true or cache doesn't exist, call the API
-        if request.form.get("apply_filters") == "true" or request.form.get("force_reload") == "true":
-            logging.info(f"Applying filters or forced reload for: {cache_key}")
-            products = get_products(
-                query=query,
-                page=page,
-                sort_by=sort_by,
-                product_condition=product_condition,
-                min_rating=min_rating,
-                min_price=min_price,
-                max_price=max_price,
-                stores=stores,
-                country=country,
-                language=language
-            )
-            
-            # Cache the results
-            if products:
-                cache_results(cache_key, products)
+        if request.method == "POST":
+            force_reload = request.form.get("force_reload") == "true"
+            apply_filters = request.form.get("apply_filters") == "true"
+            if force_reload or apply_filters:
+                # Applied filters are worked out from the results on screen (refine_from,
+                # their URL's query string) when they only narrow or re-sort them
+                base_params = None
+                if apply_filters and request.form.get("refine_from"):
+                    base_params = dict(parse_qsl(request.form["refine_from"].lstrip("?")))
+                products, cache_key, entry = search_products(
+                    search_params, force_reload=force_reload, base_params=base_params
+                )
                 
                 # Save search to history if user is logged in
-                if current_user.is_authenticated:
+                if products and current_user.is_authenticated:
                     # Create parameters JSON string
                     parameters_json = json.dumps({
                         'sort_by': sort_by,
@@ -219,71 +415,135 @@ def index():
                         'max_price': max_price,
                         'stores': stores,
                         'country': country,
-                        'language': language
+                        'language': language,
+                        'free_shipping': free_shipping
                     })
                     
-                    # Try to save to Supabase first if available
-                    if supabase_client:
-                        saved = save_search(current_user.id, query, parameters_json)
-                        
-                    # Always save to SQLAlchemy for Flask app functionality
-                    try:
-                        new_search = SearchHistory(
-                            user_id=current_user.id,
-                            query=query,
-                            parameters=parameters_json,
-                            created_at=datetime.now()
-                        )
-                        db.session.add(new_search)
-                        db.session.commit()
-                    except Exception as e:
-                        db.session.rollback()
-                        logging.error(f"Error saving search history: {e}")
-        else:
-            # Try to get cached results
-            logging.info(f"Looking for cached results for: {cache_key}")
-            cached_data = get_cached_results(cache_key)
-            if cached_data:
-                products = cached_data
-                logging.info(f"Found cached results for: {cache_key}")
-            else:
-                # If cache miss, call the API
-                logging.info(f"Cache miss for: {cache_key}, calling API")
-                products = get_products(
-                    query=query,
-                    page=page,
-                    sort_by=sort_by,
-                    product_condition=product_condition,
-                    min_rating=min_rating,
-                    min_price=min_price,
-                    max_price=max_price,
-                    stores=stores,
-                    country=country,
-                    language=language
-                )
-                
-                # Cache the results
-                if products:
-                    cache_results(cache_key, products)
-    
-    return render_template(
-        "index.html",
-        products=products,
-        query=query,
-        page=page,
-        total_pages=total_pages,
-        sort_by=sort_by,
-        product_condition=product_condition,
-        min_rating=min_rating,
-        min_price=min_price,
-        max_price=max_price,
-        stores=stores,
-        country=country,
-        language=language,
-        countries=countries,
-        cache_key=cache_key
+                    # Save in the background so the page renders without waiting on the databases
+                    write_queue.submit("history", {
+                        'user_id': current_user.id,
+                        'query': query,
+                        'parameters': parameters_json,
+                        'created_at': datetime.now()
+                    })
+            
+            # Show the results at the search's canonical URL, which browsers and proxies can cache
+            return redirect(url_for("index", **canonical_query_args(search_params)), code=303)
+        
+        products, cache_key, entry = search_products(search_params)
+        
+        # Get the next pages ready in the background, for the queries worth it
+        if products and entry and not entry.expired:
+            prefetcher.after_serve(search_params, prefetch_page)
+    
+    # Expired results are only served while the API is down, and say so
+    stale_since = datetime.utcfromtimestamp(entry.created_at) if entry and entry.expired else None
+    
+    def render_page():
+        # Logged only when a body is served, so 304 revalidations don't count as searches
+        if search_params:
+            log_search(search_params)
+        return render_template(
+            "index.html",
+            products=products,
+            query=query,
+            page=page,
+            total_pages=total_pages,
+            sort_by=sort_by,
+            product_condition=product_condition,
+            min_rating=min_rating,
+            min_price=min_price,
+            max_price=max_price,
+            stores=stores,
+            country=country,
+            language=language,
+            free_shipping=free_shipping,
+            countries=countries,
+            cache_key=cache_key,
+            stale_since=stale_since
+        )
+    
+    # Flash messages are shown once, so a page carrying them is never cached
+    if session.get("_flashes"):
+        entry = None
+    
+    # The page also shows who is logged in and changes with the templates
+    templates_version = templates_modified_at(os.path.join(app.root_path, app.template_folder))
+    return conditional_response(
+        entry,
+        render_page,
+        variant=f"{current_user.get_id() or 'anonymous'}:{templates_version}",
+        last_modified=templates_version,
+        private=current_user.is_authenticated,
+        vary=("Cookie",)
     )
 
+@app.route("/api/search", methods=["GET"])
+def api_search():
+    """
+    Search as JSON, backed by the same cache and API calls as the search page.
+    
+    Query parameters are the search form's (query, sort_by, ..., language) plus
+    limit (1-100 products per page), fields (comma-separated product fields,
+    e.g. "product_title,offer.price") and cursor (next_cursor of a previous
+    response). Without a cursor the first page is returned.
+    """
+    args = request.args
+    query = args.get("query", "").strip()
+    if not query:
+        return jsonify({"error": "query is required"}), 400
+    
+    search_params = {
+        "query": query,
+        "sort_by": args.get("sort_by", "BEST_MATCH"),
+        "product_condition": args.get("product_condition", "NEW"),
+        "min_rating": args.get("min_rating", "ANY"),
+        "min_price": args.get("min_price", "0"),
+        "max_price": args.get("max_price", "1000000"),
+        "stores": args.get("stores", "Amazon"),
+        "country": args.get("country", "us"),
+        "language": args.get("language", "en")
+    }
+    
+    try:
+        fields = parse_fields(args.get("fields"))
+        if args.get("cursor"):
+            # The cursor fixes the page size, so later pages line up with earlier ones
+            page, limit = decode_cursor(args["cursor"], search_params)
+        else:
+            page, limit = 1, parse_limit(args.get("limit"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    products, cache_key, entry = search_products({**search_params, "page": page, "limit": limit})
+    products = (products or [])[:limit]
+    if products and entry and not entry.expired:
+        prefetcher.after_serve({**search_params, "page": page, "limit": limit}, prefetch_page)
+    
+    # A full page means the next one may have results too
+    next_cursor = None
+    if len(products) >= limit and page < MAX_PAGE:
+        next_cursor = encode_cursor(search_params, page + 1, limit)
+    
+    def render_response():
+        # Logged only when a body is served, so 304 revalidations don't count as searches
+        log_search({**search_params, "page": page, "limit": limit})
+        return jsonify({
+            "query": query,
+            "page": page,
+            "limit": limit,
+            "count": len(products),
+            "products": [project_product(product, fields) for product in serialize_products(products)],
+            "next_cursor": next_cursor,
+            "stale": bool(entry and entry.expired)
+        })
+    
+    # The body depends only on the URL and the cache entry, so shared caches may keep it. The
+    # ETag covers everything in the body that doesn't come from the entry: searches differing
+    # only in spelling, projection, page size or cursor share an entry, not a representation
+    variant = json.dumps(["api", query, page, limit, fields, next_cursor])
+    return conditional_response(entry, render_response, variant=variant)
+
 @app.route("/register", methods=["GET", "POST"])
 def register():
     if current_user.is_authenticated:
@@ -293,71 +553,28 @@ def register():
     if form.validate_on_submit():
         username = form.username.data
         email = form.email.data
+        storage = get_storage()
         
-        # Check if Supabase client is available
-        if supabase_client:
-            # Check if username or email already exists in Supabase
-            existing_user = get_user_by_username(username)
-            existing_email = get_user_by_email(email)
-            
-            if existing_user:
-                flash('Username already exists. Please choose another one.', 'danger')
-            elif existing_email:
-                flash('Email already registered. Please use another one.', 'danger')
-            else:
-                # Create new user in Supabase
+        # Check if username or email already exists, in one lookup
+        existing_user, existing_email = storage.find_existing_user(username, email)
+        
+        if existing_user:
+            flash('Username already exists. Please choose another one.', 'danger')
+        elif existing_email:
+            flash('Email already registered. Please use another one.', 'danger')
+        else:
+            # Create new user with error handling
+            try:
                 hashed_password = generate_password_hash(form.password.data)
-                supabase_user = create_user(username, email, hashed_password)
+                user = storage.create_user(username, email, hashed_password)
+                invalidate_user(user['id'], username, email)
                 
-                if supabase_user:
-                    # Also create user in SQLAlchemy for Flask-Login with error handling
-                    try:
-                        user = User(
-                            username=username,
-                            email=email,
-                            password_hash=hashed_password
-                        )
-                        db.session.add(user)
-                        db.session.commit()
-                        
-                        flash('Your account has been created! You can now log in.', 'success')
-                        return redirect(url_for('login'))
-                    except Exception as e:
-                        db.session.rollback()
-                        logging.error(f"Error creating user in database: {e}")
-                        flash('There was an error creating your account. Please try again.', 'danger')
-                        return redirect(url_for('register'))
-                else:
-                    flash('Error creating user in Supabase.', 'danger')
-        else:
-            # Fall back to SQLAlchemy if Supabase client is not available
-            # Check if username or email already exists using Supabase-compatible session queries
-            existing_user = db.session.query(User).filter(User.username == username).first()
-            existing_email = db.session.query(User).filter(User.email == email).first()
-            
-            if existing_user:
-                flash('Username already exists. Please choose another one.', 'danger')
-            elif existing_email:
-                flash('Email already registered. Please use another one.', 'danger')
-            else:
-                # Create new user with error handling
-                try:
-                    hashed_password = generate_password_hash(form.password.data)
-                    user = User(
-                        username=username,
-                        email=email,
-                        password_hash=hashed_password
-                    )
-                    db.session.add(user)
-                    db.session.commit()
-                    
-                    flash('Your account has been created! You can now log in.', 'success')
-                    return redirect(url_for('login'))
-                except Exception as e:
-                    db.session.rollback()
-                    logging.error(f"Error creating user in database: {e}")
-                    flash('There was an error creating your account. Please try again.', 'danger')
-                    return redirect(url_for('register'))
+                flash('Your account has been created! You can now log in.', 'success')
+                return redirect(url_for('login'))
+            except Exception as e:
+                logging.error(f"Error creating user: {e}")
+                flash('There was an error creating your account. Please try again.', 'danger')
+                return redirect(url_for('register'))
             
     return render_template('register.html', form=form, title='Register')
 
@@ -371,57 +588,20 @@ def login():
         email = form.email.data
         password = form.password.data
         
-        # Check if Supabase client is available
-        if supabase_client:
-            # Get user from Supabase
-            supabase_user = get_user_by_email(email)
-            
-            if supabase_user and check_password_hash(supabase_user['password_hash'], password):
-                # Get the corresponding SQLAlchemy user for Flask-Login
-                user = db.session.query(User).filter(User.email == email).first()
-                
-                if not user:
-                    # If user exists in Supabase but not in SQLAlchemy, create it with error handling
-                    try:
-                        user = User(
-                            username=supabase_user['username'],
-                            email=supabase_user['email'],
-                            password_hash=supabase_user['password_hash']
-                        )
-                        db.session.add(user)
-                        db.session.commit()
-                        logging.info(f"Created SQLAlchemy user from Supabase data: {email}")
-                    except Exception as e:
-                        db.session.rollback()
-                        logging.error(f"Error creating SQLAlchemy user from Supabase data: {e}")
-                        flash('Error logging in. Please try again later.', 'danger')
-                        return redirect(url_for('login'))
-                
-                login_user(user, remember=form.remember.data)
-                next_page = request.args.get('next')
-                flash('Login successful!', 'success')
-                return redirect(next_page) if next_page else redirect(url_for('index'))
-            else:
-                # Fall back to SQLAlchemy check
-                user = db.session.query(User).filter(User.email == email).first()
-                if user and check_password_hash(user.password_hash, password):
-                    login_user(user, remember=form.remember.data)
-                    next_page = request.args.get('next')
-                    flash('Login successful!', 'success')
-                    return redirect(next_page) if next_page else redirect(url_for('index'))
-                else:
-                    flash('Login failed. Please check your email and password.', 'danger')
+        try:
+            user = get_storage().get_user_by_email(email)
+        except Exception as e:
+            logging.error(f"Error fetching user for login: {e}")
+            flash('Error logging in. Please try again later.', 'danger')
+            return redirect(url_for('login'))
+        
+        if user and check_password_hash(user['password_hash'], password):
+            login_user(SessionUser.from_dict(user), remember=form.remember.data)
+            next_page = request.args.get('next')
+            flash('Login successful!', 'success')
+            return redirect(next_page) if next_page else redirect(url_for('index'))
         else:
-            # Fall back to SQLAlchemy only if Supabase client is not available
-            user = db.session.query(User).filter(User.email == email).first()
-            
-            if user and check_password_hash(user.password_hash, password):
-                login_user(user, remember=form.remember.data)
-                next_page = request.args.get('next')
-                flash('Login successful!', 'success')
-                return redirect(next_page) if next_page else redirect(url_for('index'))
-            else:
-                flash('Login failed. Please check your email and password.', 'danger')
+            flash('Login failed. Please check your email and password.', 'danger')
             
     return render_template('login.html', form=form, title='Login')
 
@@ -435,31 +615,11 @@ def logout():
 @login_required
 def account():
     # Get user's search history
-    if supabase_client:
-        # Try to get search history from Supabase
-        search_history_list = get_search_history(current_user.id)
-        
-        if search_history_list:
-            # Convert to SearchHistory objects for template compatibility
-            search_history = []
-            for item in search_history_list:
-                history_obj = SearchHistory()
-                history_obj.id = item.get('id')
-                history_obj.user_id = item.get('user_id')
-                history_obj.query = item.get('query')
-                history_obj.parameters = item.get('parameters')
-                history_obj.created_at = datetime.fromisoformat(item.get('created_at')) if item.get('created_at') else datetime.now()
-                search_history.append(history_obj)
-        else:
-            # Fall back to SQLAlchemy
-            search_history = db.session.query(SearchHistory).filter(
-                SearchHistory.user_id == current_user.id
-            ).order_by(SearchHistory.created_at.desc()).limit(10).all()
-    else:
-        # Use SQLAlchemy directly if Supabase is not available
-        search_history = db.session.query(SearchHistory).filter(
-            SearchHistory.user_id == current_user.id
-        ).order_by(SearchHistory.created_at.desc()).limit(10).all()
+    try:
+        search_history = get_storage().get_search_history(current_user.id)
+    except Exception as e:
+        logging.error(f"Error fetching search history: {e}")
+        search_history = []
         
     return render_template('account.html', title='Account', search_history=search_history)
 
@@ -488,7 +648,7 @@ def faq():
 @login_required
 def clear_cache():
     """Admin endpoint to manually clear expired cache"""
-    from cache_manager import clear_old_cache
+    from cache_manager import purge_expired_cache
     
     if not current_user.is_authenticated:
         flash('You must be logged in to perform this action.', 'danger')
@@ -496,9 +656,10 @@ def clear_cache():
         
     # Run the cache cleanup
     try:
-        result = clear_old_cache()
-        if result:
-            flash('Cache cleared successfully!', 'success')
+        stats = purge_expired_cache()
+        if stats['ok']:
+            flash(f"Cache cleared successfully! Removed {stats['rows']} entries "
+                  f"({stats['bytes'] / 1024:.0f} KB).", 'success')
         else:
             flash('Failed to clear cache.', 'danger')
     except Exception as e:
@@ -506,6 +667,105 @@ def clear_cache():
         
     return redirect(url_for('account'))
 
+@app.route("/admin/cache-stats", methods=["GET"])
+@login_required
+def cache_stats():
+    """Admin endpoint reporting in-process cache and request coalescing counters"""
+    return jsonify({
+        "memory_cache": l1_cache.stats(),
+        "refined_cache": refined_cache.stats(),
+        "negative_cache": negative_cache.stats(),
+        "user_cache": user_cache.stats(),
+        "coalescing": search_flight.stats(),
+        "background_refresh": refresh_scheduler.stats(),
+        "write_behind": write_queue.stats(),
+        "product_index": product_index.stats(),
+        "rate_limit": rate_limiter.stats(),
+        "circuit_breakers": breaker_stats(),
+        "prefetch": prefetcher.stats(),
+        "maintenance": {
+            "is_leader": maintenance_scheduler.is_leader,
+            "jobs": maintenance_scheduler.status()
+        }
+    })
+
+@app.cli.command("init-db")
+def init_db_command():
+    """Create missing database tables, migrate existing ones and check the Supabase tables"""
+    from supabase_client import check_supabase_tables
+    from migrations import migrate_cache_payload
+    
+    logging.info("Attempting to create database tables...")
+    db.create_all()
+    print("Database tables created successfully")
+    
+    # create_all leaves existing tables alone, and deploys only run init-db
+    converted = migrate_cache_payload()
+    print(f"Converted {converted} cached searches")
+    
+    if get_supabase_client():
+        if check_supabase_tables():
+            print("Supabase tables found")
+        else:
+            print("One or more Supabase tables are missing, see the log for details")
+
+@app.cli.command("migrate-cache-payload")
+def migrate_cache_payload_command():
+    """Convert cached search results to the compressed binary payload column"""
+    from migrations import migrate_cache_payload
+    
+    converted = migrate_cache_payload()
+    print(f"Converted {converted} cached searches")
+
+@app.cli.command("create-indexes")
+def create_indexes_command():
+    """Add the cache expiry and search history indexes to existing tables"""
+    from migrations import create_indexes
+    
+    for name in create_indexes():
+        print(f"Index ready: {name}")
+
+@app.cli.command("partition-cache")
+def partition_cache_command():
+    """Convert the cache table to daily partitions by expiry (Postgres only)"""
+    from migrations import partition_cache_table, ensure_cache_partitions
+    
+    if partition_cache_table():
+        print("Converted cached_search to a partitioned table")
+    else:
+        print(f"Created {ensure_cache_partitions()} new cache partitions")
+
+@app.cli.command("run-maintenance")
+def run_maintenance_command():
+    """Run any due maintenance jobs once, if no other worker holds the leader lease"""
+    ran = maintenance_scheduler.run_once()
+    maintenance_scheduler.stop()  # Hand the leader lease back to the workers
+    print(f"Ran maintenance jobs: {', '.join(ran) or 'none'}")
+
+@app.cli.command("warm-cache")
+@click.option("--top", type=int, default=None, help="Number of most searched searches to warm")
+@click.option("--hours", type=float, default=None, help="Search log window, in hours")
+@click.option("--workers", type=int, default=None, help="Searches fetched at once")
+@click.option("--dry-run", is_flag=True, help="Only list the searches that would be warmed")
+def warm_cache_command(top, hours, workers, dry_run):
+    """Fill the cache with the most searched searches of the search log"""
+    from warmup import WARMUP_TOP_K, WARMUP_WINDOW_HOURS, WARMUP_WORKERS, top_searches, warm_cache
+    
+    top = top or WARMUP_TOP_K
+    hours = hours or WARMUP_WINDOW_HOURS
+    if dry_run:
+        for search in top_searches(top, hours):
+            print(f"{search.searches:>6}  {search.params['query']}  {search.cache_key}")
+    
+    summary = warm_cache(top, hours, workers=workers or WARMUP_WORKERS, dry_run=dry_run)
+    if not dry_run:
+        print(f"Warmed {summary['warmed']} of {summary['searches']} searches, {summary['already_warm']} already warm, "
+              f"{summary['empty']} empty or failed, {summary['skipped']} skipped in {summary['seconds']}s")
+    coverage = summary["coverage"]
+    if coverage["coverage"] is not None:
+        print(f"Coverage: {coverage['covered']} of the {coverage['searches']} searches in the hour after "
+              f"{coverage['window_start']} were for warmed searches ({coverage['coverage']:.1%})")
+
 # Run the app
 if __name__ == "__main__":
     with app.app_context():
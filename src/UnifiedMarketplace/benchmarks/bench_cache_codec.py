@@ -0,0 +1,95 @@
+"""
+Encode/decode time and stored size of each cache payload codec.
+
+Builds realistic RapidAPI search results (50 products with photos, offers,
+attributes and descriptions) and reports, per codec, the stored bytes and
+the mean encode and decode time, for both the raw API dictionaries and the
+compact Product form. Codecs whose optional package (zstandard, msgpack) is
+not installed are skipped.
+
+Usage:
+    python benchmarks/bench_cache_codec.py [iterations]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cache_codec  # noqa: E402
+from product_model import normalize_products, serialize_products  # noqa: E402
+
+WORDS = ("wireless noise cancelling bluetooth headphones over ear battery life hours "
+         "premium sound quality comfortable memory foam foldable travel case black "
+         "microphone fast charging compatible with iphone android laptop").split()
+STORES = ["Amazon", "Walmart", "Best Buy", "Target", "eBay", "Newegg"]
+
+
+def sentence(rng, length):
+    return " ".join(rng.choice(WORDS) for _ in range(length)).capitalize()
+
+
+def make_product(rng, index):
+    """Build one product shaped like the RapidAPI search response"""
+    store = rng.choice(STORES)
+    product_id = f"{rng.getrandbits(60):x}"
+    return {
+        "product_id": product_id,
+        "product_title": sentence(rng, 12),
+        "product_description": sentence(rng, 80),
+        "product_photos": [f"https://cdn.example.com/images/{product_id}/{i}.jpg" for i in range(rng.randint(3, 8))],
+        "product_attributes": {"Color": rng.choice(["Black", "White", "Blue"]), "Connectivity": "Bluetooth 5.3"},
+        "product_rating": round(rng.uniform(3, 5), 1),
+        "product_page_url": f"https://www.google.com/shopping/product/{product_id}",
+        "product_offers_page_url": f"https://www.google.com/shopping/product/{product_id}/offers",
+        "product_num_reviews": rng.randint(0, 50000),
+        "product_num_offers": str(rng.randint(1, 30)),
+        "typical_price_range": [f"${rng.randint(20, 80)}", f"${rng.randint(80, 300)}"],
+        "offer": {
+            "offer_id": f"{rng.getrandbits(64):x}",
+            "offer_title": sentence(rng, 10),
+            "offer_page_url": f"https://www.{store.lower().replace(' ', '')}.com/dp/{product_id}?ref=shopping&idx={index}",
+            "price": f"${rng.uniform(10, 400):.2f}",
+            "shipping": rng.choice(["Free delivery", "$5.99 delivery", None]),
+            "on_sale": rng.random() < 0.3,
+            "original_price": None,
+            "product_condition": "NEW",
+            "store_name": store,
+            "store_rating": round(rng.uniform(3.5, 5), 1),
+            "store_review_count": rng.randint(100, 100000),
+            "store_favicon": f"https://encrypted-tbn0.gstatic.com/favicon?{store.lower().replace(' ', '')}",
+            "payment_methods": "PayPal, Visa, Mastercard"
+        }
+    }
+
+
+def mean_seconds(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    rng = random.Random(7)
+    raw_products = [make_product(rng, i) for i in range(50)]
+    compact_products = serialize_products(normalize_products(raw_products, full=False))
+    
+    print(f"{'form':<8} {'codec':<14} {'bytes':>9} {'ratio':>7} {'encode ms':>10} {'decode ms':>10}")
+    baseline = None
+    for form, products in (("raw", raw_products), ("compact", compact_products)):
+        for codec in cache_codec.available_codecs():
+            payload = cache_codec.encode(products, codec)
+            assert cache_codec.decode(payload) == products
+            
+            size = len(payload)
+            baseline = baseline or size
+            encode_ms = mean_seconds(lambda: cache_codec.encode(products, codec), iterations) * 1000
+            decode_ms = mean_seconds(lambda: cache_codec.decode(payload), iterations) * 1000
+            print(f"{form:<8} {codec:<14} {size:>9} {size / baseline:>7.2f} {encode_ms:>10.3f} {decode_ms:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
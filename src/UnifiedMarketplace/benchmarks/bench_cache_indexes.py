@@ -0,0 +1,148 @@
+"""
+Query and purge times on CachedSearch/SearchHistory before and after indexes.
+
+Seeds a local database (SQLite by default, or BENCH_DATABASE_URL, e.g. a
+local Postgres) with cache and search history rows, times the purge
+candidate scan, a chunked purge and the /account history query, then runs
+migrations.create_indexes and times them again.
+
+Usage:
+    python benchmarks/bench_cache_indexes.py [rows]
+    BENCH_DATABASE_URL=postgresql://localhost/bench python benchmarks/bench_cache_indexes.py 1000000
+"""
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import (Column, DateTime, Integer, LargeBinary, MetaData, String, Table, Text,
+                        create_engine, text)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from migrations import create_indexes  # noqa: E402
+
+CHUNK_SIZE = 1000
+PURGE_CHUNKS = 5
+ACCOUNT_LOOKUPS = 200
+USERS = 5000
+
+metadata = MetaData()
+cached_search = Table(
+    "cached_search", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("cache_key", String(512), unique=True, nullable=False),
+    Column("results", Text),
+    Column("payload", LargeBinary),
+    Column("created_at", DateTime),
+    Column("expires_at", DateTime, nullable=False)
+)
+search_history = Table(
+    "search_history", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("user_id", Integer, nullable=False),
+    Column("query", String(255), nullable=False),
+    Column("parameters", Text),
+    Column("created_at", DateTime)
+)
+
+
+def seed(engine, rows):
+    """Insert rows cache entries (a third of them expired) and rows history entries"""
+    rng = random.Random(1)
+    now = datetime.utcnow()
+    payload = bytes(rng.getrandbits(8) for _ in range(200))
+    batch = 10000
+    with engine.begin() as connection:
+        for start in range(0, rows, batch):
+            end = min(start + batch, rows)
+            connection.execute(cached_search.insert(), [
+                {"cache_key": f"v2:{i:032x}", "payload": payload,
+                 "created_at": now - timedelta(hours=rng.uniform(0, 48)),
+                 "expires_at": now + timedelta(hours=rng.uniform(-24, 48))}
+                for i in range(start, end)
+            ])
+            connection.execute(search_history.insert(), [
+                {"user_id": rng.randrange(USERS), "query": f"query {i % 997}", "parameters": "{}",
+                 "created_at": now - timedelta(minutes=rng.uniform(0, 60 * 24 * 90))}
+                for i in range(start, end)
+            ])
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return (time.perf_counter() - start) * 1000
+
+
+def measure(engine, label):
+    now = datetime.utcnow()
+    rng = random.Random(2)
+    
+    with engine.connect() as connection:
+        scan_ms = timed(lambda: connection.execute(text(
+            "SELECT id FROM cached_search WHERE expires_at < :now ORDER BY id LIMIT :limit"
+        ), {"now": now, "limit": CHUNK_SIZE}).all())
+        
+        count_ms = timed(lambda: connection.execute(text(
+            "SELECT COUNT(*) FROM cached_search WHERE expires_at < :now"
+        ), {"now": now}).scalar())
+        
+        users = [rng.randrange(USERS) for _ in range(ACCOUNT_LOOKUPS)]
+        account_ms = timed(lambda: [connection.execute(text(
+            "SELECT id, query, parameters, created_at FROM search_history "
+            "WHERE user_id = :user_id ORDER BY created_at DESC LIMIT 10"
+        ), {"user_id": user}).all() for user in users]) / ACCOUNT_LOOKUPS
+    
+    def purge():
+        # Same pattern as cache_manager.purge_expired_cache
+        last_id = 0
+        for _ in range(PURGE_CHUNKS):
+            with engine.begin() as connection:
+                ids = connection.execute(text(
+                    "SELECT id FROM cached_search WHERE expires_at < :now AND id > :last_id "
+                    "ORDER BY id LIMIT :limit"
+                ), {"now": now, "last_id": last_id, "limit": CHUNK_SIZE}).scalars().all()
+                if not ids:
+                    return
+                connection.execute(text(
+                    "DELETE FROM cached_search WHERE id >= :first AND id <= :last AND expires_at < :now"
+                ), {"first": ids[0], "last": ids[-1], "now": now})
+                last_id = ids[-1]
+    
+    purge_ms = timed(purge) / PURGE_CHUNKS
+    
+    print(f"{label:<16} {scan_ms:>12.2f} {count_ms:>12.2f} {purge_ms:>14.2f} {account_ms:>13.3f}")
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    
+    url = os.environ.get("BENCH_DATABASE_URL")
+    tmpdir = None
+    if not url:
+        tmpdir = tempfile.TemporaryDirectory()
+        url = f"sqlite:///{tmpdir.name}/bench.db"
+    engine = create_engine(url)
+    
+    metadata.drop_all(engine)
+    metadata.create_all(engine)
+    
+    print(f"Seeding {rows} cache and history rows into {engine.dialect.name}...")
+    print(f"Seeded in {timed(lambda: seed(engine, rows)) / 1000:.1f}s")
+    
+    print(f"{'':<16} {'scan ms':>12} {'count ms':>12} {'purge ms/chunk':>14} {'account ms':>13}")
+    measure(engine, "before indexes")
+    create_indexes(engine)
+    measure(engine, "after indexes")
+    
+    metadata.drop_all(engine)
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
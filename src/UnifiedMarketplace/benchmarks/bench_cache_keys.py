@@ -0,0 +1,62 @@
+"""
+Cache hit rate of the legacy f-string keys vs canonical v2 keys.
+
+Replays a synthetic stream of searches where users submit the same handful
+of queries with the small variations seen in practice (case, extra spaces,
+"0" vs "0.00" prices, store order, uk vs gb) and counts how many would be
+served from a cache that already holds every earlier key.
+
+Usage:
+    python benchmarks/bench_cache_keys.py [searches]
+"""
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cache_keys import legacy_cache_key, make_cache_key  # noqa: E402
+
+QUERIES = ["iphone 15", "gaming laptop", "running shoes", "air fryer", "4k tv",
+           "wireless earbuds", "office chair", "coffee maker"]
+STORES = [["Amazon"], ["Amazon", "Walmart"], ["Best Buy", "Amazon", "Walmart"]]
+
+
+def vary(rng, query):
+    """Build a form submission for query with realistic cosmetic variations"""
+    stores = list(rng.choice(STORES))
+    rng.shuffle(stores)
+    return {
+        "query": rng.choice([query, query.title(), query.upper(), f" {query} ", query.replace(" ", "  ")]),
+        "page": 1,
+        "min_price": rng.choice(["0", "0.00", ""]) or "0",
+        "max_price": rng.choice(["1000000", "1000000.00"]),
+        "stores": rng.choice([",", ", "]).join(stores),
+        "country": rng.choice(["us", "us", "uk", "gb"])
+    }
+
+
+def hit_rate(keys):
+    seen = set()
+    hits = 0
+    for key in keys:
+        if key in seen:
+            hits += 1
+        seen.add(key)
+    return hits / len(keys)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    rng = random.Random(42)
+    searches = [vary(rng, rng.choice(QUERIES)) for _ in range(count)]
+    
+    legacy = hit_rate([legacy_cache_key(params) for params in searches])
+    canonical = hit_rate([make_cache_key(params) for params in searches])
+    
+    print(f"{'legacy keys':<16} {legacy * 100:6.2f}% hit rate")
+    print(f"{'canonical keys':<16} {canonical * 100:6.2f}% hit rate")
+
+
+if __name__ == "__main__":
+    main()
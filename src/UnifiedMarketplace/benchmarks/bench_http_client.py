@@ -0,0 +1,80 @@
+"""
+Micro-benchmark: bare requests.get vs the pooled ProductSearchClient.
+
+Starts a local keep-alive HTTP server that returns a canned product search
+response, then times N sequential searches with each approach. The local
+server has no TLS, so the real saving against RapidAPI (TCP + TLS handshake
+per call) is larger than what is reported here.
+
+Usage:
+    python benchmarks/bench_http_client.py [requests]
+"""
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api_manager import ProductSearchClient  # noqa: E402
+
+PAYLOAD = json.dumps({
+    "status": "OK",
+    "data": {"products": [{"product_id": str(i), "product_title": f"Product {i}"} for i in range(50)]}
+}).encode()
+
+
+class SearchHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep connections open between requests
+    disable_nagle_algorithm = True  # Avoid delayed-ACK stalls on reused connections
+    
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(PAYLOAD)))
+        self.end_headers()
+        self.wfile.write(PAYLOAD)
+    
+    def log_message(self, format, *args):
+        pass
+
+
+def time_calls(label, call, count):
+    """Run call() count times and print per-request latency"""
+    start = time.perf_counter()
+    for _ in range(count):
+        call()
+    elapsed = time.perf_counter() - start
+    per_request_ms = elapsed / count * 1000
+    print(f"{label:<28} {per_request_ms:8.3f} ms/request")
+    return per_request_ms
+
+
+def main():
+    logging.disable(logging.CRITICAL)  # Keep per-request debug logs out of the timings
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SearchHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/search"
+    params = {"q": "laptop", "page": 1}
+    
+    client = ProductSearchClient(api_url=url, headers={})
+    
+    try:
+        bare = time_calls("requests.get (no pool)", lambda: requests.get(url, params=params).json(), count)
+        pooled = time_calls("ProductSearchClient", lambda: client.search(params), count)
+    finally:
+        client.close()
+        server.shutdown()
+    
+    print(f"{'saved per request':<28} {bare - pooled:8.3f} ms ({(1 - pooled / bare) * 100:.1f}%)")
+
+
+if __name__ == "__main__":
+    main()
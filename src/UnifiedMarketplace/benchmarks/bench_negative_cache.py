@@ -0,0 +1,128 @@
+"""
+Upstream calls saved by negative caching, against a stubbed search API.
+
+Replays a stream of search page requests through the app's test client.
+Popular queries return products, typo and bot queries return nothing, and
+a share of queries hit an upstream that keeps failing. The stub stands in
+for RapidAPI and counts the calls it receives. The same stream runs with
+negative caching disabled and with the configured TTLs, and reports
+upstream calls per outcome plus the negative cache's own counters.
+
+Usage:
+    python benchmarks/bench_negative_cache.py [searches] [--empty-share F] [--error-share F]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Keep the run self-contained: a throwaway database, no index on disk, inline writes
+_tmpdir = tempfile.mkdtemp()
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_tmpdir}/bench.db")
+os.environ["PRODUCT_INDEX_ENABLED"] = "false"
+os.environ["WRITE_BEHIND_WORKERS"] = "0"
+os.environ["RATE_LIMIT_MODE"] = "off"
+
+import logging  # noqa: E402
+logging.disable(logging.CRITICAL)
+
+# SQLite doesn't take the psycopg2 connect arguments
+import flask_sqlalchemy.extension as extension  # noqa: E402
+_make_engine = extension.SQLAlchemy._make_engine
+
+def _sqlite_engine(self, bind_key, options, app):
+    for option in ("connect_args", "pool_size", "max_overflow"):
+        options.pop(option, None)
+    return _make_engine(self, bind_key, options, app)
+
+extension.SQLAlchemy._make_engine = _sqlite_engine
+
+import api_manager  # noqa: E402
+from product_model import normalize_products  # noqa: E402
+
+
+class StubUpstream:
+    """Answers like the search API: products, nothing, or an error, decided by the query"""
+
+    def __init__(self):
+        self.calls = Counter()
+
+    def search(self, params, **kwargs):
+        query = params["q"]
+        if query.startswith("broken"):
+            self.calls["error"] += 1
+            raise api_manager.ProductSearchError("Product search API returned status 503")
+        if query.startswith("typo"):
+            self.calls["empty"] += 1
+            return []
+        self.calls["products"] += 1
+        return normalize_products([
+            {"product_id": f"{query}-{index}", "product_title": f"{query} {index}",
+             "offer": {"price": f"${index + 1}.99", "store_name": "Amazon"}}
+            for index in range(10)
+        ])
+
+
+def make_stream(rng, searches, empty_share, error_share):
+    """Queries by kind: a few popular ones, a larger pool of typos, some that fail"""
+    stream = []
+    for _ in range(searches):
+        roll = rng.random()
+        if roll < error_share:
+            stream.append(f"broken {rng.randint(0, 20)}")
+        elif roll < error_share + empty_share:
+            stream.append(f"typo {int(rng.paretovariate(1.2))}")
+        else:
+            stream.append(f"item {int(rng.paretovariate(1.5))}")
+    return stream
+
+
+def run(app_module, stream, enabled):
+    from cache_manager import EMPTY, ERROR, NegativeCache, NEGATIVE_CACHE_EMPTY_TTL, NEGATIVE_CACHE_ERROR_TTL
+    from storage import InMemoryBackend, ReplicatedStorage, set_storage
+    import cache_manager
+
+    # Fresh caches for each run
+    set_storage(ReplicatedStorage(InMemoryBackend()))
+    app_module.l1_cache.clear()
+    negative_cache = NegativeCache(empty_ttl=NEGATIVE_CACHE_EMPTY_TTL if enabled else 0,
+                                   error_ttl=NEGATIVE_CACHE_ERROR_TTL if enabled else 0)
+    cache_manager.negative_cache = app_module.negative_cache = negative_cache
+
+    upstream = StubUpstream()
+    api_manager.get_client = lambda: upstream
+    client = app_module.app.test_client()
+    for query in stream:
+        client.get("/", query_string={"query": query})
+
+    stats = negative_cache.stats()
+    return upstream.calls, {EMPTY: stats["hits"][EMPTY], ERROR: stats["hits"][ERROR]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("searches", nargs="?", type=int, default=2000)
+    parser.add_argument("--empty-share", type=float, default=0.3, help="Share of searches with no results")
+    parser.add_argument("--error-share", type=float, default=0.1, help="Share of searches the upstream fails")
+    args = parser.parse_args()
+
+    import app as app_module
+    with app_module.app.app_context():
+        app_module.db.create_all()
+
+    stream = make_stream(random.Random(3), args.searches, args.empty_share, args.error_share)
+    print(f"{len(stream)} searches, {len(set(stream))} distinct queries")
+    print(f"{'negative cache':>14} {'upstream calls':>14} {'products':>9} {'empty':>6} {'error':>6} "
+          f"{'empty hits':>10} {'error hits':>10}")
+    for enabled in (False, True):
+        calls, hits = run(app_module, stream, enabled)
+        print(f"{'on' if enabled else 'off':>14} {sum(calls.values()):>14} {calls['products']:>9} "
+              f"{calls['empty']:>6} {calls['error']:>6} {hits['empty']:>10} {hits['error']:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Sequential paging latency with next-page prefetching, against a stubbed search API.
+
+Simulates users paging through search results: each session opens page 1
+of a query and clicks "next" a few times, with a think time between pages.
+The stub stands in for RapidAPI with a fixed latency per call. The same
+sessions run with prefetching disabled and enabled, and the report shows
+page load times for page 1 and for later pages, plus the upstream calls
+made and the prefetcher's counters.
+
+Usage:
+    python benchmarks/bench_prefetch.py [sessions] [--latency S] [--think S] [--pages N]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Keep the run self-contained: a throwaway database, no index on disk, inline writes
+_tmpdir = tempfile.mkdtemp()
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_tmpdir}/bench.db")
+os.environ["PRODUCT_INDEX_ENABLED"] = "false"
+os.environ["WRITE_BEHIND_WORKERS"] = "0"
+os.environ["RATE_LIMIT_MODE"] = "off"
+
+import logging  # noqa: E402
+logging.disable(logging.CRITICAL)
+
+# SQLite doesn't take the psycopg2 connect arguments
+import flask_sqlalchemy.extension as extension  # noqa: E402
+_make_engine = extension.SQLAlchemy._make_engine
+
+def _sqlite_engine(self, bind_key, options, app):
+    for option in ("connect_args", "pool_size", "max_overflow"):
+        options.pop(option, None)
+    return _make_engine(self, bind_key, options, app)
+
+extension.SQLAlchemy._make_engine = _sqlite_engine
+
+import api_manager  # noqa: E402
+from product_model import normalize_products  # noqa: E402
+
+
+class StubUpstream:
+    """Answers every search with a page of products after a fixed delay"""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+
+    def search(self, params, **kwargs):
+        self.calls += 1
+        time.sleep(self.latency)
+        return normalize_products([
+            {"product_id": f"{params['q']}-{params['page']}-{index}", "product_title": f"{params['q']} {index}",
+             "offer": {"price": f"${index + 1}.99", "store_name": "Amazon"}}
+            for index in range(20)
+        ])
+
+
+def run(app_module, sessions, args, enabled):
+    from storage import InMemoryBackend, ReplicatedStorage, set_storage
+    from prefetcher import Prefetcher
+    import prefetcher as prefetcher_module
+
+    # Fresh caches and prefetcher for each run
+    set_storage(ReplicatedStorage(InMemoryBackend()))
+    app_module.l1_cache.clear()
+    prefetcher = Prefetcher(enabled=enabled)
+    prefetcher._popular_loaded_at = time.monotonic()  # No search log in this run
+    prefetcher_module.prefetcher = app_module.prefetcher = prefetcher
+
+    upstream = StubUpstream(args.latency)
+    api_manager.get_client = lambda: upstream
+    client = app_module.app.test_client()
+
+    first, later = [], []
+    for query in sessions:
+        for page in range(1, args.pages + 1):
+            start = time.perf_counter()
+            client.get("/", query_string={"query": query, "page": page})
+            (first if page == 1 else later).append(time.perf_counter() - start)
+            time.sleep(args.think)
+    prefetcher.shutdown()
+    return first, later, upstream.calls, prefetcher.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("sessions", nargs="?", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.3, help="Seconds per stubbed API call")
+    parser.add_argument("--think", type=float, default=0.5, help="Seconds between page clicks")
+    parser.add_argument("--pages", type=int, default=4, help="Pages viewed per session")
+    args = parser.parse_args()
+
+    import app as app_module
+    with app_module.app.app_context():
+        app_module.db.create_all()
+
+    rng = random.Random(5)
+    sessions = [f"query {rng.randint(0, args.sessions)}" for _ in range(args.sessions)]
+    print(f"{len(sessions)} sessions of {args.pages} pages, {args.latency * 1000:.0f} ms per API call")
+    print(f"{'prefetch':>8} {'page 1 median ms':>16} {'later median ms':>15} {'later p95 ms':>12} "
+          f"{'API calls':>9} {'prefetched':>10}")
+    for enabled in (False, True):
+        first, later, calls, stats = run(app_module, sessions, args, enabled)
+        later.sort()
+        print(f"{'on' if enabled else 'off':>8} {statistics.median(first) * 1000:>16.0f} "
+              f"{statistics.median(later) * 1000:>15.0f} {later[int(len(later) * 0.95)] * 1000:>12.0f} "
+              f"{calls:>9} {stats['fetched']:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+Recall and latency of the local product index against upstream results.
+
+Synthetic mode (the default) stands in for RapidAPI with a catalog of
+products and an upstream ranking that the index never sees. A stream of
+Zipf-distributed searches is split in time: the first part feeds the index
+the way cached API results do, the rest is answered both upstream and from
+the index. Reports coverage (searches the index could answer with a full
+page), recall@k of covered answers against the upstream page, index
+search latency, and save/load time and size on disk.
+
+With --index-dir the saved index of a running site is read instead, and
+its logged upstream searches are replayed against it. Those searches fed
+the index, so recall there is an upper bound.
+
+Usage:
+    python benchmarks/bench_product_index.py [searches] [--catalog N] [--k K]
+    python benchmarks/bench_product_index.py --index-dir PATH [--k K]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import logging  # noqa: E402
+logging.disable(logging.CRITICAL)
+
+import product_index  # noqa: E402
+from product_index import ProductIndex  # noqa: E402
+
+BRANDS = ["sony", "bose", "jbl", "anker", "apple", "samsung", "logitech", "razer", "lenovo", "dell"]
+CATEGORIES = ["headphones", "earbuds", "speaker", "charger", "keyboard", "mouse", "monitor", "laptop",
+              "tablet", "webcam", "microphone", "router"]
+FEATURES = ["wireless", "bluetooth", "noise cancelling", "portable", "gaming", "usb c", "fast charging",
+            "waterproof", "ergonomic", "4k", "mechanical", "rgb", "compact", "pro", "mini"]
+STORES = ["Amazon", "Walmart", "Best Buy"]
+
+
+def make_catalog(rng, size):
+    """Products with brand/feature/category titles and a hidden popularity the upstream ranks by"""
+    catalog = []
+    for index in range(size):
+        brand, category = rng.choice(BRANDS), rng.choice(CATEGORIES)
+        features = rng.sample(FEATURES, rng.randint(1, 3))
+        catalog.append({
+            "product_id": f"p{index}",
+            "product_title": f"{brand.title()} {' '.join(features)} {category} model {rng.randint(100, 999)}",
+            "product_description": f"{' '.join(rng.sample(FEATURES, 4))} {category} by {brand}",
+            "product_rating": round(rng.uniform(2.5, 5), 1),
+            "offer": {"price": f"${rng.uniform(10, 500):.2f}", "store_name": rng.choice(STORES),
+                      "shipping": rng.choice(["Free delivery", None])},
+            "popularity": rng.random()
+        })
+    return catalog
+
+
+def make_queries(rng):
+    """Search queries: categories, brand + category, feature + category"""
+    queries = list(CATEGORIES)
+    queries += [f"{brand} {category}" for brand in BRANDS for category in CATEGORIES]
+    queries += [f"{feature} {category}" for feature in FEATURES for category in CATEGORIES]
+    rng.shuffle(queries)
+    return queries
+
+
+def upstream_search(catalog, query, limit):
+    """Fake API: products with every query word in the title or description, most popular first"""
+    words = query.split()
+    matches = [item for item in catalog
+               if all(word in f"{item['product_title']} {item['product_description']}".lower() for word in words)]
+    matches.sort(key=lambda item: -item["popularity"])
+    return matches[:limit]
+
+
+def recall(index_products, upstream_items, k):
+    expected = {item["product_id"] for item in upstream_items[:k]}
+    if not expected:
+        return None
+    found = {product.product_id for product in index_products[:k]}
+    return len(found & expected) / len(expected)
+
+
+def report(label, results, k, latencies):
+    covered = [result for result in results if result["covered"]]
+    recalls = [result["recall"] for result in covered if result["recall"] is not None]
+    print(f"{label}: {len(results)} searches, {len(covered)} covered ({len(covered) / max(len(results), 1):.0%})")
+    if recalls:
+        print(f"  recall@{k} of covered searches: mean {statistics.mean(recalls):.2f}, "
+              f"median {statistics.median(recalls):.2f}")
+    if latencies:
+        latencies = sorted(latencies)
+        print(f"  index search ms: median {statistics.median(latencies) * 1000:.2f}, "
+              f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:.2f}, max {latencies[-1] * 1000:.2f}")
+
+
+def run_synthetic(args):
+    rng = random.Random(7)
+    catalog = make_catalog(rng, args.catalog)
+    queries = make_queries(rng)
+    weights = [1 / (rank + 1) ** 1.1 for rank in range(len(queries))]
+    stream = rng.choices(queries, weights=weights, k=args.searches)
+    split = int(len(stream) * 0.8)
+
+    with tempfile.TemporaryDirectory() as directory:
+        index = ProductIndex(directory)
+        start = time.perf_counter()
+        fed = set()
+        for query in stream[:split]:
+            if query in fed:
+                continue  # Repeats are cache hits, they don't reach the API or the index
+            fed.add(query)
+            index.add(upstream_search(catalog, query, args.limit), {"query": query, "stores": ",".join(STORES)})
+        print(f"Fed {len(fed)} distinct upstream searches ({index.stats()['documents']} products) "
+              f"in {time.perf_counter() - start:.2f}s")
+
+        results, latencies = [], []
+        for query in dict.fromkeys(stream[split:]):
+            if query in fed:
+                continue  # Only searches the index hasn't seen the results of
+            params = {"query": query, "stores": ",".join(STORES)}
+            result = index.search(params, limit=args.k)
+            latencies.append(result.elapsed)
+            results.append({"covered": result.covered,
+                            "recall": recall(result.products, upstream_search(catalog, query, args.limit), args.k)})
+        report("Unseen searches", results, args.k, latencies)
+
+        start = time.perf_counter()
+        generation = index.save()
+        saved = time.perf_counter() - start
+        size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+        start = time.perf_counter()
+        ProductIndex(directory).stats()
+        print(f"Save {saved * 1000:.0f} ms, load {(time.perf_counter() - start) * 1000:.0f} ms, "
+              f"{size / 1024:.0f} KiB on disk (generation {generation})")
+
+
+def run_saved(args):
+    index = ProductIndex(args.index_dir)
+    print(f"Index {args.index_dir}: {index.stats()}")
+    results, latencies = [], []
+    for search in index.searches():
+        params = {"query": search["query"], "country": search["country"], "language": search["language"],
+                  "product_condition": search["condition"], "stores": search["stores"]}
+        result = index.search(params, limit=args.k)
+        latencies.append(result.elapsed)
+        keys = [f"{search['country']}:{search['language']}:id:{product.product_id}" for product in result.products]
+        expected = search["keys"][:args.k]
+        results.append({"covered": result.covered,
+                        "recall": len(set(keys) & set(expected)) / len(expected) if expected else None})
+    report("Logged searches (seen by the index)", results, args.k, latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("searches", nargs="?", type=int, default=3000)
+    parser.add_argument("--catalog", type=int, default=20000, help="Synthetic catalog size")
+    parser.add_argument("--limit", type=int, default=50, help="Products per upstream page")
+    parser.add_argument("--k", type=int, default=10, help="Page size compared for recall")
+    parser.add_argument("--index-dir", help="Replay the search log of a saved index instead")
+    args = parser.parse_args()
+
+    product_index.PRODUCT_INDEX_SAVE_EVERY = float("inf")  # Save only when the benchmark says so
+    product_index.PRODUCT_INDEX_SAVE_INTERVAL = float("inf")
+    if args.index_dir:
+        run_saved(args)
+    else:
+        run_synthetic(args)
+
+
+if __name__ == "__main__":
+    main()
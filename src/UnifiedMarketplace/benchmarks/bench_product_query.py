@@ -0,0 +1,108 @@
+"""
+Local filtering and sorting of merged product sets with ProductTable.
+
+Builds product lists shaped like merged search results (mixed stores, price
+formats, missing prices and ratings) and reports the mean time of building
+the table and of each query, with NumPy columns and with the pure-Python
+fallback. Both paths are checked to return the same products. The NumPy
+rows are skipped when NumPy is not installed.
+
+Usage:
+    python benchmarks/bench_product_query.py [products ...] [--iterations N]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import product_query  # noqa: E402
+from product_model import normalize_products  # noqa: E402
+from product_query import ProductFilter, ProductTable  # noqa: E402
+
+STORES = ["Amazon", "Walmart", "Best Buy", "Target", "eBay", "Newegg"]
+PRICE_FORMATS = ["${:,.2f}", "${:.2f}", "{:.2f} $", "US${:,.2f}"]
+
+QUERIES = {
+    "price range": ProductFilter(min_price=50, max_price=400),
+    "price + rating": ProductFilter(min_price=50, max_price=400, min_rating=4),
+    "stores + shipping": ProductFilter(stores=frozenset({"amazon", "best buy"}), free_shipping=True),
+    "lowest price": ProductFilter(sort_by="LOWEST_PRICE"),
+    "filtered, highest": ProductFilter(max_price=800, min_rating=3.5, sort_by="HIGHEST_PRICE"),
+}
+
+
+def make_products(rng, count):
+    """Build products shaped like several merged API result pages"""
+    items = []
+    for index in range(count):
+        price = rng.lognormvariate(4.5, 1.2)
+        items.append({
+            "product_id": f"{index:x}",
+            "product_title": f"Product {index}",
+            "product_photos": ["https://example.com/p.jpg"],
+            "product_rating": None if rng.random() < 0.1 else round(rng.uniform(1, 5), 1),
+            "product_num_reviews": rng.randint(0, 5000),
+            "offer": {
+                "price": None if rng.random() < 0.05 else rng.choice(PRICE_FORMATS).format(price),
+                "store_name": rng.choice(STORES),
+                "offer_page_url": f"https://example.com/{index}",
+                "shipping": rng.choice(["Free delivery", "$5.99 delivery", None])
+            }
+        })
+    return normalize_products(items)
+
+
+def mean_seconds(func, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations
+
+
+def run(products, iterations):
+    """Time both engines on one product list, returning {engine: {step: seconds}}"""
+    numpy = product_query.numpy
+    engines = {"python": None}
+    if numpy is not None:
+        engines = {"numpy": numpy, "python": None}
+
+    results, answers = {}, {}
+    for engine, module in engines.items():
+        product_query.numpy = module
+        try:
+            timings = {"build table": mean_seconds(lambda: ProductTable(products), max(1, iterations // 10))}
+            table = ProductTable(products)
+            for name, product_filter in QUERIES.items():
+                timings[name] = mean_seconds(lambda: table.query(product_filter), iterations)
+                answers.setdefault(name, []).append([p.product_id for p in table.query(product_filter)])
+            results[engine] = timings
+        finally:
+            product_query.numpy = numpy
+
+    for name, outputs in answers.items():
+        if any(output != outputs[0] for output in outputs):
+            raise AssertionError(f"Engines disagree on {name}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("sizes", nargs="*", type=int, default=[50, 1000, 5000])
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    print(f"NumPy: {'installed' if product_query.numpy is not None else 'not installed'}")
+    print(f"{'products':>8} {'engine':>7} {'step':>18} {'mean us':>10}")
+    for size in args.sizes:
+        products = make_products(rng, size)
+        for engine, timings in run(products, args.iterations).items():
+            for step, seconds in timings.items():
+                print(f"{size:>8} {engine:>7} {step:>18} {seconds * 1e6:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Interactive queueing behind background work with the upstream rate limiter.
+
+Background refresh and prefetch threads ask for upstream tokens as fast as
+they can, while interactive searches arrive at a steady random rate. The
+same load runs twice against a token bucket: once with every request at
+interactive priority, as if there were no priorities, and once with the
+real priority classes. Reports how long interactive searches queued for a
+token, how many were shed, and how many low-priority requests got through.
+
+Usage:
+    python benchmarks/bench_rate_limiter.py [--seconds S] [--rate R] [--burst B] [--interactive N]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import logging  # noqa: E402
+logging.disable(logging.CRITICAL)
+
+from rate_limiter import (PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, PRIORITY_PREFETCH,  # noqa: E402
+                          RateLimited, RateLimiter)
+
+
+def run(args, prioritized):
+    limiter = RateLimiter(mode="process", rate=args.rate, burst=args.burst)
+    stop = threading.Event()
+    low_priority_granted = [0]
+
+    def low_priority_worker(priority):
+        while not stop.is_set():
+            try:
+                limiter.acquire(priority if prioritized else PRIORITY_INTERACTIVE)
+                low_priority_granted[0] += 1
+            except RateLimited:
+                time.sleep(0.05)
+
+    workers = [threading.Thread(target=low_priority_worker, args=(priority,), daemon=True)
+               for priority in [PRIORITY_BACKGROUND] * args.background + [PRIORITY_PREFETCH] * args.prefetch]
+    for worker in workers:
+        worker.start()
+
+    rng = random.Random(1)
+    waits, shed = [], 0
+    deadline = time.monotonic() + args.seconds
+    while time.monotonic() < deadline:
+        time.sleep(rng.expovariate(args.interactive))
+        start = time.monotonic()
+        try:
+            limiter.acquire(PRIORITY_INTERACTIVE)
+            waits.append(time.monotonic() - start)
+        except RateLimited:
+            shed += 1
+
+    stop.set()
+    for worker in workers:
+        worker.join()
+    return waits, shed, low_priority_granted[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--rate", type=float, default=5, help="Tokens per second")
+    parser.add_argument("--burst", type=float, default=10, help="Bucket size")
+    parser.add_argument("--interactive", type=float, default=2, help="Interactive searches per second")
+    parser.add_argument("--background", type=int, default=2, help="Background refresh threads")
+    parser.add_argument("--prefetch", type=int, default=2, help="Prefetch threads")
+    args = parser.parse_args()
+
+    print(f"{'mode':>12} {'searches':>8} {'shed':>5} {'wait p50 ms':>11} {'p95 ms':>8} {'max ms':>8} {'low-pri granted':>15}")
+    for label, prioritized in [("flat", False), ("prioritized", True)]:
+        waits, shed, granted = run(args, prioritized)
+        waits.sort()
+        p50 = statistics.median(waits) * 1000 if waits else 0
+        p95 = waits[int(len(waits) * 0.95)] * 1000 if waits else 0
+        worst = waits[-1] * 1000 if waits else 0
+        print(f"{label:>12} {len(waits) + shed:>8} {shed:>5} {p50:>11.1f} {p95:>8.1f} {worst:>8.1f} {granted:>15}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Worker startup time: importing app.py and serving the first request.
+
+Each run is a fresh interpreter, so import caches don't carry over. The
+backing services are stubbed: Supabase is FakeSupabaseClient with a
+per-request latency standing in for the network round trip, and Postgres
+is a throwaway SQLite file. Reports median import time, first-request time,
+Supabase requests made and background threads alive after import.
+
+Pass --app-dir to time another checkout (e.g. a git worktree of an older
+commit) with the same stubs.
+
+Usage:
+    python benchmarks/bench_startup.py [runs] [--latency SECONDS] [--app-dir PATH]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def child(app_dir, latency):
+    """Import the app with stubbed services, serve one request and print the timings as JSON"""
+    import logging
+    import threading
+
+    logging.disable(logging.CRITICAL)
+    sys.path.insert(0, app_dir)
+    sys.path.insert(0, BENCH_DIR)
+
+    from fake_postgrest import FakeSupabaseClient
+
+    # Supabase: every created client is the fake one
+    clients = []
+
+    def create_client(url, key):
+        client = FakeSupabaseClient(latency=latency)
+        clients.append(client)
+        return client
+
+    import supabase
+    supabase.create_client = create_client
+
+    # Postgres: SQLite doesn't take the psycopg2 connect arguments
+    import flask_sqlalchemy.extension as extension
+    make_engine = extension.SQLAlchemy._make_engine
+
+    def sqlite_engine(self, bind_key, options, app):
+        options.pop("connect_args", None)
+        return make_engine(self, bind_key, options, app)
+
+    extension.SQLAlchemy._make_engine = sqlite_engine
+
+    threads_before = threading.active_count()
+    start = time.perf_counter()
+    import app as app_module
+    imported = time.perf_counter()
+    threads_after_import = threading.active_count()
+
+    response = app_module.app.test_client().get("/")
+    served = time.perf_counter()
+
+    print(json.dumps({
+        "import": imported - start,
+        "first_request": served - imported,
+        "status": response.status_code,
+        "supabase_requests": sum(client.requests for client in clients),
+        "import_threads": threads_after_import - threads_before
+    }))
+
+
+def run(app_dir, latency, runs):
+    results = []
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            env = dict(os.environ,
+                       DATABASE_URL=f"sqlite:///{tmpdir}/bench.db",
+                       SUPABASE_URL="https://bench.supabase.invalid",
+                       SUPABASE_KEY="bench-key")
+            output = subprocess.run(
+                [sys.executable, __file__, "--child", "--app-dir", app_dir, "--latency", str(latency)],
+                env=env, cwd=app_dir, capture_output=True, text=True, check=True
+            ).stdout
+            results.append(json.loads(output.strip().splitlines()[-1]))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("runs", nargs="?", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds per stubbed Supabase request")
+    parser.add_argument("--app-dir", default=os.path.dirname(BENCH_DIR))
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(os.path.abspath(args.app_dir), args.latency)
+        return
+
+    results = run(os.path.abspath(args.app_dir), args.latency, args.runs)
+    median = lambda name: statistics.median(result[name] for result in results)
+
+    print(f"{args.runs} runs, {args.latency * 1000:.0f} ms per Supabase request, app at {args.app_dir}")
+    print(f"{'import ms':>10} {'first request ms':>17} {'total ms':>9} {'supabase requests':>18} {'threads':>8}")
+    print(f"{median('import') * 1000:>10.0f} {median('first_request') * 1000:>17.0f} "
+          f"{(median('import') + median('first_request')) * 1000:>9.0f} "
+          f"{median('supabase_requests'):>18.0f} {median('import_threads'):>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
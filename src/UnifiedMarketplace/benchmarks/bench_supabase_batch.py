@@ -0,0 +1,58 @@
+"""
+Throughput of per-row Supabase writes vs the chunked bulk API, offline.
+
+Runs against benchmarks/fake_postgrest.py with a simulated round-trip
+latency and reports requests made and rows written per second for:
+  - cache_search_results called once per entry vs cache_search_results_many
+  - save_search called once per search vs save_searches_many
+
+Usage:
+    python benchmarks/bench_supabase_batch.py [rows] [latency_ms]
+"""
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import supabase_client  # noqa: E402
+from fake_postgrest import FakeSupabaseClient  # noqa: E402
+
+
+def run(label, fn, latency):
+    client = FakeSupabaseClient(latency=latency)
+    supabase_client.set_supabase_client(client)
+    start = time.perf_counter()
+    rows = fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<34} {client.requests:>6} requests {rows / elapsed:>10.0f} rows/s")
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    latency = (float(sys.argv[2]) if len(sys.argv) > 2 else 5) / 1000
+    
+    payload = "b64:" + "x" * 4000  # About the size of a compressed 50-product page
+    entries = [{"cache_key": f"v2:{i:032x}", "results": payload} for i in range(count)]
+    searches = [{"user_id": i % 50, "query": f"query {i}", "parameters": "{}"} for i in range(count)]
+    
+    def per_row_cache():
+        for entry in entries:
+            supabase_client.cache_search_results(entry["cache_key"], entry["results"])
+        return count
+    
+    def per_row_history():
+        for search in searches:
+            supabase_client.save_search(search["user_id"], search["query"], search["parameters"])
+        return count
+    
+    run("cache_search_results (per row)", per_row_cache, latency)
+    run("cache_search_results_many", lambda: supabase_client.cache_search_results_many(entries), latency)
+    run("save_search (per row)", per_row_history, latency)
+    run("save_searches_many", lambda: supabase_client.save_searches_many(searches), latency)
+
+
+if __name__ == "__main__":
+    main()
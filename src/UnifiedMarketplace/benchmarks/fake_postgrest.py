@@ -0,0 +1,159 @@
+"""
+In-memory stand-in for the Supabase client's PostgREST table API.
+
+Implements the subset of the query builder used by supabase_client
+(select/insert/upsert/update/delete with eq/in_/gt/lt/order/limit filters)
+against Python lists, with a configurable per-request latency standing in
+for the network round trip. Every execute() counts as one request.
+
+Usage:
+    import supabase_client
+    supabase_client.set_supabase_client(FakeSupabaseClient(latency=0.02))
+"""
+import itertools
+import re
+import threading
+import time
+
+
+class FakeResponse:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+class FakeQuery:
+    def __init__(self, client, table):
+        self.client = client
+        self.table = table
+        self.action = "select"
+        self.payload = None
+        self.on_conflict = None
+        self.minimal = False
+        self.filters = []
+        self.order_by = None
+        self.row_limit = None
+
+    # Actions
+    def select(self, *columns, count=None):
+        self.action = "select"
+        return self
+
+    def insert(self, rows, returning=None, **kwargs):
+        self.action, self.payload = "insert", rows
+        self.minimal = str(getattr(returning, "value", returning)) == "minimal"
+        return self
+
+    def upsert(self, rows, on_conflict="", returning=None, **kwargs):
+        self.action, self.payload, self.on_conflict = "upsert", rows, on_conflict or "id"
+        self.minimal = str(getattr(returning, "value", returning)) == "minimal"
+        return self
+
+    def update(self, values, **kwargs):
+        self.action, self.payload = "update", values
+        return self
+
+    def delete(self, count=None, returning=None):
+        self.action = "delete"
+        self.minimal = str(getattr(returning, "value", returning)) == "minimal"
+        return self
+
+    # Filters
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def in_(self, column, values):
+        values = set(values)
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def gt(self, column, value):
+        self.filters.append(lambda row: row.get(column) is not None and row.get(column) > value)
+        return self
+
+    def lt(self, column, value):
+        self.filters.append(lambda row: row.get(column) is not None and row.get(column) < value)
+        return self
+
+    def or_(self, expression):
+        # Supports "col.eq.value,col.eq.value", values optionally double-quoted
+        conditions = []
+        for part in re.findall(r'[^,"]+\.eq\.(?:"(?:[^"\\]|\\.)*"|[^,]*)', expression):
+            col, _, value = part.split(".", 2)
+            if value.startswith('"'):
+                value = re.sub(r'\\(.)', r'\1', value[1:-1])
+            conditions.append((col, value))
+        self.filters.append(lambda row: any(str(row.get(col)) == value for col, value in conditions))
+        return self
+
+    def order(self, column, desc=False):
+        self.order_by = (column, desc)
+        return self
+
+    def limit(self, count):
+        self.row_limit = count
+        return self
+
+    def execute(self):
+        return self.client._execute(self)
+
+
+class FakeSupabaseClient:
+    """Fake client with one request counter and a simulated round-trip latency"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.tables = {}
+        self.requests = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+    def _execute(self, query):
+        if self.latency:
+            time.sleep(self.latency)
+
+        with self._lock:
+            self.requests += 1
+            rows = self.tables.setdefault(query.table, [])
+            matches = [row for row in rows if all(check(row) for check in query.filters)]
+
+            if query.action == "select":
+                if query.order_by:
+                    column, desc = query.order_by
+                    matches.sort(key=lambda row: row.get(column) or "", reverse=desc)
+                if query.row_limit is not None:
+                    matches = matches[:query.row_limit]
+                return FakeResponse([dict(row) for row in matches])
+
+            if query.action in ("insert", "upsert"):
+                payload = query.payload if isinstance(query.payload, list) else [query.payload]
+                written = []
+                for values in payload:
+                    existing = None
+                    if query.action == "upsert":
+                        key = query.on_conflict
+                        existing = next((row for row in rows if row.get(key) == values.get(key)), None)
+                    if existing is not None:
+                        existing.update(values)
+                        written.append(existing)
+                    else:
+                        row = {"id": next(self._ids), **values}
+                        rows.append(row)
+                        written.append(row)
+                return FakeResponse([] if query.minimal else [dict(row) for row in written])
+
+            if query.action == "update":
+                for row in matches:
+                    row.update(query.payload)
+                return FakeResponse([dict(row) for row in matches])
+
+            if query.action == "delete":
+                doomed = {id(row) for row in matches}
+                self.tables[query.table] = [row for row in rows if id(row) not in doomed]
+                return FakeResponse([] if query.minimal else matches, count=len(matches))
+
+        raise ValueError(f"Unsupported action {query.action}")
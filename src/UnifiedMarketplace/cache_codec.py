@@ -0,0 +1,175 @@
+import base64
+import json
+import logging
+import os
+import zlib
+
+# Optional faster codecs - fall back to zlib-compressed JSON when missing
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Every encoded payload starts with MAGIC, a format version byte and a codec ID byte
+MAGIC = b"UMC"
+FORMAT_VERSION = 1
+HEADER_SIZE = len(MAGIC) + 2
+
+# Prefix for encoded payloads stored in text columns (the Supabase cache table)
+TEXT_PREFIX = "b64:"
+
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 3
+
+CODEC_IDS = {
+    "json": 1,
+    "zlib-json": 2,
+    "zstd-json": 3,
+    "msgpack": 4,
+    "zlib-msgpack": 5
+}
+CODEC_NAMES = {codec_id: name for name, codec_id in CODEC_IDS.items()}
+
+
+class CodecError(Exception):
+    """Raised when a payload cannot be encoded or decoded"""
+
+
+def available_codecs():
+    """
+    Get the codecs usable in this environment.
+
+    Returns:
+        list: Codec names, in CODEC_IDS order
+    """
+    codecs = ["json", "zlib-json"]
+    if zstandard is not None:
+        codecs.append("zstd-json")
+    if msgpack is not None:
+        codecs.extend(["msgpack", "zlib-msgpack"])
+    return codecs
+
+def _default_codec():
+    codec = os.environ.get("CACHE_CODEC")
+    if codec:
+        if codec not in available_codecs():
+            logging.warning(f"Cache codec {codec} is not available, using zlib-json")
+            return "zlib-json"
+        return codec
+    if zstandard is None:
+        logging.warning("zstandard is not installed, caching with zlib-json")
+        return "zlib-json"
+    return "zstd-json"
+
+# Codec used for new cache writes
+DEFAULT_CODEC = _default_codec()
+
+def encode(obj, codec=None):
+    """
+    Serialize a cache payload with a format/version header.
+
+    Args:
+        obj: JSON-compatible value to encode
+        codec (str): One of CODEC_IDS, defaults to DEFAULT_CODEC
+
+    Returns:
+        bytes: The header followed by the encoded body
+    """
+    codec = codec or DEFAULT_CODEC
+    if codec not in available_codecs():
+        raise CodecError(f"Codec {codec} is not available")
+
+    if codec.endswith("json"):
+        body = json.dumps(obj, separators=(",", ":")).encode("utf-8")
+    else:
+        body = msgpack.packb(obj, use_bin_type=True)
+
+    if codec.startswith("zlib-"):
+        body = zlib.compress(body, ZLIB_LEVEL)
+    elif codec.startswith("zstd-"):
+        body = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+
+    return MAGIC + bytes([FORMAT_VERSION, CODEC_IDS[codec]]) + body
+
+def decode(data):
+    """
+    Deserialize a cache payload.
+
+    Accepts encoded bytes, encoded bytes wrapped as TEXT_PREFIX text, and
+    plain JSON text from rows written before payloads were encoded.
+
+    Args:
+        data (bytes or str): The stored payload
+
+    Returns:
+        The decoded value
+    """
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+
+    if isinstance(data, str):
+        if not data.startswith(TEXT_PREFIX):
+            return json.loads(data)  # Legacy plain JSON row
+        data = base64.b64decode(data[len(TEXT_PREFIX):])
+
+    if not data.startswith(MAGIC):
+        return json.loads(data)
+
+    version, codec_id = data[len(MAGIC)], data[len(MAGIC) + 1]
+    if version != FORMAT_VERSION:
+        raise CodecError(f"Unsupported cache payload format version {version}")
+    codec = CODEC_NAMES.get(codec_id)
+    if codec is None:
+        raise CodecError(f"Unknown cache codec ID {codec_id}")
+
+    body = data[HEADER_SIZE:]
+    if codec.startswith("zlib-"):
+        body = zlib.decompress(body)
+    elif codec.startswith("zstd-"):
+        if zstandard is None:
+            raise CodecError("zstandard is required to decode this payload")
+        body = zstandard.ZstdDecompressor().decompress(body)
+
+    if codec.endswith("json"):
+        return json.loads(body)
+    if msgpack is None:
+        raise CodecError("msgpack is required to decode this payload")
+    return msgpack.unpackb(body, raw=False)
+
+def to_text(payload):
+    """
+    Wrap an encoded payload for storage in a text column.
+
+    Args:
+        payload (bytes): Output of encode()
+
+    Returns:
+        str: TEXT_PREFIX followed by the base64 payload
+    """
+    return TEXT_PREFIX + base64.b64encode(payload).decode("ascii")
+
+def to_bytes(data):
+    """
+    Get the stored bytes of a payload, whatever column it was read from.
+
+    Args:
+        data (bytes, memoryview or str): A stored payload
+
+    Returns:
+        bytes: The encoded payload, or the UTF-8 text of a legacy JSON row
+    """
+    if isinstance(data, memoryview):
+        return data.tobytes()
+    if isinstance(data, str):
+        if data.startswith(TEXT_PREFIX):
+            return base64.b64decode(data[len(TEXT_PREFIX):])
+        return data.encode("utf-8")
+    return data
@@ -0,0 +1,191 @@
+import hashlib
+import json
+import os
+import re
+from decimal import Decimal, InvalidOperation
+
+# Bump when the normalization rules change so old keys stop matching
+CACHE_KEY_VERSION = "v2"
+
+# Also look up the pre-v2 f-string keys while old cache rows are still live
+LEGACY_KEY_READS = os.environ.get("CACHE_KEY_LEGACY_READS", "true").lower() == "true"
+
+# Parameter defaults, matching the search form and get_products
+DEFAULT_PARAMS = {
+    "query": "",
+    "page": 1,
+    "sort_by": "BEST_MATCH",
+    "product_condition": "NEW",
+    "min_rating": "ANY",
+    "min_price": "0",
+    "max_price": "1000000",
+    "stores": "Amazon",
+    "country": "us",
+    "language": "en"
+}
+
+# Products per page of the search page. Other limits are part of the key, this one
+# is left out so keys from before limits existed still match
+DEFAULT_LIMIT = 50
+
+# Country codes that return the same results upstream
+COUNTRY_ALIASES = {
+    "uk": "gb"
+}
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _normalize_text(value):
+    """Trim, collapse internal whitespace and case-fold"""
+    return _WHITESPACE.sub(" ", str(value)).strip().casefold()
+
+def _normalize_price(value, default):
+    """Render a price as a plain decimal string, so "0", "0.00" and "00" are equal"""
+    value = str(value).strip() or default
+    try:
+        price = Decimal(value)
+    except InvalidOperation:
+        return value
+    if not price.is_finite():
+        return value
+    return format(price.normalize(), "f")
+
+def _normalize_stores(value):
+    """Lower-case, de-duplicate and sort a comma-separated store list"""
+    stores = {_normalize_text(store) for store in str(value).split(",")}
+    stores.discard("")
+    return ",".join(sorted(stores))
+
+def _display_text(value):
+    """Trim and collapse internal whitespace, keeping the user's casing"""
+    return _WHITESPACE.sub(" ", str(value)).strip()
+
+def _display_stores(value):
+    """De-duplicate and sort a store list like _normalize_stores, keeping the first spelling of each store"""
+    stores = {}
+    for store in str(value).split(","):
+        store = _display_text(store)
+        if store:
+            stores.setdefault(store.casefold(), store)
+    return ",".join(stores[key] for key in sorted(stores))
+
+def _normalize_limit(value):
+    """Parse a page size, falling back to DEFAULT_LIMIT"""
+    try:
+        return max(1, int(value))
+    except (TypeError, ValueError):
+        return DEFAULT_LIMIT
+
+def _normalize_flag(value):
+    """Parse a checkbox or query string flag"""
+    return str(value).strip().lower() in ("1", "true", "on", "yes")
+
+def normalize_search_params(params):
+    """
+    Canonicalize search parameters so equivalent searches compare equal.
+
+    Args:
+        params (dict): Search parameters, missing ones take the form defaults
+
+    Returns:
+        dict: Normalized parameters with the same keys as DEFAULT_PARAMS, plus
+            "limit" when it isn't DEFAULT_LIMIT and "free_shipping" when set
+    """
+    merged = {**DEFAULT_PARAMS, **{k: v for k, v in params.items() if k in DEFAULT_PARAMS and v is not None}}
+
+    try:
+        page = max(1, int(merged["page"]))
+    except (TypeError, ValueError):
+        page = DEFAULT_PARAMS["page"]
+
+    country = _normalize_text(merged["country"]) or DEFAULT_PARAMS["country"]
+
+    normalized = {
+        "query": _normalize_text(merged["query"]),
+        "page": page,
+        "sort_by": str(merged["sort_by"]).strip().upper() or DEFAULT_PARAMS["sort_by"],
+        "product_condition": str(merged["product_condition"]).strip().upper() or DEFAULT_PARAMS["product_condition"],
+        "min_rating": str(merged["min_rating"]).strip().upper() or DEFAULT_PARAMS["min_rating"],
+        "min_price": _normalize_price(merged["min_price"], DEFAULT_PARAMS["min_price"]),
+        "max_price": _normalize_price(merged["max_price"], DEFAULT_PARAMS["max_price"]),
+        "stores": _normalize_stores(merged["stores"]) or _normalize_stores(DEFAULT_PARAMS["stores"]),
+        "country": COUNTRY_ALIASES.get(country, country),
+        "language": _normalize_text(merged["language"]) or DEFAULT_PARAMS["language"]
+    }
+
+    limit = _normalize_limit(params.get("limit"))
+    if limit != DEFAULT_LIMIT:
+        normalized["limit"] = limit
+    # Filtered locally, so like limit it is only part of the key when used
+    if _normalize_flag(params.get("free_shipping")):
+        normalized["free_shipping"] = True
+    return normalized
+
+def canonical_query_args(params):
+    """
+    Get the query string arguments of a search's canonical URL.
+    
+    Args:
+        params (dict): Search parameters
+        
+    Returns:
+        dict: Normalized parameters in DEFAULT_PARAMS order, without the ones
+            left at their defaults (query is always included). The query and
+            stores keep the user's casing - they are shown in the form and
+            sent upstream, and only the cache key case-folds them
+    """
+    defaults = normalize_search_params({})
+    args = {name: value for name, value in normalize_search_params(params).items()
+            if name == "query" or value != defaults.get(name)}
+    args["query"] = _display_text(params.get("query", ""))
+    if "stores" in args:
+        args["stores"] = _display_stores(params["stores"])
+    return args
+
+def make_cache_key(params):
+    """
+    Build a compact, fixed-length cache key for a search.
+
+    Args:
+        params (dict): Search parameters
+
+    Returns:
+        str: "<version>:<hex digest>" of the normalized parameters
+    """
+    canonical = json.dumps(normalize_search_params(params), sort_keys=True, separators=(",", ":"))
+    digest = hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:32]
+    return f"{CACHE_KEY_VERSION}:{digest}"
+
+def legacy_cache_key(params):
+    """
+    Build the pre-v2 cache key, an f-string of the raw form values.
+
+    Args:
+        params (dict): Search parameters exactly as submitted
+
+    Returns:
+        str: The old-style cache key
+    """
+    p = {**DEFAULT_PARAMS, **params}
+    return (f"{p['query']}_{p['page']}_{p['sort_by']}_{p['product_condition']}_{p['min_rating']}_"
+            f"{p['min_price']}_{p['max_price']}_{p['stores']}_{p['country']}_{p['language']}")
+
+def lookup_keys(params):
+    """
+    Get the keys to read a search from the cache, newest style first.
+
+    Args:
+        params (dict): Search parameters exactly as submitted
+
+    Returns:
+        list: The canonical key, followed by the legacy key during rollout
+    """
+    keys = [make_cache_key(params)]
+    # Legacy keys predate page sizes and local filters, they only ever held unfiltered DEFAULT_LIMIT results
+    if (LEGACY_KEY_READS and _normalize_limit(params.get("limit")) == DEFAULT_LIMIT
+            and not _normalize_flag(params.get("free_shipping"))):
+        legacy_key = legacy_cache_key(params)
+        if len(legacy_key) <= 512:  # Longer keys could never have been stored
+            keys.append(legacy_key)
+    return keys
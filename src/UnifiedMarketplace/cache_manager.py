@@ -1,189 +1,505 @@
-import json
+import hashlib
 import logging
-from datetime import datetime, timedelta
+import os
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+import cache_codec
+from memory_cache import LRUCache
+from product_model import normalize_products, serialize_products
+from refresh_scheduler import refresh_scheduler
+from storage import get_storage
+from write_behind import write_queue
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG, format="%(asctime)s - %(levelname)s - %(message)s")
 
-# Import models and db within functions to avoid circular imports
-
-# Cache duration in hours
+# Cache duration in hours - entries are never served after this (hard TTL)
 CACHE_DURATION = 24
 
-def get_cached_results(cache_key):
+# Hours after which an entry is still served but refreshed in the background (soft TTL)
+CACHE_SOFT_DURATION = float(os.environ.get("CACHE_SOFT_DURATION", 6))
+
+# Hours expired entries are kept, to be served marked stale while the API is unavailable
+CACHE_STALE_RETENTION = float(os.environ.get("CACHE_STALE_RETENTION", 72))
+
+# Expired-entry purge settings
+PURGE_CHUNK_SIZE = int(os.environ.get("CACHE_PURGE_CHUNK_SIZE", 1000))
+PURGE_PAUSE = float(os.environ.get("CACHE_PURGE_PAUSE", 0.05))  # Seconds between chunks
+
+# Current naive UTC time - replaced with a fake clock in tests
+clock = datetime.utcnow
+
+def _to_timestamp(value):
+    """Convert a naive UTC datetime or ISO string from the database to a POSIX timestamp"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+def current_timestamp():
+    """Current time from clock as a POSIX timestamp"""
+    return _to_timestamp(clock())
+
+@dataclass(slots=True)
+class CachedResults:
+    """Decoded cache entry, with what HTTP caching needs to validate and expire it"""
+    products: list
+    created_at: float  # POSIX timestamps
+    expires_at: float
+    content_hash: str  # Hash of the stored payload
+
+    @property
+    def soft_expires_at(self):
+        """When the entry goes stale and is refreshed on the next read"""
+        return min(self.created_at + CACHE_SOFT_DURATION * 3600, self.expires_at)
+
+    @property
+    def expired(self):
+        """Past the hard TTL - only served while the API is unavailable"""
+        return self.expires_at <= current_timestamp()
+
+def _content_hash(payload):
+    """Hash of a stored payload, the same for bytes and text-wrapped copies"""
+    return hashlib.blake2b(cache_codec.to_bytes(payload), digest_size=16).hexdigest()
+
+# In-process L1 cache of decoded results, consulted before storage
+# Values are CachedResults so staleness can be judged without the database
+L1_CACHE_MAX_ENTRIES = int(os.environ.get("L1_CACHE_MAX_ENTRIES", 512))
+L1_CACHE_MAX_BYTES = int(os.environ.get("L1_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+l1_cache = LRUCache(
+    max_entries=L1_CACHE_MAX_ENTRIES,
+    max_bytes=L1_CACHE_MAX_BYTES,
+    ttl=CACHE_DURATION * 3600,
+    clock=current_timestamp
+)
+
+# Local refinements of cached searches are kept in memory only, apart from L1, and only
+# briefly - long enough to serve the redirect after Apply Filters. They hold at most the
+# top of the narrower search, so they are never stored as that search's results
+REFINED_CACHE_ENTRIES = int(os.environ.get("REFINED_CACHE_ENTRIES", 256))
+REFINED_TTL = float(os.environ.get("REFINED_TTL", 300))  # Seconds
+refined_cache = LRUCache(max_entries=REFINED_CACHE_ENTRIES, ttl=REFINED_TTL, clock=current_timestamp)
+
+# Negative caching: searches that returned nothing, or failed, are not re-sent
+# upstream on every submit. Seconds to remember each outcome, 0 to disable
+NEGATIVE_CACHE_EMPTY_TTL = float(os.environ.get("NEGATIVE_CACHE_EMPTY_TTL", 600))
+NEGATIVE_CACHE_ERROR_TTL = float(os.environ.get("NEGATIVE_CACHE_ERROR_TTL", 60))
+NEGATIVE_CACHE_MAX_ENTRIES = int(os.environ.get("NEGATIVE_CACHE_MAX_ENTRIES", 4096))
+
+# Storage key prefix of negative entries shared between workers
+NEGATIVE_KEY_PREFIX = "negative:"
+
+# Negative cache outcomes
+EMPTY = "empty"  # The API answered with no products
+ERROR = "error"  # The API call failed
+
+@dataclass(slots=True)
+class NegativeResult:
+    """A remembered search that produced no products"""
+    outcome: str  # EMPTY or ERROR
+    created_at: float  # POSIX timestamps
+    expires_at: float
+
+class NegativeCache:
     """
-    Get cached search results from the database.
+    Short-lived memory of searches that produced no products.
+    
+    Kept apart from the positive caches so a negative entry never shadows
+    real results: it is only consulted after they miss, and caching results
+    for a key drops its negative entry. Entries live in process memory - they
+    last minutes, and writing every typo or bot query to the database would
+    cost more than the occasional repeat upstream call from another worker.
+    The exception is a search other workers are waiting on (database
+    coalescing): its outcome is also stored, under NEGATIVE_KEY_PREFIX with
+    the short TTL, so they see it instead of calling upstream themselves.
+    """
+    
+    def __init__(self, empty_ttl=NEGATIVE_CACHE_EMPTY_TTL, error_ttl=NEGATIVE_CACHE_ERROR_TTL,
+                 max_entries=NEGATIVE_CACHE_MAX_ENTRIES):
+        """
+        Args:
+            empty_ttl (float): Seconds to remember empty results, 0 to disable
+            error_ttl (float): Seconds to remember failed calls, 0 to disable
+            max_entries (int): Maximum number of remembered searches
+        """
+        self.ttls = {EMPTY: empty_ttl, ERROR: error_ttl}
+        self._cache = LRUCache(max_entries=max_entries, ttl=max(empty_ttl, error_ttl), clock=current_timestamp)
+        self._lock = threading.Lock()
+        
+        # Counters per outcome
+        self.stored = {EMPTY: 0, ERROR: 0}
+        self.hits = {EMPTY: 0, ERROR: 0}
+    
+    def get(self, cache_key):
+        """
+        Get the remembered outcome of a search.
+        
+        Args:
+            cache_key (str): The unique key for the search query
+            
+        Returns:
+            NegativeResult: The outcome, or None if the search isn't remembered
+        """
+        result = self._cache.get(cache_key)
+        if result is not None:
+            with self._lock:
+                self.hits[result.outcome] += 1
+        return result
+    
+    def set(self, cache_key, outcome, shared=False):
+        """
+        Remember that a search produced no products.
+        
+        Args:
+            cache_key (str): The unique key for the search query
+            outcome (str): EMPTY or ERROR
+            shared (bool): Also store it, for workers in other processes waiting on the search
+        """
+        ttl = self.ttls[outcome]
+        if ttl <= 0:
+            return
+        now = current_timestamp()
+        self._cache.set(cache_key, NegativeResult(outcome, now, now + ttl), expires_at=now + ttl)
+        with self._lock:
+            self.stored[outcome] += 1
+        
+        if shared:
+            try:
+                get_storage().store_cached(
+                    [(NEGATIVE_KEY_PREFIX + cache_key, cache_codec.encode({"outcome": outcome}), clock())],
+                    ttl / 3600
+                )
+            except Exception as e:
+                logging.error(f"Error storing negative cache entry: {str(e)}")
+    
+    def get_shared(self, cache_key):
+        """
+        Get the outcome of a search another worker stored with set(shared=True).
+        
+        Args:
+            cache_key (str): The unique key for the search query
+            
+        Returns:
+            NegativeResult: The outcome, or None if none is stored
+        """
+        try:
+            stored = get_storage().get_cached([NEGATIVE_KEY_PREFIX + cache_key], clock())
+        except Exception as e:
+            logging.error(f"Error retrieving negative cache entry: {str(e)}")
+            return None
+        if stored is None:
+            return None
+        
+        result = NegativeResult(cache_codec.decode(stored.payload)["outcome"],
+                                _to_timestamp(stored.created_at), _to_timestamp(stored.expires_at))
+        self._cache.set(cache_key, result, expires_at=result.expires_at)
+        return result
+    
+    def delete(self, cache_key):
+        """Forget a search, e.g. because results were just cached for it"""
+        self._cache.delete(cache_key)
+    
+    def stats(self):
+        """
+        Get negative cache counters.
+        
+        Returns:
+            dict: Entry count, TTLs, and stored and hit counts per outcome
+        """
+        cache_stats = self._cache.stats()
+        with self._lock:
+            return {
+                "entries": cache_stats["entries"],
+                "ttls": dict(self.ttls),
+                "stored": dict(self.stored),
+                "hits": dict(self.hits),
+                "misses": cache_stats["misses"],
+                "evictions": cache_stats["evictions"]
+            }
+
+# Global instance
+negative_cache = NegativeCache()
+
+def _is_stale(created_at):
+    """Check if an entry created at the given timestamp is past its soft TTL"""
+    return current_timestamp() - created_at >= CACHE_SOFT_DURATION * 3600
+
+def _serve(cache_key, entry, refresh):
+    """Return an entry, scheduling a background refresh if it is past the soft TTL"""
+    if refresh is not None and _is_stale(entry.created_at):
+        logging.info(f"Serving stale results and scheduling refresh for key: {cache_key}")
+        refresh_scheduler.schedule(cache_key, refresh)
+    return entry
+
+def get_cached_entry(cache_key, fallback_keys=(), refresh=None):
+    """
+    Get a cached search with its timestamps and content hash.
+    
+    Entries past the soft TTL (CACHE_SOFT_DURATION) are still returned, and
+    refresh is scheduled in the background so the next request gets fresh
+    results. Entries past the hard TTL (CACHE_DURATION) are never returned;
+    they are left for clear_old_cache rather than deleted inline.
     
     Args:
         cache_key (str): The unique key for the search query
+        fallback_keys (list): Older keys for the same search, tried if cache_key misses
+        refresh (callable): Fetches and caches fresh results for a stale entry
         
     Returns:
-        list: The cached search results or None if not found/expired
+        CachedResults: The cached entry or None if not found/expired
     """
-    # Import here to avoid circular imports
-    from models import CachedSearch
-    from app import db
-    from supabase_client import get_cached_search, supabase_client
+    # Check the in-process cache before making any network round trip
+    entry = l1_cache.get(cache_key)
+    if entry is not None:
+        logging.info(f"Memory cache hit for key: {cache_key}")
+        return _serve(cache_key, entry, refresh)
+    
+    keys = [cache_key] + [key for key in fallback_keys if key != cache_key]
     
     try:
-        # Try Supabase cache first if available
-        if supabase_client:
-            cached_data = get_cached_search(cache_key)
-            if cached_data:
-                logging.info(f"Supabase cache hit for key: {cache_key}")
-                return json.loads(cached_data.get('results', '[]'))
-        
-        # Fall back to SQLAlchemy
-        # Look for a cached entry using db.session.query
-        cached_entry = db.session.query(CachedSearch).filter(
-            CachedSearch.cache_key == cache_key
-        ).first()
-        
-        # Check if we have a valid cache entry
-        if cached_entry and cached_entry.expires_at > datetime.utcnow():
-            logging.info(f"SQLAlchemy cache hit for key: {cache_key}")
-            return json.loads(cached_entry.results)
-        
-        # If cache entry exists but is expired, remove it
-        if cached_entry:
-            logging.info(f"Removing expired cache for key: {cache_key}")
-            db.session.delete(cached_entry)
-            db.session.commit()
-            
-        return None
+        # Look up all candidate keys in one storage round trip, preferring them in order
+        cached_entry = get_storage().get_cached(keys, clock())
+        if cached_entry is None:
+            return None
+        
+        logging.info(f"Storage cache hit for key: {cached_entry.cache_key}")
+        entry = CachedResults(
+            products=normalize_products(cache_codec.decode(cached_entry.payload)),
+            created_at=_to_timestamp(cached_entry.created_at),
+            expires_at=_to_timestamp(cached_entry.expires_at),
+            content_hash=_content_hash(cached_entry.payload)
+        )
+        l1_cache.set(cache_key, entry, size=len(cached_entry.payload), expires_at=entry.expires_at)
+        return _serve(cache_key, entry, refresh)
         
     except Exception as e:
         logging.error(f"Error retrieving cached results: {str(e)}")
         return None
 
-def cache_results(cache_key, results):
+def get_expired_entry(cache_key, fallback_keys=()):
     """
-    Cache search results in the database.
+    Get the most recent cached search for a key, even if past the hard TTL.
+    
+    Used when the API is unavailable. Entries stay in storage for
+    CACHE_STALE_RETENTION hours after they expire, and are not put back in
+    the memory cache.
     
     Args:
         cache_key (str): The unique key for the search query
-        results (list): The search results to cache
+        fallback_keys (list): Older keys for the same search, tried if cache_key misses
         
     Returns:
-        bool: True if caching was successful, False otherwise
+        CachedResults: The entry, possibly expired, or None if there is none
     """
-    # Import here to avoid circular imports
-    from models import CachedSearch
-    from app import db
-    from supabase_client import cache_search_results, supabase_client
+    keys = [cache_key] + [key for key in fallback_keys if key != cache_key]
     
     try:
-        # Convert results to JSON string
-        results_json = json.dumps(results)
-        
-        # Try to cache in Supabase first if available
-        supabase_success = False
-        if supabase_client:
-            supabase_cache = cache_search_results(cache_key, results_json, CACHE_DURATION)
-            supabase_success = supabase_cache is not None
-            if supabase_success:
-                logging.info(f"Successfully cached results in Supabase for key: {cache_key}")
-        
-        # Always cache in SQLAlchemy too for local access
-        # Check if we already have a cache entry for this key
-        existing_cache = db.session.query(CachedSearch).filter(
-            CachedSearch.cache_key == cache_key
-        ).first()
-        
-        # Calculate the expiration time
-        expires_at = datetime.utcnow() + timedelta(hours=CACHE_DURATION)
-        
-        # If entry exists, update it
-        if existing_cache:
-            existing_cache.results = results_json
-            existing_cache.created_at = datetime.utcnow()
-            existing_cache.expires_at = expires_at
-        else:
-            # Create a new cache entry
-            new_cache = CachedSearch(
-                cache_key=cache_key,
-                results=results_json,
-                created_at=datetime.utcnow(),
-                expires_at=expires_at
-            )
-            db.session.add(new_cache)
-            
-        # Commit the changes
-        db.session.commit()
-        logging.info(f"Successfully cached results in SQLAlchemy for key: {cache_key}")
-        return True
+        cached_entry = get_storage().get_cached(keys, clock() - timedelta(hours=CACHE_STALE_RETENTION))
+        if cached_entry is None:
+            return None
+        
+        logging.info(f"Found retained cache entry for key: {cached_entry.cache_key}")
+        return CachedResults(
+            products=normalize_products(cache_codec.decode(cached_entry.payload)),
+            created_at=_to_timestamp(cached_entry.created_at),
+            expires_at=_to_timestamp(cached_entry.expires_at),
+            content_hash=_content_hash(cached_entry.payload)
+        )
         
     except Exception as e:
-        logging.error(f"Error caching results: {str(e)}")
-        # Try to rollback if the error was in SQLAlchemy
-        try:
-            db.session.rollback()
-        except:
-            pass
-        return False
+        logging.error(f"Error retrieving retained cache entry: {str(e)}")
+        return None
 
-def clear_old_cache():
+def get_cached_results(cache_key, fallback_keys=(), refresh=None):
     """
-    Remove all expired cache entries from the database.
+    Get cached search results from the database.
     
+    Args:
+        cache_key (str): The unique key for the search query
+        fallback_keys (list): Older keys for the same search, tried if cache_key misses
+        refresh (callable): Fetches and caches fresh results for a stale entry
+        
     Returns:
-        bool: True if cache clearing was successful, False otherwise
+        list: The cached Product objects or None if not found/expired
+    """
+    entry = get_cached_entry(cache_key, fallback_keys, refresh)
+    return entry.products if entry is not None else None
+
+def _encode_results(results):
+    """Normalize results and encode the compact form with the configured codec"""
+    results = normalize_products(results)
+    return results, cache_codec.encode(serialize_products(results))
+
+def _remember_results(cache_key, results, payload, created_at):
+    """Populate the in-process cache so this worker serves repeats from memory"""
+    negative_cache.delete(cache_key)
+    created_at = _to_timestamp(created_at)
+    l1_cache.set(cache_key, CachedResults(
+        products=results,
+        created_at=created_at,
+        expires_at=created_at + CACHE_DURATION * 3600,
+        content_hash=_content_hash(payload)
+    ), size=len(payload), expires_at=created_at + CACHE_DURATION * 3600)
+
+def _store_results_batch(items):
     """
+    Write encoded payloads to storage in one bulk write.
+    
+    Args:
+        items (list): (cache_key, payload, created_at) tuples
+        
+    Returns:
+        int: Number of items that failed to cache
+    """
+    # Later writes for the same key win
+    latest = {cache_key: (payload, created_at) for cache_key, payload, created_at in items}
+    
+    try:
+        get_storage().store_cached(
+            [(cache_key, payload, created_at) for cache_key, (payload, created_at) in latest.items()],
+            CACHE_DURATION
+        )
+        logging.info(f"Successfully cached {len(latest)} results")
+        return 0
+    except Exception as e:
+        logging.error(f"Error caching results: {str(e)}")
+        return len(items)
+
+write_queue.register("cache", _store_results_batch)
+
+def _index_results(results, search_params):
+    """Feed API results to the local product index"""
+    if search_params is None:
+        return
     # Import here to avoid circular imports
-    from models import CachedSearch
-    from app import db
-    from supabase_client import clear_expired_cache, supabase_client
+    from product_index import index_search_results
+    index_search_results(results, search_params)
+
+def cache_results(cache_key, results, search_params=None):
+    """
+    Cache search results in the database.
     
-    # Initialize success flags
-    supabase_success = False
-    sqlalchemy_success = False
+    Args:
+        cache_key (str): The unique key for the search query
+        results (list): The search results to cache, as Product objects or API dictionaries
+        search_params (dict): The API search the results came from, given to also add
+            them to the product index
+        
+    Returns:
+        bool: True if caching was successful, False otherwise
+    """
+    _index_results(results, search_params)
+    try:
+        results, payload = _encode_results(results)
+    except Exception as e:
+        logging.error(f"Error encoding results: {str(e)}")
+        return False
     
-    # Part 1: Try to clear from Supabase
+    now = clock()
+    _remember_results(cache_key, results, payload, now)
+    return _store_results_batch([(cache_key, payload, now)]) == 0
+
+def queue_cache_results(cache_key, results, created_at=None, search_params=None):
+    """
+    Cache search results in memory now and in the database in the background.
+    
+    Args:
+        cache_key (str): The unique key for the search query
+        results (list): The search results to cache, as Product objects or API dictionaries
+        created_at (float): POSIX timestamp the results date from, defaults to now. Results
+            derived from another cache entry pass its created_at so both expire together
+        search_params (dict): The API search the results came from, given to also add
+            them to the product index
+        
+    Returns:
+        bool: True if the database write was queued (or written inline), False if dropped
+    """
+    _index_results(results, search_params)
     try:
-        if supabase_client:
-            supabase_cleared = clear_expired_cache()
-            if supabase_cleared >= 0:  # -1 indicates error
-                supabase_success = True
-                logging.info(f"Cleared {supabase_cleared} expired cache entries from Supabase")
-            else:
-                logging.warning("Failed to clear Supabase cache, continuing with SQLAlchemy")
+        results, payload = _encode_results(results)
     except Exception as e:
-        logging.error(f"Error clearing Supabase cache: {str(e)}")
-        # Continue to SQLAlchemy regardless of Supabase error
+        logging.error(f"Error encoding results: {str(e)}")
+        return False
+    
+    if created_at is None:
+        now = clock()
+    else:
+        now = datetime.fromtimestamp(created_at, timezone.utc).replace(tzinfo=None)
+    _remember_results(cache_key, results, payload, now)
+    return write_queue.submit("cache", (cache_key, payload, now))
+
+def remember_refined(cache_key, products, base_entry):
+    """
+    Keep a local refinement of a cached search in this worker's refined_cache.
+    
+    Args:
+        cache_key (str): The canonical key of the refined search
+        products (list): The refined Product objects
+        base_entry (CachedResults): The cached search they were refined from
+        
+    Returns:
+        CachedResults: The refinement, dated and expiring with its base entry
+    """
+    products, payload = _encode_results(products)
+    entry = CachedResults(
+        products=products,
+        created_at=base_entry.created_at,
+        expires_at=base_entry.expires_at,
+        content_hash=_content_hash(payload)
+    )
+    refined_cache.set(cache_key, entry, size=len(payload),
+                      expires_at=min(base_entry.expires_at, current_timestamp() + REFINED_TTL))
+    return entry
+
+def get_refined_entry(cache_key):
+    """
+    Get a local refinement kept by remember_refined.
+    
+    Args:
+        cache_key (str): The canonical key of the refined search
+        
+    Returns:
+        CachedResults: The refinement, or None
+    """
+    return refined_cache.get(cache_key)
+
+def purge_expired_cache(chunk_size=PURGE_CHUNK_SIZE, pause=PURGE_PAUSE):
+    """
+    Delete cache entries that expired more than CACHE_STALE_RETENTION hours ago, in bounded chunks.
+    
+    Chunks commit separately and the purge sleeps between them, which keeps
+    transactions short while traffic is live.
+    
+    Args:
+        chunk_size (int): Maximum rows deleted per transaction
+        pause (float): Seconds to sleep between chunks
+        
+    Returns:
+        dict: Rows and approximate bytes freed in the primary store, backend-specific
+            counts, and whether the purge succeeded
+    """
+    # One cutoff for every store so they purge the same entries, keeping
+    # recently expired ones to serve while the API is unavailable
+    cutoff = clock() - timedelta(hours=CACHE_STALE_RETENTION)
     
-    # Part 2: Try to clear from SQLAlchemy
     try:
-        # Find all expired cache entries with a timeout to avoid freezing
-        expired_entries = db.session.query(CachedSearch).filter(
-            CachedSearch.expires_at < datetime.utcnow()
-        ).all()
-        
-        if expired_entries:
-            entry_count = len(expired_entries)
-            # Delete in smaller batches to reduce transaction size
-            batch_size = 100
-            for i in range(0, entry_count, batch_size):
-                batch = expired_entries[i:i+batch_size]
-                try:
-                    for entry in batch:
-                        db.session.delete(entry)
-                    db.session.commit()
-                    logging.info(f"Cleared batch of {len(batch)} expired cache entries")
-                except Exception as batch_error:
-                    db.session.rollback()
-                    logging.error(f"Error clearing batch: {str(batch_error)}")
-            
-            sqlalchemy_success = True
-            logging.info(f"Cleared {entry_count} expired cache entries from SQLAlchemy")
-        else:
-            sqlalchemy_success = True
-            logging.info("No expired cache entries found in SQLAlchemy")
+        stats = get_storage().purge_expired(cutoff, chunk_size, pause)
+        stats["ok"] = True
+        logging.info(f"Cleared {stats['rows']} expired cache entries ({stats['bytes']} bytes)")
     except Exception as e:
-        logging.error(f"Error clearing SQLAlchemy cache: {str(e)}")
-        try:
-            db.session.rollback()
-        except:
-            pass
+        logging.error(f"Error clearing cache: {str(e)}")
+        stats = {"rows": 0, "bytes": 0, "ok": False}
+    
+    return stats
+
+def clear_old_cache():
+    """
+    Remove expired cache entries past their retention from the database.
     
-    # Return True if either database was cleared successfully
-    return supabase_success or sqlalchemy_success
+    Returns:
+        bool: True if cache clearing was successful, False otherwise
+    """
+    return purge_expired_cache()["ok"]
@@ -0,0 +1,226 @@
+import logging
+import os
+import random
+import threading
+import time
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG, format="%(asctime)s - %(levelname)s - %(message)s")
+
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get("BREAKER_FAILURE_THRESHOLD", 5))  # Consecutive failures that open the circuit
+BREAKER_RESET_TIMEOUT = float(os.environ.get("BREAKER_RESET_TIMEOUT", 30))  # Seconds open before a probe is let through
+BREAKER_MAX_RESET_TIMEOUT = float(os.environ.get("BREAKER_MAX_RESET_TIMEOUT", 300))  # Cap as failed probes double it
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling an endpoint whose circuit is open"""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"Circuit for {name} is open, retry in {retry_after:.1f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Stop calling an endpoint that keeps failing, and probe it until it recovers.
+
+    Closed, every call goes through and consecutive failures are counted.
+    After failure_threshold of them the circuit opens and calls fail at once
+    with CircuitOpen. Once reset_timeout has passed it is half-open: a single
+    probe call is let through, closing the circuit if it succeeds and
+    reopening it, for twice as long, if it fails. before_call hands the probe
+    a token, and only outcomes recorded with it move the circuit out of
+    half-open: calls that started before the circuit opened and finish late
+    can't close or reopen it, or free the probe slot.
+
+    State is per process; each worker finds out about an outage by itself.
+    """
+
+    def __init__(self, name, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT,
+                 max_reset_timeout=BREAKER_MAX_RESET_TIMEOUT, clock=time.monotonic):
+        """
+        Args:
+            name (str): The endpoint, for logs and stats
+            failure_threshold (int): Consecutive failures that open the circuit
+            reset_timeout (float): Seconds the circuit stays open before a probe
+            max_reset_timeout (float): Longest the open period grows to after failed probes
+            clock (callable): Returns monotonic seconds
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.clock = clock
+
+        self._state = CLOSED
+        self._failures = 0
+        self._open_for = reset_timeout
+        self._opened_at = 0.0
+        self._probe = None  # Token of the probe in flight
+        self._lock = threading.Lock()
+
+        # Counters
+        self.opened = 0
+        self.rejected = 0
+        self.probes = 0
+
+    @property
+    def state(self):
+        """CLOSED, OPEN or HALF_OPEN"""
+        with self._lock:
+            if self._state == OPEN and self.clock() - self._opened_at >= self._open_for:
+                return HALF_OPEN
+            return self._state
+
+    def before_call(self):
+        """
+        Check whether a call may go ahead, claiming the probe when half-open.
+
+        Returns:
+            int: The probe token if this call is the half-open probe, else None. Pass
+                it to record_success, record_failure or release
+
+        Raises:
+            CircuitOpen: If the circuit is open, or half-open with a probe already running
+        """
+        with self._lock:
+            if self._state == CLOSED:
+                return None
+
+            elapsed = self.clock() - self._opened_at
+            if elapsed >= self._open_for and self._probe is None:
+                self._state = HALF_OPEN
+                self.probes += 1
+                self._probe = self.probes
+                logging.info(f"Circuit for {self.name} half-open, sending a probe")
+                return self._probe
+
+            self.rejected += 1
+            raise CircuitOpen(self.name, max(0.0, self._open_for - elapsed))
+
+    def _is_probe(self, probe):
+        return probe is not None and probe == self._probe
+
+    def record_success(self, probe=None):
+        """
+        Record a call that reached the endpoint and got a usable answer.
+
+        Args:
+            probe (int): The call's before_call token
+        """
+        with self._lock:
+            if self._state != CLOSED:
+                if not self._is_probe(probe):
+                    return  # Only the probe's answer says the endpoint recovered
+                logging.info(f"Circuit for {self.name} closed, endpoint recovered")
+            self._state = CLOSED
+            self._failures = 0
+            self._open_for = self.reset_timeout
+            self._probe = None
+
+    def release(self, probe=None):
+        """
+        Give back a call that never got an answer either way, e.g. a rate-limited probe.
+
+        Args:
+            probe (int): The call's before_call token
+        """
+        with self._lock:
+            if self._state == HALF_OPEN and self._is_probe(probe):
+                self._state = OPEN
+                self._probe = None
+
+    def record_failure(self, probe=None):
+        """
+        Record a failed call, opening the circuit on a failed probe or too many failures.
+
+        Args:
+            probe (int): The call's before_call token
+        """
+        with self._lock:
+            if self._state == HALF_OPEN:
+                if not self._is_probe(probe):
+                    return  # A call from before the circuit opened - the probe decides
+                self._failures += 1
+                self._open_for = min(self._open_for * 2, self.max_reset_timeout)
+            else:
+                self._failures += 1
+                if self._state == OPEN or self._failures < self.failure_threshold:
+                    return
+
+            self._state = OPEN
+            self._opened_at = self.clock()
+            self._probe = None
+            self.opened += 1
+            logging.warning(f"Circuit for {self.name} opened after {self._failures} failures, "
+                            f"probing again in {self._open_for:g}s")
+
+    def stats(self):
+        """
+        Get the circuit state and counters.
+
+        Returns:
+            dict: State, consecutive failures, open period and counts
+        """
+        state = self.state
+        with self._lock:
+            return {
+                "state": state,
+                "failures": self._failures,
+                "open_for": self._open_for,
+                "opened": self.opened,
+                "rejected": self.rejected,
+                "probes": self.probes
+            }
+
+
+def backoff_delay(retry, base_delay, max_delay):
+    """
+    Seconds to wait before a retry: exponential backoff with full jitter.
+
+    Args:
+        retry (int): 0 for the first retry, 1 for the second, ...
+        base_delay (float): Upper bound of the first delay
+        max_delay (float): Upper bound of any delay
+
+    Returns:
+        float: A random delay between 0 and min(max_delay, base_delay * 2 ** retry)
+    """
+    return random.uniform(0, min(max_delay, base_delay * 2 ** retry))
+
+
+# One breaker per upstream endpoint, created on first use
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+def get_breaker(name):
+    """
+    Get the process-wide circuit breaker for an endpoint.
+
+    Args:
+        name (str): The endpoint, e.g. its URL
+
+    Returns:
+        CircuitBreaker: The breaker for the endpoint
+    """
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name)
+        return breaker
+
+def breaker_stats():
+    """
+    Get the state of every endpoint's breaker.
+
+    Returns:
+        dict: Endpoint -> CircuitBreaker.stats()
+    """
+    with _breakers_lock:
+        breakers = dict(_breakers)
+    return {name: breaker.stats() for name, breaker in breakers.items()}
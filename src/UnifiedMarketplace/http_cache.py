@@ -0,0 +1,114 @@
+import functools
+import hashlib
+import logging
+import os
+from datetime import datetime, timezone
+
+from flask import make_response, request
+from werkzeug.http import is_resource_modified
+
+from cache_manager import current_timestamp
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Set to "false" to send search pages and API responses without validators
+HTTP_CACHING = os.environ.get("HTTP_CACHING", "true").lower() == "true"
+
+
+@functools.lru_cache(maxsize=None)
+def templates_modified_at(folder):
+    """
+    Get the newest modification time of the templates in a folder.
+
+    Read once per process, so a deploy that changes the templates also
+    changes the validators of pages rendered from them.
+
+    Args:
+        folder (str): The template folder
+
+    Returns:
+        float: POSIX timestamp, 0 if the folder has no files
+    """
+    newest = 0.0
+    for root, _, files in os.walk(folder):
+        for name in files:
+            newest = max(newest, os.path.getmtime(os.path.join(root, name)))
+    return newest
+
+def make_etag(entry, variant=""):
+    """
+    Build the strong ETag of a response rendered from a cache entry.
+
+    Args:
+        entry (CachedResults): The cache entry the response shows
+        variant (str): Anything else the body depends on, e.g. the logged-in user
+
+    Returns:
+        str: The unquoted entity tag
+    """
+    data = f"{entry.content_hash}:{entry.created_at:.6f}:{variant}"
+    if entry.expired:
+        data += ":stale"  # Expired entries are shown marked stale, which is a different body
+    return hashlib.blake2b(data.encode("utf-8"), digest_size=16).hexdigest()
+
+def cache_control(entry, now, private=False):
+    """
+    Build the Cache-Control header for a cache entry.
+
+    Clients may reuse the response until the entry's soft TTL, then serve it
+    stale while revalidating until the hard TTL, matching what the server does.
+    Expired entries, served while the API is down, must always be revalidated.
+
+    Args:
+        entry (CachedResults): The cache entry the response shows
+        now (float): Current POSIX timestamp
+        private (bool): Only the user's browser may store the response
+
+    Returns:
+        str: The header value
+    """
+    scope = "private" if private else "public"
+    if entry.expires_at <= now:
+        return f"{scope}, no-cache"
+    max_age = max(0, int(entry.soft_expires_at - now))
+    stale_while_revalidate = max(0, int(entry.expires_at - max(now, entry.soft_expires_at)))
+    return f"{scope}, max-age={max_age}, stale-while-revalidate={stale_while_revalidate}"
+
+def conditional_response(entry, render, variant="", last_modified=None, private=False, vary=()):
+    """
+    Answer a GET from a cache entry, with 304 Not Modified when the client's copy is current.
+
+    The validators come from the entry alone, so a 304 is sent without
+    calling render.
+
+    Args:
+        entry (CachedResults): The cache entry, or None to render without caching headers
+        render (callable): Builds the full response body or response
+        variant (str): Passed to make_etag
+        last_modified (float): Other POSIX timestamp the body depends on, Last-Modified
+            is the later of this and the entry's created_at
+        private (bool): Passed to cache_control
+        vary (tuple): Request headers the body depends on, e.g. ("Cookie",)
+
+    Returns:
+        Response: The 200 or 304 response
+    """
+    if entry is None or not HTTP_CACHING:
+        return make_response(render())
+
+    etag = make_etag(entry, variant)
+    modified = datetime.fromtimestamp(int(max(entry.created_at, last_modified or 0)), tz=timezone.utc)
+
+    if not is_resource_modified(request.environ, etag=etag, last_modified=modified):
+        logging.info(f"Not modified: {request.full_path}")
+        response = make_response("", 304)
+    else:
+        response = make_response(render())
+
+    response.set_etag(etag)
+    response.last_modified = modified
+    response.headers["Cache-Control"] = cache_control(entry, current_timestamp(), private=private)
+    for header in vary:
+        response.vary.add(header)
+    return response
@@ -0,0 +1,326 @@
+import atexit
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_, update
+from sqlalchemy.exc import IntegrityError
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Import models and db within functions to avoid circular imports
+
+SCHEDULER_TICK = float(os.environ.get("MAINTENANCE_TICK", 30))  # Seconds between checks for due jobs
+SCHEDULER_TICK_JITTER = float(os.environ.get("MAINTENANCE_TICK_JITTER", 10))
+LEADER_LEASE_SECONDS = float(os.environ.get("MAINTENANCE_LEADER_LEASE", 90))  # Must exceed the tick, renewed while jobs run
+
+# Row name used for the cluster-wide leader lease
+LEADER_NAME = "leader"
+
+
+@dataclass
+class Job:
+    """A periodic maintenance job"""
+    name: str
+    func: object  # Callable, returns an optional JSON-compatible summary
+    interval: float  # Seconds between runs
+    jitter: float = 0  # Random extra delay so workers across hosts don't line up
+    timeout: float = 1800  # Job lease length - no other worker starts the job while it is held
+
+
+class MaintenanceScheduler:
+    """
+    Run maintenance jobs on one worker per cluster.
+
+    Every worker runs a scheduler thread, but only the holder of the
+    database leader lease runs jobs. The leader keeps renewing its lease
+    while a job runs, so long jobs don't hand leadership to another worker
+    mid-run. Each run also takes a per-job lease,
+    so even if leadership changes mid-run the same job never runs twice at
+    once. Last run time, duration and outcome are recorded per job.
+    """
+
+    def __init__(self, tick=SCHEDULER_TICK, tick_jitter=SCHEDULER_TICK_JITTER,
+                 leader_lease=LEADER_LEASE_SECONDS):
+        """
+        Args:
+            tick (float): Seconds between checks for due jobs
+            tick_jitter (float): Random extra seconds added to each tick
+            leader_lease (float): Seconds the leader lease lasts without renewal
+        """
+        self.tick = tick
+        self.tick_jitter = tick_jitter
+        self.leader_lease = leader_lease
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        self.jobs = {}
+        self.is_leader = False
+        self._next_due = {}  # Job name -> earliest local time to consider it, includes jitter
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add_job(self, job):
+        """Register a job"""
+        self.jobs[job.name] = job
+
+    def start(self):
+        """Start the scheduler thread"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="maintenance-scheduler", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+        logging.info(f"Started maintenance scheduler as {self.holder}")
+
+    def stop(self, timeout=10):
+        """Stop the scheduler thread and give up leadership"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+        if self.is_leader:
+            try:
+                self._with_app_context(lambda: self._release(LEADER_NAME))
+            except Exception as e:
+                logging.error(f"Error releasing maintenance leadership: {e}")
+            self.is_leader = False
+
+    def run_once(self):
+        """
+        Renew or acquire leadership, then run every due job if leader.
+
+        Returns:
+            list: Names of the jobs that ran
+        """
+        self.is_leader = self._acquire(LEADER_NAME, self.leader_lease)
+        if not self.is_leader:
+            return []
+
+        ran = []
+        for job in self.jobs.values():
+            if self._stop.is_set() or not self.is_leader:
+                break  # Lost the lease while a job ran - the new leader takes over
+            if self._run_if_due(job):
+                ran.append(job.name)
+        return ran
+
+    def status(self):
+        """
+        Get the recorded state of every job.
+
+        Returns:
+            list: One dictionary per job with its last run details
+        """
+        # Import here to avoid circular imports
+        from models import MaintenanceJob
+        from app import db
+
+        rows = {row.name: row for row in db.session.query(MaintenanceJob).all()}
+        return [
+            {
+                "name": name,
+                "interval": job.interval,
+                "last_run_at": rows[name].last_run_at.isoformat() if name in rows and rows[name].last_run_at else None,
+                "last_duration": rows[name].last_duration if name in rows else None,
+                "last_status": rows[name].last_status if name in rows else None,
+                "last_result": rows[name].last_result if name in rows else None,
+                "running_on": rows[name].lease_holder if name in rows and rows[name].lease_expires_at
+                    and rows[name].lease_expires_at > datetime.utcnow() else None
+            }
+            for name, job in self.jobs.items()
+        ]
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self._with_app_context(self.run_once)
+            except Exception as e:
+                logging.error(f"Error in maintenance scheduler: {e}")
+            self._stop.wait(self.tick + random.uniform(0, self.tick_jitter))
+
+    def _run_if_due(self, job):
+        # Import here to avoid circular imports
+        from models import MaintenanceJob
+        from app import db
+
+        if time.monotonic() < self._next_due.get(job.name, 0):
+            return False
+
+        row = db.session.get(MaintenanceJob, job.name)
+        if row is not None and row.last_run_at is not None:
+            remaining = (row.last_run_at + timedelta(seconds=job.interval) - datetime.utcnow()).total_seconds()
+            if remaining > 0:
+                self._next_due[job.name] = time.monotonic() + remaining + random.uniform(0, job.jitter)
+                return False
+
+        if not self._acquire(job.name, job.timeout):
+            return False  # Still running elsewhere
+
+        logging.info(f"Running maintenance job: {job.name}")
+        started_at = datetime.utcnow()
+        start = time.monotonic()
+        try:
+            with self._leader_heartbeat():
+                result = job.func()
+            status, summary = "ok", json.dumps(result, default=str) if result is not None else None
+        except Exception as e:
+            logging.error(f"Maintenance job {job.name} failed: {e}")
+            db.session.rollback()
+            status, summary = "error", str(e)
+        duration = time.monotonic() - start
+
+        db.session.execute(
+            update(MaintenanceJob)
+            .where(MaintenanceJob.name == job.name)
+            .values(last_run_at=started_at, last_duration=duration, last_status=status,
+                    last_result=summary, lease_expires_at=datetime.utcnow())
+        )
+        db.session.commit()
+        self._next_due[job.name] = time.monotonic() + job.interval + random.uniform(0, job.jitter)
+        logging.info(f"Maintenance job {job.name} finished with status {status} in {duration:.2f}s")
+        return True
+
+    @contextmanager
+    def _leader_heartbeat(self):
+        """Renew the leader lease from another thread while a job runs, however long it takes"""
+        done = threading.Event()
+
+        def renew():
+            while not done.wait(self.leader_lease / 3):
+                try:
+                    self.is_leader = self._with_app_context(lambda: self._acquire(LEADER_NAME, self.leader_lease))
+                except Exception as e:
+                    logging.error(f"Error renewing maintenance leadership: {e}")
+                if not self.is_leader:
+                    logging.warning(f"Lost maintenance leadership while a job was running on {self.holder}")
+                    return
+
+        thread = threading.Thread(target=renew, name="maintenance-heartbeat", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            done.set()
+            thread.join()
+
+    def _acquire(self, name, seconds):
+        """Take or renew the named lease; True if this worker holds it"""
+        # Import here to avoid circular imports
+        from models import MaintenanceJob
+        from app import db
+
+        now = datetime.utcnow()
+        try:
+            result = db.session.execute(
+                update(MaintenanceJob)
+                .where(
+                    MaintenanceJob.name == name,
+                    or_(
+                        MaintenanceJob.lease_holder == self.holder,
+                        MaintenanceJob.lease_expires_at.is_(None),
+                        MaintenanceJob.lease_expires_at < now
+                    )
+                )
+                .values(lease_holder=self.holder, lease_expires_at=now + timedelta(seconds=seconds))
+            )
+            db.session.commit()
+            if result.rowcount == 1:
+                return True
+
+            if db.session.get(MaintenanceJob, name) is not None:
+                return False
+
+            # First run anywhere - the primary key decides who wins the race
+            db.session.add(MaintenanceJob(name=name, lease_holder=self.holder,
+                                          lease_expires_at=now + timedelta(seconds=seconds)))
+            db.session.commit()
+            return True
+        except IntegrityError:
+            db.session.rollback()
+            return False
+
+    def _release(self, name):
+        # Import here to avoid circular imports
+        from models import MaintenanceJob
+        from app import db
+
+        db.session.execute(
+            update(MaintenanceJob)
+            .where(MaintenanceJob.name == name, MaintenanceJob.lease_holder == self.holder)
+            .values(lease_expires_at=datetime.utcnow())
+        )
+        db.session.commit()
+
+    def _with_app_context(self, fn):
+        # Import here to avoid circular imports
+        from app import app
+
+        with app.app_context():
+            return fn()
+
+
+def _purge_cache():
+    from cache_manager import purge_expired_cache
+    return purge_expired_cache()
+
+def _maintain_partitions():
+    from migrations import ensure_cache_partitions
+    return {"partitions_created": ensure_cache_partitions()}
+
+def _cache_stats_rollup():
+    """Record cache and history table sizes"""
+    # Import here to avoid circular imports
+    from models import CachedSearch, SearchHistory
+    from app import db
+
+    now = datetime.utcnow()
+    return {
+        "cache_entries": db.session.query(CachedSearch).count(),
+        "expired_entries": db.session.query(CachedSearch).filter(CachedSearch.expires_at < now).count(),
+        "searches_last_24h": db.session.query(SearchHistory).filter(
+            SearchHistory.created_at >= now - timedelta(hours=24)
+        ).count()
+    }
+
+def _purge_search_log():
+    from search_log import purge_search_log
+    return purge_search_log()
+
+def _warm_cache():
+    from warmup import warm_cache
+    return warm_cache()
+
+
+# Shared scheduler with the default maintenance jobs
+maintenance_scheduler = MaintenanceScheduler()
+maintenance_scheduler.add_job(Job(
+    "cache-purge", _purge_cache,
+    interval=float(os.environ.get("CACHE_PURGE_INTERVAL", 3600)), jitter=300
+))
+maintenance_scheduler.add_job(Job(
+    "cache-partitions", _maintain_partitions,
+    interval=float(os.environ.get("CACHE_PARTITION_INTERVAL", 6 * 3600)), jitter=600
+))
+maintenance_scheduler.add_job(Job(
+    "stats-rollup", _cache_stats_rollup,
+    interval=float(os.environ.get("STATS_ROLLUP_INTERVAL", 900)), jitter=60
+))
+maintenance_scheduler.add_job(Job(
+    "search-log-purge", _purge_search_log,
+    interval=float(os.environ.get("SEARCH_LOG_PURGE_INTERVAL", 3600)), jitter=300
+))
+maintenance_scheduler.add_job(Job(
+    "cache-warmup", _warm_cache,
+    interval=float(os.environ.get("WARMUP_INTERVAL", 3600)), jitter=300, timeout=900
+))
@@ -0,0 +1,130 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Bounded, thread-safe in-memory LRU cache with per-entry expiry.
+
+    Entries are evicted least-recently-used first once either the entry count
+    or the approximate total size in bytes goes over its limit.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024, ttl=3600, clock=time.time):
+        """
+        Args:
+            max_entries (int): Maximum number of entries to hold
+            max_bytes (int): Maximum approximate total size of all entries
+            ttl (float): Default time to live in seconds
+            clock (callable): Returns the current time in seconds
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.clock = clock
+
+        self._entries = OrderedDict()  # key -> (value, size, expires_at)
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        """
+        Get a value and mark it as recently used.
+
+        Args:
+            key (str): The cache key
+
+        Returns:
+            The cached value or None if not found/expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, size, expires_at = entry
+            if expires_at <= self.clock():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, size=1, ttl=None, expires_at=None):
+        """
+        Store a value, evicting old entries if the cache is over its limits.
+
+        Args:
+            key (str): The cache key
+            value: The value to store
+            size (int): Approximate size of the value in bytes
+            ttl (float): Time to live in seconds, defaults to the cache ttl
+            expires_at (float): Absolute expiry time, overrides ttl when given
+        """
+        if expires_at is None:
+            expires_at = self.clock() + (self.ttl if ttl is None else ttl)
+
+        with self._lock:
+            # A value bigger than the whole cache would just evict everything else
+            if size > self.max_bytes:
+                self._remove(key)
+                return
+
+            self._remove(key)
+            self._entries[key] = (value, size, expires_at)
+            self.total_bytes += size
+
+            while len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self.evictions += 1
+
+    def delete(self, key):
+        """Remove a key if present"""
+        with self._lock:
+            self._remove(key)
+
+    def clear(self):
+        """Remove all entries"""
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        """
+        Get cache counters.
+
+        Returns:
+            dict: Entry count, size and hit/miss/eviction counters
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.total_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, key):
+        # Caller must hold the lock
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry[1]
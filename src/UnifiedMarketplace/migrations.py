@@ -0,0 +1,289 @@
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import inspect, text
+
+import cache_codec
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Import db within functions to avoid circular imports
+
+def migrate_cache_payload(batch_size=500):
+    """
+    Move cached search results from the JSON text column to the binary payload column.
+
+    Safe to run repeatedly and while traffic is live: the column is added if
+    missing, NOT NULL is dropped from results (on SQLite by rebuilding the
+    table), rows are converted in primary key order in small batches, and
+    current readers handle both formats throughout. Workers still running
+    older code treat converted rows as cache misses. The emptied results
+    column is kept until CachedSearch.results is removed from the model.
+
+    Args:
+        batch_size (int): Rows converted per transaction
+
+    Returns:
+        int: Number of rows converted
+    """
+    # Import here to avoid circular imports
+    from app import db
+
+    engine = db.engine
+    dialect = engine.dialect.name
+    table = "cached_search"
+    columns = {column["name"]: column for column in inspect(engine).get_columns(table)}
+
+    with engine.begin() as connection:
+        if "payload" not in columns:
+            binary_type = "BYTEA" if dialect == "postgresql" else "BLOB"
+            logging.info(f"Adding payload column to {table}")
+            connection.execute(text(f"ALTER TABLE {table} ADD COLUMN payload {binary_type}"))
+
+        if "results" in columns and not columns["results"]["nullable"]:
+            if dialect == "postgresql":
+                connection.execute(text(f"ALTER TABLE {table} ALTER COLUMN results DROP NOT NULL"))
+            else:
+                _rebuild_cache_table(connection)
+
+    converted = 0
+    last_id = 0
+    while True:
+        with engine.begin() as connection:
+            rows = connection.execute(
+                text(f"SELECT id, results FROM {table} "
+                     "WHERE id > :last_id AND payload IS NULL AND results IS NOT NULL "
+                     "ORDER BY id LIMIT :limit"),
+                {"last_id": last_id, "limit": batch_size}
+            ).all()
+            if not rows:
+                break
+
+            for row_id, results in rows:
+                payload = cache_codec.encode(cache_codec.decode(results))
+                connection.execute(
+                    text(f"UPDATE {table} SET payload = :payload, results = NULL "
+                         "WHERE id = :id AND payload IS NULL"),
+                    {"payload": payload, "id": row_id}
+                )
+            last_id = rows[-1][0]
+            converted += len(rows)
+            logging.info(f"Converted {converted} cached searches to binary payloads")
+
+    return converted
+
+def _rebuild_cache_table(connection):
+    """
+    Recreate cached_search from the model, keeping its rows.
+
+    SQLite can't drop NOT NULL in place, so the table is renamed, the current
+    one created next to it (indexes included), the rows copied over and the
+    old table dropped, all in the caller's transaction.
+    """
+    # Import here to avoid circular imports
+    from models import CachedSearch
+
+    table = CachedSearch.__table__.name
+    logging.info(f"Rebuilding {table} to make results nullable")
+    connection.execute(text(f"ALTER TABLE {table} RENAME TO {table}_old"))
+
+    # Index names are global in SQLite, so the old table's would clash with the new ones
+    indexes = connection.execute(text(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :table AND sql IS NOT NULL"
+    ), {"table": f"{table}_old"}).scalars().all()
+    for name in indexes:
+        connection.execute(text(f"DROP INDEX {name}"))
+
+    CachedSearch.__table__.create(connection)
+    columns = ", ".join(column.name for column in CachedSearch.__table__.columns)
+    connection.execute(text(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {table}_old"))
+    connection.execute(text(f"DROP TABLE {table}_old"))
+
+# Indexes added after the tables were first created - db.create_all only covers new databases
+INDEXES = [
+    ("ix_cached_search_expires_at", "cached_search", "expires_at"),
+    ("ix_search_history_user_id_created_at", "search_history", "user_id, created_at"),
+]
+
+def create_indexes(engine=None):
+    """
+    Add the cache expiry and search history indexes to existing tables.
+
+    On Postgres the indexes are built CONCURRENTLY so the tables stay writable.
+
+    Args:
+        engine: SQLAlchemy engine, defaults to the app's engine
+
+    Returns:
+        list: Names of the indexes that were checked/created
+    """
+    if engine is None:
+        # Import here to avoid circular imports
+        from app import db
+        engine = db.engine
+
+    postgres = engine.dialect.name == "postgresql"
+    partitioned = is_cache_partitioned(engine)
+
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction block
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        for name, table, columns in INDEXES:
+            # Partitioned tables don't support building indexes concurrently
+            concurrently = "CONCURRENTLY " if postgres and not (partitioned and table == "cached_search") else ""
+            logging.info(f"Creating index {name} on {table} ({columns})")
+            connection.execute(text(
+                f"CREATE INDEX {concurrently}IF NOT EXISTS {name} ON {table} ({columns})"
+            ))
+    return [name for name, _, _ in INDEXES]
+
+# Partitioned cache layout (Postgres only): one partition per day of expires_at,
+# so purging expired entries becomes dropping whole partitions
+PARTITION_PREFIX = "cached_search_p"
+
+def is_cache_partitioned(engine):
+    """Check whether cached_search is a partitioned table"""
+    if engine.dialect.name != "postgresql":
+        return False
+    with engine.connect() as connection:
+        return bool(connection.execute(text(
+            "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+            "WHERE c.relname = 'cached_search'"
+        )).scalar())
+
+def ensure_cache_partitions(engine=None, days_ahead=3):
+    """
+    Create the daily cache partitions for today and the next days_ahead days.
+
+    Args:
+        engine: SQLAlchemy engine, defaults to the app's engine
+        days_ahead (int): Number of future days to create partitions for
+
+    Returns:
+        int: Number of partitions created
+    """
+    if engine is None:
+        # Import here to avoid circular imports
+        from app import db
+        engine = db.engine
+
+    if not is_cache_partitioned(engine):
+        return 0
+
+    created = 0
+    today = datetime.utcnow().date()
+    with engine.begin() as connection:
+        for offset in range(days_ahead + 1):
+            day = today + timedelta(days=offset)
+            name = f"{PARTITION_PREFIX}{day:%Y%m%d}"
+            exists = connection.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar()
+            if exists:
+                continue
+            connection.execute(text(
+                f"CREATE TABLE {name} PARTITION OF cached_search "
+                f"FOR VALUES FROM ('{day:%Y-%m-%d}') TO ('{day + timedelta(days=1):%Y-%m-%d}')"
+            ))
+            created += 1
+    return created
+
+def partition_cache_table(engine=None, days_ahead=3):
+    """
+    Convert cached_search to a table range-partitioned by day of expires_at.
+
+    Postgres requires unique constraints on a partitioned table to include
+    the partition key, so cache_key becomes a plain index and the primary
+    key becomes (id, expires_at). On Postgres the cache write path takes a
+    per-key advisory lock and replaces the key's rows, so it does not rely on
+    the unique constraint. Rows are copied in one transaction - run it in a
+    maintenance window on a large cache.
+
+    Args:
+        engine: SQLAlchemy engine, defaults to the app's engine
+        days_ahead (int): Number of future daily partitions to create
+
+    Returns:
+        bool: True if the table was converted, False if unsupported or already partitioned
+    """
+    if engine is None:
+        # Import here to avoid circular imports
+        from app import db
+        engine = db.engine
+
+    if engine.dialect.name != "postgresql":
+        logging.warning("Cache table partitioning requires Postgres")
+        return False
+    if is_cache_partitioned(engine):
+        logging.info("cached_search is already partitioned")
+        return False
+
+    with engine.begin() as connection:
+        connection.execute(text("ALTER TABLE cached_search RENAME TO cached_search_unpartitioned"))
+        connection.execute(text("CREATE SEQUENCE IF NOT EXISTS cached_search_partitioned_id_seq"))
+        connection.execute(text(
+            "CREATE TABLE cached_search ("
+            "id INTEGER NOT NULL DEFAULT nextval('cached_search_partitioned_id_seq'), "
+            "cache_key VARCHAR(512) NOT NULL, "
+            "results TEXT, "
+            "payload BYTEA, "
+            "created_at TIMESTAMP, "
+            "expires_at TIMESTAMP NOT NULL, "
+            "PRIMARY KEY (id, expires_at)"
+            ") PARTITION BY RANGE (expires_at)"
+        ))
+        connection.execute(text("CREATE INDEX ix_cached_search_cache_key ON cached_search (cache_key)"))
+        # Catches rows outside the daily partitions until they are created
+        connection.execute(text(f"CREATE TABLE {PARTITION_PREFIX}default PARTITION OF cached_search DEFAULT"))
+
+    ensure_cache_partitions(engine, days_ahead)
+
+    with engine.begin() as connection:
+        connection.execute(text(
+            "INSERT INTO cached_search (id, cache_key, results, payload, created_at, expires_at) "
+            "SELECT id, cache_key, results, payload, created_at, expires_at FROM cached_search_unpartitioned"
+        ))
+        connection.execute(text(
+            "SELECT setval('cached_search_partitioned_id_seq', "
+            "COALESCE((SELECT MAX(id) FROM cached_search), 0) + 1, false)"
+        ))
+        connection.execute(text("DROP TABLE cached_search_unpartitioned"))
+
+    logging.info("Converted cached_search to a partitioned table")
+    return True
+
+def drop_expired_cache_partitions(before, engine=None):
+    """
+    Drop daily cache partitions whose whole range expired before the cutoff.
+
+    Args:
+        before (datetime): Partitions ending at or before this time are dropped
+        engine: SQLAlchemy engine, defaults to the app's engine
+
+    Returns:
+        int: Number of partitions dropped
+    """
+    if engine is None:
+        # Import here to avoid circular imports
+        from app import db
+        engine = db.engine
+
+    if not is_cache_partitioned(engine):
+        return 0
+
+    dropped = 0
+    with engine.begin() as connection:
+        names = connection.execute(text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class parent ON parent.oid = i.inhparent "
+            "WHERE parent.relname = 'cached_search'"
+        )).scalars().all()
+        for name in names:
+            suffix = name[len(PARTITION_PREFIX):]
+            if not suffix.isdigit():
+                continue  # The default partition
+            day_end = datetime.strptime(suffix, "%Y%m%d") + timedelta(days=1)
+            if day_end <= before:
+                connection.execute(text(f"DROP TABLE {name}"))
+                dropped += 1
+                logging.info(f"Dropped expired cache partition {name}")
+    return dropped
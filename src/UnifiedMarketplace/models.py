@@ -14,6 +14,11 @@ class User(UserMixin, db.Model):
         return f"User('{self.username}', '{self.email}')"
 
 class SearchHistory(db.Model):
+    # /account lists a user's most recent searches
+    __table_args__ = (
+        db.Index('ix_search_history_user_id_created_at', 'user_id', 'created_at'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     query = db.Column(db.String(255), nullable=False)
@@ -23,12 +28,57 @@ class SearchHistory(db.Model):
     def __repr__(self):
         return f"SearchHistory('{self.query}', '{self.created_at}')"
 
+class SearchLog(db.Model):
+    # Searches served per canonical search and hour, signed in or not - popularity for cache
+    # warm-up and prefetching. One row per search and hour, counted up with upserts
+    __table_args__ = (
+        db.UniqueConstraint('cache_key', 'hour', name='uq_search_log_cache_key_hour'),
+        db.Index('ix_search_log_hour', 'hour'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    cache_key = db.Column(db.String(512), nullable=False)  # Canonical cache key of the search
+    hour = db.Column(db.DateTime, nullable=False)  # Start of the UTC hour counted
+    query = db.Column(db.String(255), nullable=False)  # Normalized query text
+    parameters = db.Column(db.Text, nullable=False)  # JSON string of the normalized search parameters
+    searches = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f"SearchLog('{self.query}', '{self.hour}', {self.searches})"
+
 class CachedSearch(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     cache_key = db.Column(db.String(512), unique=True, nullable=False)
-    results = db.Column(db.Text, nullable=False)  # JSON string of search results
+    results = db.Column(db.Text, nullable=True)  # Legacy JSON string of search results
+    payload = db.Column(db.LargeBinary, nullable=True)  # cache_codec-encoded search results
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    expires_at = db.Column(db.DateTime, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)  # Purges filter on expiry
     
     def __repr__(self):
         return f"CachedSearch('{self.cache_key}', '{self.created_at}')"
+
+class MaintenanceJob(db.Model):
+    name = db.Column(db.String(64), primary_key=True)
+    lease_holder = db.Column(db.String(128), nullable=True)  # Worker currently running the job (or leading)
+    lease_expires_at = db.Column(db.DateTime, nullable=True)
+    last_run_at = db.Column(db.DateTime, nullable=True)
+    last_duration = db.Column(db.Float, nullable=True)  # Seconds
+    last_status = db.Column(db.String(16), nullable=True)  # "ok" or "error"
+    last_result = db.Column(db.Text, nullable=True)  # JSON summary or error message
+    
+    def __repr__(self):
+        return f"MaintenanceJob('{self.name}', '{self.last_run_at}')"
+
+class RateLimitBucket(db.Model):
+    # Upstream token bucket shared by all workers, updated with optimistic locking on version
+    name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    tokens = db.Column(db.Float, nullable=False)
+    updated_at = db.Column(db.Float, nullable=False)  # Epoch seconds, sub-second refill needs floats
+    blocked_until = db.Column(db.Float, nullable=False, default=0.0)
+    quota_limit = db.Column(db.Integer, nullable=True)
+    quota_remaining = db.Column(db.Integer, nullable=True)
+    quota_reset_at = db.Column(db.Float, nullable=True)
+    
+    def __repr__(self):
+        return f"RateLimitBucket('{self.name}', {self.tokens})"
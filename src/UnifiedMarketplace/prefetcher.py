@@ -0,0 +1,275 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+from cache_keys import lookup_keys, normalize_search_params
+from refresh_scheduler import RefreshScheduler
+from search_log import popular_queries
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG, format="%(asctime)s - %(levelname)s - %(message)s")
+
+PREFETCH_ENABLED = os.environ.get("PREFETCH_ENABLED", "true").lower() == "true"
+PREFETCH_DEPTH = int(os.environ.get("PREFETCH_DEPTH", 2))  # Pages ahead for popular queries being paged through
+PREFETCH_MAX_PAGE = 100  # The search page's total_pages
+
+# Prefetches that missed the cache, per worker and window - each may cost an API call
+PREFETCH_BUDGET = int(os.environ.get("PREFETCH_BUDGET", 120))
+PREFETCH_BUDGET_WINDOW = float(os.environ.get("PREFETCH_BUDGET_WINDOW", 3600))  # Seconds
+
+# What makes a query popular: searches in the search log, or cache hits in this worker
+PREFETCH_MIN_SEARCHES = int(os.environ.get("PREFETCH_MIN_SEARCHES", 3))
+PREFETCH_HISTORY_HOURS = float(os.environ.get("PREFETCH_HISTORY_HOURS", 24))
+PREFETCH_POPULAR_LIMIT = int(os.environ.get("PREFETCH_POPULAR_LIMIT", 500))  # Most searched queries loaded
+PREFETCH_POPULAR_REFRESH = float(os.environ.get("PREFETCH_POPULAR_REFRESH", 300))  # Seconds between reloads
+PREFETCH_MIN_HITS = int(os.environ.get("PREFETCH_MIN_HITS", 2))
+PREFETCH_MAX_TRACKED = int(os.environ.get("PREFETCH_MAX_TRACKED", 4096))  # Queries with hit counts kept
+
+PREFETCH_WORKERS = int(os.environ.get("PREFETCH_WORKERS", 1))
+PREFETCH_MAX_PENDING = int(os.environ.get("PREFETCH_MAX_PENDING", 8))
+
+# Scheduler key of the background reload of popular queries
+_POPULAR_KEY = "prefetch:popular"
+
+# Outcomes of one prefetch
+FETCHED = "fetched"  # Missed the cache and went to the API
+ALREADY_CACHED = "already_cached"
+SHED = "shed"  # Missed the cache, but the rate limiter or circuit breaker turned the call away
+
+
+def _query_of(search_params):
+    """The normalized query text popularity is counted by"""
+    return normalize_search_params({"query": search_params.get("query", "")})["query"]
+
+
+class Prefetcher:
+    """
+    Fetch the next pages of a search in the background, before they are asked for.
+
+    After page N is served, pages N+1 onward are fetched and cached at
+    prefetch priority, so the rate limiter sheds them first. Only queries
+    worth it are prefetched: one page ahead when someone is paging through
+    results, and up to depth pages ahead for popular queries - those searched
+    often according to the search log, or that keep hitting the cache in this
+    worker. Prefetches that miss the cache are capped per time window: each
+    one reserves budget when it is scheduled, and gets it back if the page
+    turns out to be cached or the call is shed.
+    """
+
+    def __init__(self, depth=PREFETCH_DEPTH, budget=PREFETCH_BUDGET, budget_window=PREFETCH_BUDGET_WINDOW,
+                 min_searches=PREFETCH_MIN_SEARCHES, min_hits=PREFETCH_MIN_HITS,
+                 workers=PREFETCH_WORKERS, max_pending=PREFETCH_MAX_PENDING, enabled=PREFETCH_ENABLED):
+        """
+        Args:
+            depth (int): Pages ahead fetched for popular queries
+            budget (int): Prefetches that may miss the cache per budget_window
+            budget_window (float): Seconds the budget covers
+            min_searches (int): Logged searches that make a query popular
+            min_hits (int): Cache hits in this worker that make a query popular
+            workers (int): Background threads
+            max_pending (int): Prefetches queued or running at once
+            enabled (bool): False to never prefetch
+        """
+        self.depth = depth
+        self.budget = budget
+        self.budget_window = budget_window
+        self.min_searches = min_searches
+        self.min_hits = min_hits
+        self.enabled = enabled
+
+        self._scheduler = RefreshScheduler(max_workers=workers, max_pending=max_pending, name="prefetch")
+        self._lock = threading.Lock()
+        self._spent = deque()  # Monotonic times budget was reserved, by prefetches scheduled or fetched
+        self._hits = {}  # Normalized query -> cache hits in this worker
+        self._popular = frozenset()  # Normalized queries searched at least min_searches times
+        self._popular_loaded_at = None
+
+        # Counters
+        self.scheduled = 0
+        self.fetched = 0  # Prefetches that missed the cache
+        self.already_cached = 0
+        self.shed = 0
+        self.over_budget = 0
+
+    def record_hit(self, search_params):
+        """
+        Count a cache hit for a search's query.
+
+        Args:
+            search_params (dict): The search that was served from the cache
+        """
+        query = _query_of(search_params)
+        with self._lock:
+            if query not in self._hits and len(self._hits) >= PREFETCH_MAX_TRACKED:
+                self._hits.clear()  # Start over rather than track every query ever seen
+            self._hits[query] = self._hits.get(query, 0) + 1
+
+    def is_popular(self, search_params):
+        """
+        Check whether a search's query is searched or hit often enough to prefetch deeper.
+
+        Args:
+            search_params (dict): The search
+
+        Returns:
+            bool: True if the query is popular
+        """
+        query = _query_of(search_params)
+        with self._lock:
+            return query in self._popular or self._hits.get(query, 0) >= self.min_hits
+
+    def pages_ahead(self, search_params):
+        """
+        Get the pages worth prefetching after a search's page was served.
+
+        Args:
+            search_params (dict): The search that was served
+
+        Returns:
+            list: Page numbers, possibly empty
+        """
+        page = int(search_params.get("page", 1) or 1)
+        popular = self.is_popular(search_params)
+        if page > 1:
+            depth = self.depth if popular else 1  # Someone is paging through the results
+        else:
+            depth = 1 if popular else 0
+        return [p for p in range(page + 1, page + depth + 1) if p <= PREFETCH_MAX_PAGE]
+
+    def after_serve(self, search_params, prefetch):
+        """
+        Schedule background prefetches of the pages after the one just served.
+
+        Args:
+            search_params (dict): The search that was served, with its page
+            prefetch (callable): prefetch(search_params) fetches and caches one page,
+                returning FETCHED, ALREADY_CACHED or SHED
+
+        Returns:
+            list: Pages scheduled
+        """
+        if not self.enabled or not search_params.get("query"):
+            return []
+        self._reload_popular_if_due()
+
+        scheduled = []
+        for page in self.pages_ahead(search_params):
+            # Reserved now, not when the fetch finishes, so a burst of page views can't overspend
+            reservation = self._reserve()
+            if reservation is None:
+                with self._lock:
+                    self.over_budget += 1
+                logging.info(f"Prefetch budget used up, not prefetching page {page} of: {search_params['query']}")
+                break
+
+            params = dict(search_params, page=page)
+            cache_key = lookup_keys(params)[0]
+            task = lambda params=params, reservation=reservation: self._run(prefetch, params, reservation)
+            if self._scheduler.schedule(cache_key, task):
+                scheduled.append(page)
+            else:
+                self._refund(reservation)  # Already pending, or the pool is full
+        with self._lock:
+            self.scheduled += len(scheduled)
+        return scheduled
+
+    def load_popular(self):
+        """
+        Reload the popular queries from the search log.
+
+        Returns:
+            int: Number of popular queries
+        """
+        since = datetime.utcnow() - timedelta(hours=PREFETCH_HISTORY_HOURS)
+        counts = popular_queries(since, PREFETCH_POPULAR_LIMIT)
+        popular = frozenset(query for query, count in counts.items() if count >= self.min_searches)
+
+        with self._lock:
+            self._popular = popular
+        logging.info(f"Loaded {len(popular)} popular queries for prefetching")
+        return len(popular)
+
+    def stats(self):
+        """
+        Get prefetch counters.
+
+        Returns:
+            dict: Scheduled, fetched, already cached, shed and over-budget counts, budget left,
+                popular and tracked query counts, and the worker pool's counters
+        """
+        budget_left = self._budget_left()
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "scheduled": self.scheduled,
+                "fetched": self.fetched,
+                "already_cached": self.already_cached,
+                "shed": self.shed,
+                "over_budget": self.over_budget,
+                "budget_left": budget_left,
+                "popular_queries": len(self._popular),
+                "tracked_queries": len(self._hits),
+                "workers": self._scheduler.stats()
+            }
+
+    def shutdown(self, wait=True):
+        """Stop the worker pool"""
+        self._scheduler.shutdown(wait=wait)
+
+    def _budget_left(self):
+        with self._lock:
+            cutoff = time.monotonic() - self.budget_window
+            while self._spent and self._spent[0] < cutoff:
+                self._spent.popleft()
+            return max(0, self.budget - len(self._spent))
+
+    def _reserve(self):
+        """Take one prefetch from the budget, returning the reservation or None if none is left"""
+        with self._lock:
+            now = time.monotonic()
+            while self._spent and self._spent[0] < now - self.budget_window:
+                self._spent.popleft()
+            if len(self._spent) >= self.budget:
+                return None
+            self._spent.append(now)
+            return now
+
+    def _refund(self, reservation):
+        """Give back a reservation that didn't cost an API call"""
+        with self._lock:
+            try:
+                self._spent.remove(reservation)
+            except ValueError:
+                pass  # Already out of the window
+
+    def _run(self, prefetch, params, reservation):
+        try:
+            outcome = prefetch(params)
+        except Exception:
+            self._refund(reservation)
+            raise
+        if outcome != FETCHED:
+            self._refund(reservation)
+        with self._lock:
+            if outcome == FETCHED:
+                self.fetched += 1
+            elif outcome == SHED:
+                self.shed += 1
+            else:
+                self.already_cached += 1
+
+    def _reload_popular_if_due(self):
+        with self._lock:
+            due = self._popular_loaded_at is None or \
+                time.monotonic() - self._popular_loaded_at >= PREFETCH_POPULAR_REFRESH
+            if due:
+                self._popular_loaded_at = time.monotonic()
+        if due:
+            self._scheduler.schedule(_POPULAR_KEY, self.load_popular)
+
+
+# Global instance
+prefetcher = Prefetcher()
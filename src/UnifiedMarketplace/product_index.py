@@ -0,0 +1,658 @@
+import array
+import atexit
+import fcntl
+import json
+import logging
+import math
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+import cache_codec
+from cache_keys import DEFAULT_LIMIT, normalize_search_params
+from product_model import Product, normalize_products, serialize_products
+from product_query import parse_price, search_filter
+from search_engine import product_identity
+from write_behind import write_queue
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Add API results to the index as they are cached
+PRODUCT_INDEX_ENABLED = os.environ.get("PRODUCT_INDEX_ENABLED", "true").lower() == "true"
+
+# Answer searches the index covers without calling the API. Off until the recall
+# benchmark (benchmarks/bench_product_index.py) looks good on production data
+PRODUCT_INDEX_SERVE = os.environ.get("PRODUCT_INDEX_SERVE", "false").lower() == "true"
+
+PRODUCT_INDEX_DIR = os.environ.get(
+    "PRODUCT_INDEX_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance", "product_index")
+)
+
+# Write the in-memory additions to disk after this many products or seconds, whichever is first
+PRODUCT_INDEX_SAVE_EVERY = int(os.environ.get("PRODUCT_INDEX_SAVE_EVERY", 2000))
+PRODUCT_INDEX_SAVE_INTERVAL = float(os.environ.get("PRODUCT_INDEX_SAVE_INTERVAL", 300))
+
+# Seconds between checks for a newer index written by another worker
+PRODUCT_INDEX_RELOAD_INTERVAL = float(os.environ.get("PRODUCT_INDEX_RELOAD_INTERVAL", 30))
+
+# Recent upstream searches kept with the index, used by the recall benchmark
+PRODUCT_INDEX_SEARCH_LOG = int(os.environ.get("PRODUCT_INDEX_SEARCH_LOG", 1000))
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Weight of the upstream ranking prior: products the API ranked near the top of
+# earlier searches score higher, score = BM25 * (1 + weight / (1 + position / 10))
+UPSTREAM_RANK_WEIGHT = float(os.environ.get("PRODUCT_INDEX_RANK_WEIGHT", 1.0))
+
+# Segment file layout: header, then prices and ratings (float64 per document),
+# lengths (uint32 per document), posting document IDs (uint32) and term frequencies (uint16)
+SEGMENT_MAGIC = b"UMPI"
+SEGMENT_VERSION = 1
+_HEADER = struct.Struct("<4sHHQQ")  # Magic, version, reserved, documents, postings
+
+_TOKEN = re.compile(r"[^\W_]+")
+STOPWORDS = frozenset("a an and by for from in of on or the to with".split())
+
+
+def tokenize(text):
+    """
+    Split text into index terms: case-folded words, without stopwords and single letters.
+
+    Args:
+        text (str): Title, store or description text
+
+    Returns:
+        list: The terms, in order, with repeats
+    """
+    if not text:
+        return []
+    return [token for token in _TOKEN.findall(text.casefold())
+            if token not in STOPWORDS and (len(token) > 1 or token.isdigit())]
+
+def _document_text(item):
+    """Get the title, store and description of a product"""
+    product = item if isinstance(item, Product) else normalize_products([item])[0]
+    store = product.offer.store_name if product.offer else ""
+    return product, f"{product.product_title or ''} {store or ''} {product.product_description or ''}"
+
+
+@dataclass(slots=True)
+class IndexedDocument:
+    """A product in the index, with the search context it was found in"""
+    key: str  # "<country>:<language>:<product identity>"
+    country: str
+    language: str
+    condition: str  # product_condition of the search that returned it
+    product: Product
+    length: int  # Number of terms
+    price: float  # NaN when unknown
+    rating: float  # NaN when unknown
+    position: int = 0  # Best position in the upstream results it was seen in
+
+
+@dataclass
+class IndexResult:
+    """Outcome of an index search"""
+    products: list = field(default_factory=list)  # The requested page, best first
+    matched: int = 0  # Documents matching every term and filter
+    covered: bool = False  # The index holds at least the full requested page
+    elapsed: float = 0.0
+
+
+class ProductIndex:
+    """
+    Incremental BM25 full-text index over products seen in API results.
+
+    Two segments make up the index. The base segment is the last one written
+    to disk: its numeric columns and postings are memory-mapped, its terms and
+    documents are loaded. The delta segment holds products added since, in
+    ordinary Python lists, and is searchable straight away. save() merges
+    both into a new on-disk generation, together with whatever other workers
+    wrote in the meantime, under a file lock.
+    """
+
+    def __init__(self, directory=PRODUCT_INDEX_DIR):
+        """
+        Args:
+            directory (str): Where segment generations and the manifest are written
+        """
+        self.directory = directory
+        self._lock = threading.RLock()
+        self._save_lock = threading.Lock()
+        self._loaded = False
+        self._exit_registered = False
+
+        self.generation = 0
+        self._checked_at = 0.0
+        self._base = _empty_base()
+        self._removed = set()  # Base documents replaced by delta documents
+        self._removed_length = 0
+        self._reset_delta()
+
+        # Counters
+        self.queries = 0
+        self.covered_queries = 0
+        self.added = 0
+        self.saves = 0
+
+    def _reset_delta(self):
+        self._delta_docs = []  # IndexedDocument, None once replaced
+        self._delta_terms = []  # Term frequencies of each delta document
+        self._delta_keys = {}  # Document key -> live delta position
+        self._delta_postings = defaultdict(list)  # Term -> [(delta position, frequency)]
+        self._delta_searches = []
+        self._delta_length = 0
+        self._dirty_since = None
+
+    # Persistence
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _read_manifest(self):
+        try:
+            with open(self._path("manifest.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _load_generation(self, generation):
+        """Memory-map a generation's segment and load its terms and documents"""
+        with open(self._path(f"segment-{generation}.meta"), "rb") as f:
+            meta = cache_codec.decode(f.read())
+
+        with open(self._path(f"segment-{generation}.bin"), "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, _, doc_count, posting_count = _HEADER.unpack_from(mapped, 0)
+        if magic != SEGMENT_MAGIC or version != SEGMENT_VERSION:
+            raise ValueError(f"Unknown product index segment format in generation {generation}")
+
+        view = memoryview(mapped)
+        offset = _HEADER.size
+        sections = {}
+        for name, code, count in (("prices", "d", doc_count), ("ratings", "d", doc_count),
+                                  ("lengths", "I", doc_count), ("doc_ids", "I", posting_count),
+                                  ("tfs", "H", posting_count)):
+            size = struct.calcsize(code) * count
+            sections[name] = view[offset:offset + size].cast(code)
+            offset += size
+
+        docs = [
+            IndexedDocument(
+                key=doc["key"], country=doc["country"], language=doc["language"],
+                condition=doc["condition"], product=normalize_products([doc["product"]])[0],
+                length=sections["lengths"][i], price=sections["prices"][i], rating=sections["ratings"][i],
+                position=doc.get("position", 0)
+            )
+            for i, doc in enumerate(meta["docs"])
+        ]
+        return {
+            "generation": generation,
+            "docs": docs,
+            "keys": {doc.key: i for i, doc in enumerate(docs)},
+            "terms": meta["terms"],
+            "searches": meta["searches"],
+            "total_length": sum(sections["lengths"]),
+            "doc_ids": sections["doc_ids"],
+            "tfs": sections["tfs"]
+        }
+
+    def _set_base(self, base):
+        """Switch to another base segment, keeping the delta on top of it. Caller holds _lock."""
+        self._base = base
+        self.generation = base["generation"]
+        self._removed = {base["keys"][key] for key in self._delta_keys if key in base["keys"]}
+        self._removed_length = sum(base["docs"][i].length for i in self._removed)
+
+    def _load_latest(self, newer_than=-1):
+        """Load the manifest's generation if it is newer than the given one, else None"""
+        manifest = self._read_manifest()
+        if not manifest or manifest["generation"] <= newer_than:
+            return None
+        return self._load_generation(manifest["generation"])
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            self._checked_at = time.monotonic()
+            try:
+                base = self._load_latest()
+                if base is not None:
+                    self._set_base(base)
+                    logging.info(f"Loaded product index generation {self.generation} "
+                                 f"with {len(base['docs'])} products")
+            except Exception as e:
+                logging.error(f"Error loading product index, starting empty: {str(e)}")
+            self._loaded = True
+
+    def _reload_if_newer(self):
+        """Pick up a generation another worker wrote, at most every PRODUCT_INDEX_RELOAD_INTERVAL"""
+        if time.monotonic() - self._checked_at < PRODUCT_INDEX_RELOAD_INTERVAL:
+            return
+        self._checked_at = time.monotonic()
+        try:
+            base = self._load_latest(newer_than=self.generation)
+        except Exception as e:
+            logging.error(f"Error reloading product index: {str(e)}")
+            return
+        if base is not None:
+            with self._lock:
+                if base["generation"] > self.generation:
+                    self._set_base(base)
+
+    def save(self):
+        """
+        Merge the delta into a new on-disk generation.
+
+        The delta is snapshotted, so searches and additions carry on while the
+        generation is written. An exclusive lock on the index directory makes
+        workers saving at the same time take turns, each merging onto the
+        latest generation.
+
+        Returns:
+            int: The generation written, or the current one if there was nothing to save
+        """
+        self._ensure_loaded()
+        with self._save_lock:
+            with self._lock:
+                if not self._delta_keys:
+                    return self.generation
+                snapshot_size = len(self._delta_docs)
+                snapshot_searches = len(self._delta_searches)
+                keys = set(self._delta_keys)
+                delta_docs = [doc for doc in self._delta_docs if doc is not None]
+                delta_terms = [terms for doc, terms in zip(self._delta_docs, self._delta_terms) if doc is not None]
+                searches = list(self._delta_searches)
+                base = self._base
+
+            start = time.perf_counter()
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self._path("lock"), "w") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    base = self._load_latest(newer_than=base["generation"]) or base
+                    generation = base["generation"] + 1
+                    removed = {base["keys"][key] for key in keys if key in base["keys"]}
+                    self._write_generation(generation, base, removed, delta_docs, delta_terms, searches)
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+            new_base = self._load_generation(generation)
+
+            with self._lock:
+                # Keep what was added while the generation was written
+                added_since = [(doc, terms) for doc, terms in zip(self._delta_docs[snapshot_size:],
+                                                                  self._delta_terms[snapshot_size:])
+                               if doc is not None]
+                searches_since = self._delta_searches[snapshot_searches:]
+                self._reset_delta()
+                for doc, terms in added_since:
+                    self._append(doc, terms)
+                self._delta_searches = searches_since
+                self._set_base(new_base)
+                self.saves += 1
+
+            self._remove_old_generations(generation)
+            logging.info(f"Saved product index generation {generation} with {len(new_base['docs'])} "
+                         f"products in {time.perf_counter() - start:.3f}s")
+            return generation
+
+    def _write_generation(self, generation, base, removed, delta_docs, delta_terms, searches):
+        """Write base (minus replaced documents) plus delta documents as a generation, then point the manifest at it"""
+        # New document IDs: surviving base documents in order, then the delta
+        remap = {}
+        docs = []
+        for i, doc in enumerate(base["docs"]):
+            if i not in removed:
+                remap[i] = len(docs)
+                docs.append(doc)
+
+        # Postings stay sorted by document ID: base postings first, then the delta's
+        postings = defaultdict(list)
+        for term, (offset, count) in base["terms"].items():
+            ids, tfs = base["doc_ids"][offset:offset + count], base["tfs"][offset:offset + count]
+            postings[term] = [(remap[d], tf) for d, tf in zip(ids, tfs) if d in remap]
+        for doc, terms in zip(delta_docs, delta_terms):
+            for term, tf in terms.items():
+                postings[term].append((len(docs), tf))
+            docs.append(doc)
+
+        terms, doc_ids, tfs = {}, array.array("I"), array.array("H")
+        for term, entries in postings.items():
+            if entries:
+                terms[term] = [len(doc_ids), len(entries)]
+                doc_ids.extend(d for d, _ in entries)
+                tfs.extend(min(tf, 65535) for _, tf in entries)
+
+        meta = {
+            "docs": [{"key": doc.key, "country": doc.country, "language": doc.language,
+                      "condition": doc.condition, "position": doc.position,
+                      "product": serialize_products([doc.product], full=False)[0]}
+                     for doc in docs],
+            "terms": terms,
+            "searches": (base["searches"] + searches)[-PRODUCT_INDEX_SEARCH_LOG:]
+        }
+
+        # Segment files get new names, then the manifest switch makes them current
+        bin_path, meta_path = self._path(f"segment-{generation}.bin"), self._path(f"segment-{generation}.meta")
+        with open(bin_path + ".tmp", "wb") as f:
+            f.write(_HEADER.pack(SEGMENT_MAGIC, SEGMENT_VERSION, 0, len(docs), len(doc_ids)))
+            f.write(array.array("d", (doc.price for doc in docs)).tobytes())
+            f.write(array.array("d", (doc.rating for doc in docs)).tobytes())
+            f.write(array.array("I", (doc.length for doc in docs)).tobytes())
+            f.write(doc_ids.tobytes())
+            f.write(tfs.tobytes())
+        with open(meta_path + ".tmp", "wb") as f:
+            f.write(cache_codec.encode(meta))
+        os.replace(bin_path + ".tmp", bin_path)
+        os.replace(meta_path + ".tmp", meta_path)
+
+        manifest_path = self._path("manifest.json")
+        with open(manifest_path + ".tmp", "w") as f:
+            json.dump({"generation": generation, "documents": len(docs), "terms": len(terms),
+                       "postings": len(doc_ids), "written_at": time.time()}, f)
+        os.replace(manifest_path + ".tmp", manifest_path)
+
+    def _remove_old_generations(self, generation):
+        """Delete all but the current and previous generation - workers still mapping them keep their copy"""
+        for name in os.listdir(self.directory):
+            match = re.fullmatch(r"segment-(\d+)\.(bin|meta)", name)
+            if match and int(match.group(1)) < generation - 1:
+                try:
+                    os.remove(self._path(name))
+                except OSError:
+                    pass
+
+    # Updates
+
+    def _append(self, doc, terms):
+        """Add a document to the delta, replacing an older copy of it. Caller holds _lock."""
+        previous = self._delta_keys.get(doc.key)
+        if previous is not None:
+            # Its postings stay behind and are skipped once the document is None
+            replaced = self._delta_docs[previous]
+            self._delta_length -= replaced.length
+            self._delta_docs[previous] = None
+            doc.position = min(doc.position, replaced.position)
+        elif doc.key in self._base["keys"]:
+            base_id = self._base["keys"][doc.key]
+            if base_id not in self._removed:
+                self._removed.add(base_id)
+                self._removed_length += self._base["docs"][base_id].length
+            doc.position = min(doc.position, self._base["docs"][base_id].position)
+
+        position = len(self._delta_docs)
+        self._delta_docs.append(doc)
+        self._delta_terms.append(terms)
+        self._delta_keys[doc.key] = position
+        self._delta_length += doc.length
+        for term, count in terms.items():
+            self._delta_postings[term].append((position, count))
+
+    def add(self, items, search_params):
+        """
+        Add the products of an API search to the delta segment.
+
+        A product already in the index for the same country and language is
+        replaced, so prices and ratings follow the latest results.
+
+        Args:
+            items (list): Product objects or API dictionaries, in upstream order
+            search_params (dict): The search they came from
+
+        Returns:
+            int: Number of products added
+        """
+        self._ensure_loaded()
+        params = normalize_search_params(search_params)
+        country, language, condition = params["country"], params["language"], params["product_condition"]
+
+        # Tokenize before taking the lock
+        documents = []
+        for position, item in enumerate(items):
+            product, text = _document_text(item)
+            identity = product_identity(product)
+            if identity is None:
+                continue
+            tokens = tokenize(text)
+            terms = defaultdict(int)
+            for token in tokens:
+                terms[token] += 1
+            price = parse_price(product.offer.price) if product.offer else None
+            documents.append((IndexedDocument(
+                key=f"{country}:{language}:{identity}", country=country, language=language,
+                condition=condition, product=product, length=len(tokens),
+                price=math.nan if price is None else price,
+                rating=math.nan if product.product_rating is None else float(product.product_rating),
+                position=(params["page"] - 1) * params.get("limit", DEFAULT_LIMIT) + position
+            ), dict(terms)))
+
+        with self._lock:
+            for doc, terms in documents:
+                self._append(doc, terms)
+            self._delta_searches.append({
+                "query": params["query"], "country": country, "language": language,
+                "condition": condition, "stores": params["stores"], "keys": [doc.key for doc, _ in documents]
+            })
+            self.added += len(documents)
+            if self._dirty_since is None:
+                self._dirty_since = time.monotonic()
+            due = (len(self._delta_keys) >= PRODUCT_INDEX_SAVE_EVERY
+                   or time.monotonic() - self._dirty_since >= PRODUCT_INDEX_SAVE_INTERVAL)
+
+        if not self._exit_registered:
+            self._exit_registered = True
+            atexit.register(self.save)
+        if due:
+            write_queue.submit("product-index-save", None)
+        return len(documents)
+
+    # Queries
+
+    def _postings(self, term):
+        """Live (document ID, frequency) pairs of a term, delta positions offset by the base size"""
+        base = self._base
+        postings = []
+        location = base["terms"].get(term)
+        if location:
+            offset, count = location
+            removed = self._removed
+            postings.extend((d, tf) for d, tf in zip(base["doc_ids"][offset:offset + count],
+                                                     base["tfs"][offset:offset + count])
+                            if d not in removed)
+        base_size = len(base["docs"])
+        delta_docs = self._delta_docs
+        postings.extend((base_size + d, tf) for d, tf in self._delta_postings.get(term, ())
+                        if delta_docs[d] is not None)
+        return postings
+
+    def _document(self, doc_id):
+        base_size = len(self._base["docs"])
+        return self._base["docs"][doc_id] if doc_id < base_size else self._delta_docs[doc_id - base_size]
+
+    def _corpus(self):
+        """Live document count and average length. Caller holds _lock."""
+        doc_count = len(self._base["docs"]) - len(self._removed) + len(self._delta_keys)
+        total_length = self._base["total_length"] - self._removed_length + self._delta_length
+        return doc_count, (total_length / doc_count if doc_count else 0) or 1
+
+    def search(self, search_params, limit=None):
+        """
+        Find products for a search, ranked by BM25 over title, store and description.
+
+        Only products matching every query term are returned, from searches in
+        the same country and language (and condition, unless ANY). The search's
+        price, rating, store and shipping filters apply, and price sorts
+        replace the BM25 order.
+
+        Args:
+            search_params (dict): Search parameters, as for get_products
+            limit (int): Products per page, defaults to the search's limit
+
+        Returns:
+            IndexResult: The requested page and whether the index fully covers it
+        """
+        start = time.perf_counter()
+        self._ensure_loaded()
+        self._reload_if_newer()
+
+        params = normalize_search_params(search_params)
+        limit = limit or params.get("limit", DEFAULT_LIMIT)
+        terms = list(dict.fromkeys(tokenize(params["query"])))
+        product_filter = search_filter(search_params)
+
+        with self._lock:
+            self.queries += 1
+            doc_count, average_length = self._corpus()
+            term_postings = [self._postings(term) for term in terms]
+            if not terms or not all(term_postings):
+                return IndexResult(elapsed=time.perf_counter() - start)
+
+            # Documents with every term, intersected from the rarest
+            frequencies = sorted((dict(postings) for postings in term_postings), key=len)
+            matches = set(frequencies[0])
+            for term_frequencies in frequencies[1:]:
+                matches.intersection_update(term_frequencies.keys())
+
+            scores = dict.fromkeys(matches, 0.0)
+            for term_frequencies in frequencies:
+                df = len(term_frequencies)
+                idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+                for doc_id in matches:
+                    tf = term_frequencies[doc_id]
+                    length = self._document(doc_id).length
+                    scores[doc_id] += idf * tf * (BM25_K1 + 1) / (
+                        tf + BM25_K1 * (1 - BM25_B + BM25_B * length / average_length))
+            for doc_id in matches:
+                scores[doc_id] *= 1 + UPSTREAM_RANK_WEIGHT / (1 + self._document(doc_id).position / 10)
+
+            ranked = sorted(matches, key=lambda doc_id: (-scores[doc_id], doc_id))
+            documents = [doc for doc in map(self._document, ranked)
+                         if doc.country == params["country"] and doc.language == params["language"]
+                         and params["product_condition"] in ("ANY", doc.condition)
+                         and _matches(doc, product_filter)]
+
+        if product_filter.sort_by in ("LOWEST_PRICE", "HIGHEST_PRICE"):
+            # Unknown prices last, ties keep relevance order
+            sign = 1 if product_filter.sort_by == "LOWEST_PRICE" else -1
+            documents.sort(key=lambda doc: (math.isnan(doc.price), 0 if math.isnan(doc.price) else sign * doc.price))
+
+        page = params["page"]
+        products = [doc.product for doc in documents[(page - 1) * limit:page * limit]]
+        covered = len(documents) >= page * limit
+        if covered:
+            self.covered_queries += 1
+        return IndexResult(products=products, matched=len(documents), covered=covered,
+                           elapsed=time.perf_counter() - start)
+
+    def stats(self):
+        """
+        Get index size and counters.
+
+        Returns:
+            dict: Generation, documents, terms, pending additions and query counts
+        """
+        self._ensure_loaded()
+        with self._lock:
+            return {
+                "generation": self.generation,
+                "documents": self._corpus()[0],
+                "base_terms": len(self._base["terms"]),
+                "pending": len(self._delta_keys),
+                "added": self.added,
+                "saves": self.saves,
+                "queries": self.queries,
+                "covered_queries": self.covered_queries
+            }
+
+    def searches(self):
+        """Logged upstream searches, oldest first: query, country, language, condition, stores and result keys"""
+        self._ensure_loaded()
+        with self._lock:
+            return (self._base["searches"] + self._delta_searches)[-PRODUCT_INDEX_SEARCH_LOG:]
+
+
+def _empty_base():
+    return {"generation": 0, "docs": [], "keys": {}, "terms": {}, "searches": [],
+            "total_length": 0, "doc_ids": [], "tfs": []}
+
+def _matches(doc, product_filter):
+    """Check a document against a ProductFilter's price, rating, store and shipping filters"""
+    f = product_filter
+    # Comparisons with NaN are false, so unknown prices and ratings drop out
+    if f.min_price is not None and not doc.price >= f.min_price:
+        return False
+    if f.max_price is not None and not doc.price <= f.max_price:
+        return False
+    if f.min_rating is not None and not doc.rating >= f.min_rating:
+        return False
+    offer = doc.product.offer
+    if f.stores is not None and (not offer or (offer.store_name or "").casefold() not in f.stores):
+        return False
+    if f.free_shipping and not (offer and offer.shipping and "free" in offer.shipping.casefold()):
+        return False
+    return True
+
+
+# Global instance
+product_index = ProductIndex()
+
+
+def index_products_batch(items):
+    """
+    Write-behind handler: add API results to the index off the request path.
+
+    Args:
+        items (list): (products, search_params) tuples
+    """
+    for products, search_params in items:
+        product_index.add(products, search_params)
+
+def save_product_index_batch(items):
+    """Write-behind handler: merge the index's additions to disk"""
+    product_index.save()
+
+write_queue.register("product-index", index_products_batch)
+write_queue.register("product-index-save", save_product_index_batch)
+
+def index_search_results(products, search_params):
+    """
+    Queue API results for the product index, if it is enabled.
+
+    Args:
+        products (list): Product objects or API dictionaries
+        search_params (dict): The search they came from
+    """
+    if PRODUCT_INDEX_ENABLED and products:
+        write_queue.submit("product-index", (products, search_params))
+
+def search_index(search_params):
+    """
+    Answer a search from the index, if serving from it is enabled and it covers the page.
+
+    Args:
+        search_params (dict): Search parameters
+
+    Returns:
+        list: The page of Product objects, or None if the API has to be called
+    """
+    if not PRODUCT_INDEX_SERVE:
+        return None
+    result = product_index.search(search_params)
+    if not result.covered:
+        return None
+    logging.info(f"Product index answered {search_params.get('query')!r} with {result.matched} "
+                 f"matches in {result.elapsed * 1000:.1f} ms")
+    return result.products
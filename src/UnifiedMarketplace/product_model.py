@@ -0,0 +1,137 @@
+import os
+from dataclasses import dataclass
+
+# Keep the untouched API payload on every product (for debugging) instead of the compact form
+PRODUCT_FULL_MODE = os.environ.get("PRODUCT_FULL_MODE", "false").lower() == "true"
+
+
+@dataclass(slots=True)
+class Offer:
+    """The best offer for a product, as rendered on the results page"""
+    price: str = None
+    store_name: str = None
+    store_favicon: str = None
+    offer_page_url: str = None
+    shipping: str = None  # e.g. "Free delivery", None when the API doesn't say
+
+    @classmethod
+    def from_api(cls, data):
+        """
+        Build an offer from the API's offer dictionary.
+
+        Args:
+            data (dict): The "offer" object of a search result
+
+        Returns:
+            Offer: The compact offer, or None if data is empty
+        """
+        if not data:
+            return None
+        return cls(
+            price=data.get("price"),
+            store_name=data.get("store_name"),
+            store_favicon=data.get("store_favicon"),
+            offer_page_url=data.get("offer_page_url"),
+            shipping=data.get("shipping")
+        )
+
+    def to_dict(self):
+        return {
+            "price": self.price,
+            "store_name": self.store_name,
+            "store_favicon": self.store_favicon,
+            "offer_page_url": self.offer_page_url,
+            "shipping": self.shipping
+        }
+
+
+@dataclass(slots=True)
+class Product:
+    """
+    A search result reduced to the fields the site uses.
+
+    Field names match the API so templates and cached rows written from raw
+    API dictionaries keep working. In full mode the original dictionary is
+    kept in raw and to_dict(full=True) returns it unchanged.
+    """
+    product_id: str = None
+    product_title: str = None
+    product_description: str = None  # Not rendered, but searched by the local product index
+    product_photos: tuple = ()  # Only the first photo is rendered, so only it is kept
+    product_rating: float = None
+    product_num_reviews: int = None
+    offer: Offer = None
+    raw: dict = None
+
+    @classmethod
+    def from_api(cls, data, full=PRODUCT_FULL_MODE):
+        """
+        Build a product from a raw API result or a compact cached dictionary.
+
+        Args:
+            data (dict): A product from the search API or from to_dict()
+            full (bool): Keep the original dictionary on the product
+
+        Returns:
+            Product: The normalized product
+        """
+        photos = data.get("product_photos") or ()
+        return cls(
+            product_id=data.get("product_id"),
+            product_title=data.get("product_title"),
+            product_description=data.get("product_description"),
+            product_photos=tuple(photos[:1]),
+            product_rating=data.get("product_rating"),
+            product_num_reviews=data.get("product_num_reviews"),
+            offer=Offer.from_api(data.get("offer")),
+            raw=data if full else None
+        )
+
+    def to_dict(self, full=False):
+        """
+        Convert the product to a JSON-compatible dictionary.
+
+        Args:
+            full (bool): Return the original API dictionary when it was kept
+
+        Returns:
+            dict: The compact (or full) product
+        """
+        if full and self.raw is not None:
+            return self.raw
+        return {
+            "product_id": self.product_id,
+            "product_title": self.product_title,
+            "product_description": self.product_description,
+            "product_photos": list(self.product_photos),
+            "product_rating": self.product_rating,
+            "product_num_reviews": self.product_num_reviews,
+            "offer": self.offer.to_dict() if self.offer else None
+        }
+
+
+def normalize_products(items, full=PRODUCT_FULL_MODE):
+    """
+    Convert raw API results (or already-normalized products) to Product objects.
+
+    Args:
+        items (list): Product dictionaries or Product objects
+        full (bool): Keep the original dictionaries on the products
+
+    Returns:
+        list: Product objects
+    """
+    return [item if isinstance(item, Product) else Product.from_api(item, full=full) for item in items]
+
+def serialize_products(products, full=PRODUCT_FULL_MODE):
+    """
+    Convert products to JSON-compatible dictionaries for caching or JSON responses.
+
+    Args:
+        products (list): Product objects or product dictionaries
+        full (bool): Emit the original API dictionaries when they were kept
+
+    Returns:
+        list: Product dictionaries
+    """
+    return [product.to_dict(full=full) if isinstance(product, Product) else product for product in products]
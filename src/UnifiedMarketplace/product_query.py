@@ -0,0 +1,366 @@
+import logging
+import math
+import os
+import re
+from dataclasses import dataclass
+from decimal import Decimal, InvalidOperation
+
+from cache_keys import DEFAULT_LIMIT, DEFAULT_PARAMS, make_cache_key, normalize_search_params
+from cache_manager import get_cached_entry
+from memory_cache import LRUCache
+
+# Optional vectorized evaluation - fall back to plain Python when missing
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# A local refinement of a full page is only used if it keeps at least this many products,
+# otherwise the API is asked for a full page of the narrower search
+LOCAL_FILTER_MIN_RESULTS = int(os.environ.get("LOCAL_FILTER_MIN_RESULTS", 10))
+
+# Columnar tables of cached searches, built once per cache entry
+PRODUCT_TABLE_CACHE_ENTRIES = int(os.environ.get("PRODUCT_TABLE_CACHE_ENTRIES", 256))
+table_cache = LRUCache(max_entries=PRODUCT_TABLE_CACHE_ENTRIES, ttl=24 * 3600)
+
+# Sort orders that can be applied to products already fetched
+LOCAL_SORTS = ("BEST_MATCH", "LOWEST_PRICE", "HIGHEST_PRICE")
+
+# Parameters the API doesn't take, they are always applied locally
+LOCAL_ONLY_PARAMS = ("free_shipping",)
+
+# Parameters a cached search must share with the requested one to be refined locally
+_EXACT_PARAMS = ("query", "page", "product_condition", "country", "language")
+
+_PRICE = re.compile(r"\d[\d.,]*")
+
+
+def parse_price(value):
+    """
+    Parse a display price such as "$1,299.99" or "1.299,99 €".
+
+    Args:
+        value (str): The offer price
+
+    Returns:
+        float: The amount, or None if there is no number in it
+    """
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+
+    match = _PRICE.search(str(value))
+    if not match:
+        return None
+    number = match.group().rstrip(".,")
+
+    # The last separator followed by one or two digits is the decimal point
+    last = max(number.rfind("."), number.rfind(","))
+    if last != -1 and len(number) - last - 1 in (1, 2):
+        whole, fraction = number[:last], number[last + 1:]
+    else:
+        whole, fraction = number, "0"
+    return float(f"{whole.replace(',', '').replace('.', '') or 0}.{fraction}")
+
+def _parse_amount(value):
+    """Parse a normalized price or rating parameter, None if it isn't a number"""
+    if str(value).upper() == "ANY":
+        return 0.0
+    try:
+        amount = Decimal(str(value))
+    except InvalidOperation:
+        return None
+    return float(amount) if amount.is_finite() else None
+
+
+@dataclass(slots=True)
+class ProductFilter:
+    """Filters and sort order applied to an already-fetched product list. None means no filter."""
+    min_price: float = None
+    max_price: float = None
+    min_rating: float = None
+    stores: frozenset = None  # Case-folded store names
+    free_shipping: bool = False
+    sort_by: str = "BEST_MATCH"
+
+
+class ProductTable:
+    """
+    Columnar view of a product list for filtering and sorting in-process.
+
+    Prices, ratings, stores and shipping are extracted once, so each query is
+    a few array comparisons (NumPy when installed) instead of walking the
+    product objects. Queries never change the original order, which is the
+    API's best-match order.
+    """
+
+    def __init__(self, products):
+        """
+        Args:
+            products (list): Product objects
+        """
+        self.products = products
+
+        prices, ratings, stores, free_shipping = [], [], [], []
+        for product in products:
+            offer = product.offer
+            price = parse_price(offer.price) if offer else None
+            prices.append(math.nan if price is None else price)
+            rating = product.product_rating
+            ratings.append(math.nan if rating is None else float(rating))
+            stores.append((offer.store_name or "").casefold() if offer else "")
+            free_shipping.append(bool(offer and offer.shipping and "free" in offer.shipping.casefold()))
+
+        self.vectorized = numpy is not None
+        if self.vectorized:
+            self.prices = numpy.array(prices, dtype=numpy.float64)
+            self.ratings = numpy.array(ratings, dtype=numpy.float64)
+            # Stores as small integer codes, so store filters compare numbers
+            self.store_codes = {store: code for code, store in enumerate(dict.fromkeys(stores))}
+            self.stores = numpy.array([self.store_codes[store] for store in stores], dtype=numpy.int32)
+            self.free_shipping = numpy.array(free_shipping, dtype=bool)
+            self._products = numpy.empty(len(products), dtype=object)
+            self._products[:] = products
+            # Price orders are computed once, a sorted query just keeps the matching positions.
+            # Stable sorts keep best-match order between equal prices, NaN sorts last
+            self._orders = {
+                "LOWEST_PRICE": numpy.argsort(self.prices, kind="stable"),
+                "HIGHEST_PRICE": numpy.argsort(-self.prices, kind="stable")
+            }
+        else:
+            self.prices, self.ratings, self.stores, self.free_shipping = prices, ratings, stores, free_shipping
+
+    def __len__(self):
+        return len(self.products)
+
+    def query(self, product_filter):
+        """
+        Filter and sort the products.
+
+        Products without a price are dropped by price filters and sorted last
+        by price sorts; products without a rating are dropped by a rating filter.
+
+        Args:
+            product_filter (ProductFilter): What to keep and how to order it
+
+        Returns:
+            list: Matching Product objects
+        """
+        if self.vectorized:
+            return self._query_numpy(product_filter)
+        return [self.products[i] for i in self._query_python(product_filter)]
+
+    def _query_numpy(self, f):
+        mask = numpy.ones(len(self.products), dtype=bool)
+        # Comparisons with NaN are false, so unknown prices and ratings drop out
+        if f.min_price is not None:
+            mask &= self.prices >= f.min_price
+        if f.max_price is not None:
+            mask &= self.prices <= f.max_price
+        if f.min_rating is not None:
+            mask &= self.ratings >= f.min_rating
+        if f.stores is not None:
+            codes = [self.store_codes[store] for store in f.stores if store in self.store_codes]
+            mask &= numpy.isin(self.stores, codes)
+        if f.free_shipping:
+            mask &= self.free_shipping
+
+        order = self._orders.get(f.sort_by)
+        indices = numpy.flatnonzero(mask) if order is None else order[mask[order]]
+        return self._products[indices].tolist()
+
+    def _query_python(self, f):
+        prices, ratings = self.prices, self.ratings
+        indices = [
+            i for i in range(len(self.products))
+            if (f.min_price is None or prices[i] >= f.min_price)
+            and (f.max_price is None or prices[i] <= f.max_price)
+            and (f.min_rating is None or ratings[i] >= f.min_rating)
+            and (f.stores is None or self.stores[i] in f.stores)
+            and (not f.free_shipping or self.free_shipping[i])
+        ]
+
+        if f.sort_by == "LOWEST_PRICE":
+            indices.sort(key=lambda i: (math.isnan(prices[i]), prices[i]))
+        elif f.sort_by == "HIGHEST_PRICE":
+            indices.sort(key=lambda i: (math.isnan(prices[i]), -prices[i]))
+        return indices
+
+
+def get_table(cache_key, entry):
+    """
+    Get the columnar table of a cached search, building it on first use.
+
+    Args:
+        cache_key (str): The search's cache key
+        entry (CachedResults): The cache entry
+
+    Returns:
+        ProductTable: The table
+    """
+    table_key = f"{cache_key}:{entry.created_at}"
+    table = table_cache.get(table_key)
+    if table is None:
+        table = ProductTable(entry.products)
+        table_cache.set(table_key, table, size=len(entry.products))
+    return table
+
+def upstream_params(search_params):
+    """Get the search parameters the API takes, without the local-only ones"""
+    return {name: value for name, value in search_params.items() if name not in LOCAL_ONLY_PARAMS}
+
+def local_only_filter(search_params):
+    """
+    Get the filter for the parameters the API doesn't take.
+
+    Args:
+        search_params (dict): Search parameters
+
+    Returns:
+        ProductFilter: The filter, None if no local-only parameter is set
+    """
+    if "free_shipping" not in normalize_search_params(search_params):
+        return None
+    return ProductFilter(free_shipping=True)
+
+def refinement_filter(base_params, search_params):
+    """
+    Work out whether a search can be answered from another search's products.
+
+    It can if it asks for the same page of the same query, condition, country,
+    language and page size, with price, rating, store and shipping filters at
+    least as narrow, and a sort order that can be applied locally (best match
+    only comes from a best-match base).
+
+    Args:
+        base_params (dict): Parameters of the search whose products are at hand
+        search_params (dict): Parameters of the requested search
+
+    Returns:
+        ProductFilter: Turns the base products into the requested ones, or None
+            if the API has to be called
+    """
+    base = normalize_search_params(base_params)
+    target = normalize_search_params(search_params)
+
+    if any(base[name] != target[name] for name in _EXACT_PARAMS):
+        return None
+    if base.get("limit", DEFAULT_LIMIT) != target.get("limit", DEFAULT_LIMIT):
+        return None
+    if target["sort_by"] not in LOCAL_SORTS or (target["sort_by"] == "BEST_MATCH" and base["sort_by"] != "BEST_MATCH"):
+        return None
+
+    bounds = {name: (_parse_amount(base[name]), _parse_amount(target[name]))
+              for name in ("min_price", "max_price", "min_rating")}
+    if any(None in pair for pair in bounds.values()):
+        return None
+    (base_min, min_price), (base_max, max_price), (base_rating, min_rating) = bounds.values()
+    if min_price < base_min or max_price > base_max or min_rating < base_rating:
+        return None
+
+    base_stores, stores = set(base["stores"].split(",")), set(target["stores"].split(","))
+    if not stores <= base_stores:
+        return None
+    if base.get("free_shipping") and not target.get("free_shipping"):
+        return None
+
+    # Only narrower bounds filter, so products the base kept without a price or rating stay
+    return ProductFilter(
+        min_price=min_price if min_price > base_min else None,
+        max_price=max_price if max_price < base_max else None,
+        min_rating=min_rating if min_rating > base_rating else None,
+        stores=frozenset(stores) if stores != base_stores else None,
+        free_shipping=bool(target.get("free_shipping")) and not base.get("free_shipping"),
+        sort_by=target["sort_by"]
+    )
+
+def search_filter(search_params):
+    """
+    Get the filter that applies a search's own price, rating, store, shipping and sort options.
+
+    Args:
+        search_params (dict): Search parameters
+
+    Returns:
+        ProductFilter: The filter, unset where the search is left at its default
+    """
+    params = normalize_search_params(search_params)
+    min_price = _parse_amount(params["min_price"])
+    max_price = _parse_amount(params["max_price"])
+    min_rating = _parse_amount(params["min_rating"])
+    return ProductFilter(
+        min_price=min_price or None,
+        max_price=max_price if max_price is not None and max_price != _parse_amount(DEFAULT_PARAMS["max_price"]) else None,
+        min_rating=min_rating or None,
+        stores=frozenset(params["stores"].split(",")),
+        free_shipping=bool(params.get("free_shipping")),
+        sort_by=params["sort_by"] if params["sort_by"] in LOCAL_SORTS else "BEST_MATCH"
+    )
+
+def _broadest_params(search_params):
+    """The same search with every locally applicable filter at its default"""
+    return {
+        **search_params,
+        "sort_by": DEFAULT_PARAMS["sort_by"],
+        "min_rating": DEFAULT_PARAMS["min_rating"],
+        "min_price": DEFAULT_PARAMS["min_price"],
+        "max_price": DEFAULT_PARAMS["max_price"],
+        "free_shipping": False
+    }
+
+def refine_cached(search_params, base_params=None):
+    """
+    Answer a search by filtering and re-sorting a cached search, without the API.
+
+    Tries base_params, the search the user asked to refine, and then the same
+    search with no price, rating, shipping or sort options. A page of
+    another search only holds the top of this one, so the broadest search
+    is only used when its page is complete (fewer products than its limit),
+    and base_params only when enough products are left.
+
+    Args:
+        search_params (dict): Parameters of the requested search
+        base_params (dict): Parameters of the search the user was looking at, from refine_from
+
+    Returns:
+        tuple: (list of Product objects, CachedResults base entry), or None if
+            no cached search can satisfy the request
+    """
+    cache_key = make_cache_key(search_params)
+    candidates = [(params, explicit) for params, explicit in ((base_params, True), (_broadest_params(search_params), False))
+                  if params]
+
+    seen = {cache_key}
+    for candidate, explicit in candidates:
+        base_key = make_cache_key(candidate)
+        if base_key in seen:
+            continue
+        seen.add(base_key)
+
+        product_filter = refinement_filter(candidate, search_params)
+        if product_filter is None:
+            continue
+        entry = get_cached_entry(base_key)
+        if entry is None or not entry.products:
+            continue
+
+        # A full base page only holds the top of the narrower search
+        limit = normalize_search_params(candidate).get("limit", DEFAULT_LIMIT)
+        complete = len(entry.products) < limit
+        if not complete and not explicit:
+            continue
+
+        products = get_table(base_key, entry).query(product_filter)
+
+        # Too few left of a full page means asking the API
+        if len(products) < LOCAL_FILTER_MIN_RESULTS and not complete:
+            logging.info(f"Local refinement of {base_key} left {len(products)} products, calling API")
+            continue
+
+        logging.info(f"Refined {len(entry.products)} cached products from {base_key} to {len(products)} for {cache_key}")
+        return products, entry
+    return None
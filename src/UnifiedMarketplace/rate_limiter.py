@@ -0,0 +1,340 @@
+import logging
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass
+
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Import models and db within functions to avoid circular imports
+
+# Limiter mode: "off", "process" (threads in one worker) or "database" (all workers share one bucket)
+RATE_LIMIT_MODE = os.environ.get("RATE_LIMIT_MODE", "process")
+RATE_LIMIT_RPS = float(os.environ.get("RATE_LIMIT_RPS", 5))  # Sustained upstream requests per second
+RATE_LIMIT_BURST = float(os.environ.get("RATE_LIMIT_BURST", 10))  # Requests allowed back to back
+RATE_LIMIT_BACKOFF = float(os.environ.get("RATE_LIMIT_BACKOFF", 5))  # Seconds to pause after a 429 without Retry-After
+RATE_LIMIT_QUOTA_RESERVE = float(os.environ.get("RATE_LIMIT_QUOTA_RESERVE", 0.1))  # Share of the quota kept for interactive use
+
+# Request priorities, most important first
+PRIORITY_INTERACTIVE = 0  # A user is waiting for the results
+PRIORITY_BACKGROUND = 1  # Refreshing stale cache entries
+PRIORITY_PREFETCH = 2  # Results nobody has asked for yet
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BACKGROUND: "background",
+                  PRIORITY_PREFETCH: "prefetch"}
+
+# Seconds each priority queues for a token before giving up
+MAX_WAIT = {
+    PRIORITY_INTERACTIVE: float(os.environ.get("RATE_LIMIT_INTERACTIVE_WAIT", 2)),
+    PRIORITY_BACKGROUND: float(os.environ.get("RATE_LIMIT_BACKGROUND_WAIT", 1)),
+    PRIORITY_PREFETCH: float(os.environ.get("RATE_LIMIT_PREFETCH_WAIT", 0)),
+}
+
+# Share of the bucket each priority must leave untouched, so a burst of low-priority
+# work never drains the tokens the next interactive search needs
+BUCKET_RESERVE = {PRIORITY_INTERACTIVE: 0.0, PRIORITY_BACKGROUND: 0.3, PRIORITY_PREFETCH: 0.6}
+
+# Seconds a lower-priority caller polls while higher-priority callers in this process wait
+PRIORITY_POLL_INTERVAL = 0.01
+
+# Row name of the shared bucket in database mode
+BUCKET_NAME = "rapidapi"
+
+# Returned when optimistic updates of the bucket row kept conflicting
+_CONFLICT = object()
+
+
+class RateLimited(Exception):
+    """Raised when an upstream request is shed or can't get a token in time"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+@dataclass
+class BucketState:
+    """Token bucket plus what the upstream last reported about its limits"""
+    tokens: float
+    updated_at: float  # Wall-clock seconds, comparable across workers
+    blocked_until: float = 0.0  # No requests before this time (429s, exhausted windows)
+    quota_limit: int = None  # Requests per quota period, from the response headers
+    quota_remaining: int = None
+    quota_reset_at: float = None
+
+
+def _header_number(headers, name):
+    """Read a numeric response header, None if missing or malformed"""
+    value = headers.get(name)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+class RateLimiter:
+    """
+    Token bucket in front of the upstream product search API.
+
+    Each request takes a token; tokens refill at a steady rate up to the burst
+    size. Interactive searches may use the whole bucket and queue briefly when
+    it is empty. Background refreshes and prefetches must leave part of the
+    bucket for them, give way to interactive callers waiting in the same
+    process, and are shed outright when little of the upstream quota is left.
+
+    Rate-limit headers from each response keep the remaining quota and reset
+    time current, and a 429 pauses everyone until the upstream allows requests
+    again. In "database" mode the bucket lives in one row that every worker
+    updates with optimistic locking, so the limits hold across processes.
+    """
+
+    def __init__(self, mode=RATE_LIMIT_MODE, rate=RATE_LIMIT_RPS, burst=RATE_LIMIT_BURST,
+                 max_wait=None, backoff=RATE_LIMIT_BACKOFF, quota_reserve=RATE_LIMIT_QUOTA_RESERVE,
+                 name=BUCKET_NAME, clock=time.time, sleep=time.sleep):
+        """
+        Args:
+            mode (str): "off", "process" or "database"
+            rate (float): Tokens added per second
+            burst (float): Bucket size
+            max_wait (dict): Seconds each priority queues for a token, defaults to MAX_WAIT
+            backoff (float): Seconds to pause after a 429 that names no retry time
+            quota_reserve (float): Share of the upstream quota only interactive requests may use
+            name (str): Bucket row name in database mode
+            clock (callable): Returns the current wall-clock time in seconds
+            sleep (callable): Sleeps for the given number of seconds
+        """
+        self.mode = mode
+        self.rate = rate
+        self.burst = burst
+        self.max_wait = dict(MAX_WAIT if max_wait is None else max_wait)
+        self.backoff = backoff
+        self.quota_reserve = quota_reserve
+        self.name = name
+        self.clock = clock
+        self.sleep = sleep
+
+        self._state = BucketState(tokens=burst, updated_at=clock())
+        self._lock = threading.Lock()
+        self._waiting = {priority: 0 for priority in PRIORITY_NAMES}
+
+        # Counters per priority
+        self.granted = {priority: 0 for priority in PRIORITY_NAMES}
+        self.shed = {priority: 0 for priority in PRIORITY_NAMES}
+        self.waited = {priority: 0.0 for priority in PRIORITY_NAMES}  # Total seconds spent queueing
+        self.throttled = 0  # 429 responses seen
+        self.database_errors = 0
+
+    def acquire(self, priority=PRIORITY_INTERACTIVE):
+        """
+        Take a token for one upstream request, waiting if the priority allows.
+
+        Args:
+            priority (int): PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND or PRIORITY_PREFETCH
+
+        Raises:
+            RateLimited: If the request is shed or no token frees up in time
+        """
+        if self.mode == "off":
+            return
+
+        start = self.clock()
+        deadline = start + self.max_wait.get(priority, 0)
+        with self._lock:
+            self._waiting[priority] += 1
+        try:
+            while True:
+                now = self.clock()
+                if self._higher_priority_waiting(priority):
+                    # Let interactive callers in this process go first
+                    wait = PRIORITY_POLL_INTERVAL
+                else:
+                    wait = self._transact(lambda state, now: self._take(state, now, priority))
+                    if wait == 0:
+                        with self._lock:
+                            self.granted[priority] += 1
+                            self.waited[priority] += now - start
+                        return
+
+                if wait is None or now + wait > deadline:
+                    with self._lock:
+                        self.shed[priority] += 1
+                    reason = "quota reserved for interactive searches" if wait is None else \
+                        f"no token within {self.max_wait.get(priority, 0):g}s"
+                    logging.warning(f"Shedding {PRIORITY_NAMES.get(priority, priority)} upstream request: {reason}")
+                    raise RateLimited(f"Upstream rate limit: {reason}", retry_after=wait)
+                self.sleep(wait)
+        finally:
+            with self._lock:
+                self._waiting[priority] -= 1
+
+    def observe(self, headers, status_code=200):
+        """
+        Update the limits from an upstream response.
+
+        Reads RapidAPI's quota headers (X-RateLimit-Requests-Limit, -Remaining and
+        -Reset, in seconds) and per-window headers (X-RateLimit-Limit, -Remaining
+        and -Reset), plus Retry-After on a 429.
+
+        Args:
+            headers (Mapping): Case-insensitive response headers
+            status_code (int): Response status code
+        """
+        if self.mode == "off":
+            return
+
+        quota_limit = _header_number(headers, "X-RateLimit-Requests-Limit")
+        quota_remaining = _header_number(headers, "X-RateLimit-Requests-Remaining")
+        quota_reset = _header_number(headers, "X-RateLimit-Requests-Reset")
+        window_remaining = _header_number(headers, "X-RateLimit-Remaining")
+        window_reset = _header_number(headers, "X-RateLimit-Reset")
+        retry_after = _header_number(headers, "Retry-After")
+
+        if status_code == 429:
+            with self._lock:
+                self.throttled += 1
+            logging.warning(f"Upstream returned 429, pausing requests for "
+                            f"{retry_after if retry_after is not None else self.backoff:g}s")
+
+        def apply(state, now):
+            if quota_remaining is not None:
+                state.quota_remaining = int(quota_remaining)
+                state.quota_limit = int(quota_limit) if quota_limit is not None else state.quota_limit
+                state.quota_reset_at = now + quota_reset if quota_reset is not None else state.quota_reset_at
+
+            pause = None
+            if status_code == 429:
+                pause = retry_after if retry_after is not None else self.backoff
+            elif window_remaining is not None and window_remaining <= 0 and window_reset is not None:
+                pause = window_reset
+            elif state.quota_remaining is not None and state.quota_remaining <= 0 and state.quota_reset_at:
+                pause = state.quota_reset_at - now
+            if pause:
+                state.blocked_until = max(state.blocked_until, now + pause)
+
+        self._transact(apply)
+
+    def stats(self):
+        """
+        Get limiter counters and the current bucket state.
+
+        Returns:
+            dict: Mode, rate, per-priority granted/shed/wait counts and upstream quota
+        """
+        with self._lock:
+            state = BucketState(**asdict(self._state))
+            stats = {
+                "mode": self.mode,
+                "rate": self.rate,
+                "burst": self.burst,
+                "granted": {PRIORITY_NAMES[p]: count for p, count in self.granted.items()},
+                "shed": {PRIORITY_NAMES[p]: count for p, count in self.shed.items()},
+                "mean_wait": {PRIORITY_NAMES[p]: self.waited[p] / self.granted[p] if self.granted[p] else 0.0
+                              for p in PRIORITY_NAMES},
+                "throttled": self.throttled,
+                "database_errors": self.database_errors
+            }
+        # Only this process's view in database mode - the shared row may be newer
+        stats.update({
+            "tokens": round(min(self.burst, state.tokens + (self.clock() - state.updated_at) * self.rate), 2),
+            "blocked_for": max(0.0, round(state.blocked_until - self.clock(), 2)),
+            "quota_limit": state.quota_limit,
+            "quota_remaining": state.quota_remaining
+        })
+        return stats
+
+    def _higher_priority_waiting(self, priority):
+        with self._lock:
+            return any(self._waiting[p] for p in PRIORITY_NAMES if p < priority)
+
+    def _take(self, state, now, priority):
+        """
+        Take a token from state if priority may have one.
+
+        Returns:
+            float: 0 if a token was taken, else seconds until one may be, or None
+                if the request should be shed rather than wait
+        """
+        if state.blocked_until > now:
+            return state.blocked_until - now
+
+        # Keep the last of the upstream quota for interactive searches
+        if state.quota_remaining is not None and (state.quota_reset_at is None or state.quota_reset_at > now):
+            if state.quota_remaining <= 0:
+                return state.quota_reset_at - now if state.quota_reset_at else None
+            if priority > PRIORITY_INTERACTIVE and state.quota_limit and \
+                    state.quota_remaining <= state.quota_limit * self.quota_reserve * priority:
+                return None
+
+        state.tokens = min(self.burst, state.tokens + max(0.0, now - state.updated_at) * self.rate)
+        state.updated_at = now
+        floor = self.burst * BUCKET_RESERVE.get(priority, 0.0)
+        if state.tokens - 1 >= floor - 1e-9:  # Tolerate refill rounding
+            state.tokens -= 1
+            if state.quota_remaining is not None:
+                state.quota_remaining -= 1  # Until the next response reports the real count
+            return 0
+        return (floor + 1 - state.tokens) / self.rate
+
+    def _transact(self, mutate):
+        """Apply mutate(state, now) to the shared bucket and return its result"""
+        if self.mode == "database":
+            # Import here to avoid circular imports
+            from flask import has_app_context
+
+            if has_app_context():
+                try:
+                    result = self._transact_database(mutate)
+                    if result is not _CONFLICT:
+                        return result
+                except SQLAlchemyError as e:
+                    with self._lock:
+                        self.database_errors += 1
+                    logging.error(f"Rate limiter database error, using the local bucket: {e}")
+
+        with self._lock:
+            return mutate(self._state, self.clock())
+
+    def _transact_database(self, mutate, attempts=5):
+        """Read-modify-write the bucket row, retrying when another worker updated it first"""
+        # Import here to avoid circular imports
+        from models import RateLimitBucket
+        from app import db
+
+        table = RateLimitBucket.__table__
+        for _ in range(attempts):
+            with db.engine.begin() as connection:
+                row = connection.execute(select(table).where(table.c.name == self.name)).mappings().first()
+                now = self.clock()
+                if row is None:
+                    state = BucketState(tokens=self.burst, updated_at=now)
+                    result = mutate(state, now)
+                    try:
+                        with connection.begin_nested():
+                            connection.execute(table.insert().values(name=self.name, version=0, **asdict(state)))
+                    except IntegrityError:
+                        continue  # Another worker created it first
+                else:
+                    state = BucketState(**{field: row[field] for field in BucketState.__dataclass_fields__})
+                    result = mutate(state, now)
+                    updated = connection.execute(
+                        update(table)
+                        .where(table.c.name == self.name, table.c.version == row["version"])
+                        .values(version=row["version"] + 1, **asdict(state))
+                    )
+                    if updated.rowcount != 1:
+                        continue
+
+            # Keep the local copy current for stats and for falling back
+            with self._lock:
+                self._state = state
+            return result
+        return _CONFLICT
+
+
+# Shared limiter for upstream product searches
+rate_limiter = RateLimiter()
@@ -0,0 +1,113 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG, format="%(asctime)s - %(levelname)s - %(message)s")
+
+REFRESH_WORKERS = int(os.environ.get("REFRESH_WORKERS", 2))  # Background refresh threads per process
+REFRESH_MAX_PENDING = int(os.environ.get("REFRESH_MAX_PENDING", 64))  # Refreshes queued or running at once
+
+
+class RefreshScheduler:
+    """
+    Run cache refreshes in the background on a bounded worker pool.
+
+    Each key is refreshed at most once at a time, and new refreshes are
+    dropped when too many are already pending, so a burst of stale hits
+    never turns into a burst of upstream calls.
+    """
+
+    def __init__(self, max_workers=REFRESH_WORKERS, max_pending=REFRESH_MAX_PENDING, name="cache-refresh"):
+        """
+        Args:
+            max_workers (int): Number of background threads
+            max_pending (int): Maximum refreshes queued or running at once
+            name (str): Names the worker threads and log messages
+        """
+        self.name = name
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+
+        self._executor = None
+        self._pending = set()
+        self._lock = threading.Lock()
+
+        # Counters
+        self.scheduled = 0
+        self.deduplicated = 0
+        self.rejected = 0
+        self.failed = 0
+
+    def schedule(self, key, refresh):
+        """
+        Schedule refresh() to run in the background unless key is already pending.
+
+        Args:
+            key (str): Identifies the cache entry being refreshed
+            refresh (callable): Fetches fresh results and writes them to the cache
+
+        Returns:
+            bool: True if the refresh was scheduled
+        """
+        with self._lock:
+            if key in self._pending:
+                self.deduplicated += 1
+                return False
+            if len(self._pending) >= self.max_pending:
+                self.rejected += 1
+                logging.warning(f"{self.name} queue full, skipping key: {key}")
+                return False
+
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix=self.name)
+            self._pending.add(key)
+            self.scheduled += 1
+
+        self._executor.submit(self._run, key, refresh)
+        return True
+
+    def stats(self):
+        """
+        Get refresh counters.
+
+        Returns:
+            dict: Pending, scheduled, deduplicated, rejected and failed counts
+        """
+        with self._lock:
+            return {
+                "pending": len(self._pending),
+                "scheduled": self.scheduled,
+                "deduplicated": self.deduplicated,
+                "rejected": self.rejected,
+                "failed": self.failed
+            }
+
+    def shutdown(self, wait=True):
+        """Stop the worker pool"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+    def _run(self, key, refresh):
+        # Import here to avoid circular imports
+        from app import app
+
+        try:
+            with app.app_context():
+                logging.info(f"Running {self.name} in background for key: {key}")
+                refresh()
+        except Exception as e:
+            with self._lock:
+                self.failed += 1
+            logging.error(f"Background {self.name} failed for key {key}: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+
+# Shared scheduler for stale-while-revalidate refreshes
+refresh_scheduler = RefreshScheduler()
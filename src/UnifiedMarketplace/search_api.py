@@ -0,0 +1,137 @@
+import base64
+import binascii
+import json
+from dataclasses import fields as dataclass_fields
+
+from api_manager import DEFAULT_LIMIT, MAX_LIMIT
+from cache_keys import make_cache_key
+from product_model import Offer, Product
+
+# The search API serves at most this many pages for a query
+MAX_PAGE = 100
+
+# Fields a client can ask for with fields=, "offer.price" style for offer fields
+PRODUCT_FIELDS = [field.name for field in dataclass_fields(Product) if field.name != "raw"]
+OFFER_FIELDS = [f"offer.{field.name}" for field in dataclass_fields(Offer)]
+
+
+def parse_limit(value):
+    """
+    Parse the limit parameter.
+
+    Args:
+        value (str): The raw parameter, or None
+
+    Returns:
+        int: Products per page
+
+    Raises:
+        ValueError: If the limit isn't a number from 1 to MAX_LIMIT
+    """
+    if value is None or value == "":
+        return DEFAULT_LIMIT
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValueError("limit must be a number") from None
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ValueError(f"limit must be between 1 and {MAX_LIMIT}")
+    return limit
+
+def parse_fields(value):
+    """
+    Parse the fields parameter, a comma-separated list of product fields.
+
+    Args:
+        value (str): The raw parameter, or None for all fields
+
+    Returns:
+        list: The requested fields, or None for all fields
+
+    Raises:
+        ValueError: If a field doesn't exist
+    """
+    if not value:
+        return None
+    requested = [field.strip() for field in value.split(",") if field.strip()]
+    unknown = [field for field in requested if field not in PRODUCT_FIELDS and field not in OFFER_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}. "
+                         f"Available: {', '.join(PRODUCT_FIELDS + OFFER_FIELDS)}")
+    return requested
+
+def project_product(product, fields=None):
+    """
+    Convert a product to a dictionary holding only the requested fields.
+
+    Args:
+        product (dict): A serialized product
+        fields (list): Fields from parse_fields, or None for all fields
+
+    Returns:
+        dict: The projected product
+    """
+    if fields is None:
+        return product
+
+    projected = {}
+    for field in fields:
+        if field.startswith("offer."):
+            offer = product.get("offer")
+            if offer is None:
+                projected.setdefault("offer", None)
+                continue
+            if projected.get("offer") is None:
+                projected["offer"] = {}
+            name = field[len("offer."):]
+            projected["offer"][name] = offer.get(name)
+        else:
+            projected[field] = product.get(field)
+    return projected
+
+def _search_fingerprint(search_params, limit):
+    """Short hash of a search without its page, so a cursor only works for the search it came from"""
+    return make_cache_key({**search_params, "page": 1, "limit": limit}).split(":")[1][:12]
+
+def encode_cursor(search_params, page, limit):
+    """
+    Build the opaque cursor for a page of a search.
+
+    Args:
+        search_params (dict): The search parameters
+        page (int): The page the cursor points at
+        limit (int): Products per page
+
+    Returns:
+        str: URL-safe cursor
+    """
+    data = json.dumps({"p": page, "l": limit, "s": _search_fingerprint(search_params, limit)},
+                      separators=(",", ":"))
+    return base64.urlsafe_b64encode(data.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor, search_params):
+    """
+    Read the page and limit from a cursor.
+
+    Args:
+        cursor (str): A cursor from encode_cursor
+        search_params (dict): The search parameters of the current request
+
+    Returns:
+        tuple: (page, limit)
+
+    Raises:
+        ValueError: If the cursor is malformed or belongs to a different search
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        page, limit, fingerprint = int(data["p"]), int(data["l"]), data["s"]
+    except (ValueError, KeyError, TypeError, binascii.Error, UnicodeEncodeError):
+        raise ValueError("Invalid cursor") from None
+
+    if not 1 <= page <= MAX_PAGE or not 1 <= limit <= MAX_LIMIT:
+        raise ValueError("Invalid cursor")
+    if fingerprint != _search_fingerprint(search_params, limit):
+        raise ValueError("Cursor belongs to a different search")
+    return page, limit
@@ -0,0 +1,169 @@
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Fan-out limits
+MAX_CONCURRENCY = int(os.environ.get("FANOUT_MAX_CONCURRENCY", 8))  # Sub-requests in flight per search
+DEADLINE_SECONDS = float(os.environ.get("FANOUT_DEADLINE_SECONDS", 8))  # Return whatever is done by then
+# Search multi-store searches per store. Off by default: it costs one API call per store instead of one
+FANOUT_STORES = os.environ.get("FANOUT_STORES", "false").lower() == "true"
+
+
+@dataclass(frozen=True)
+class SearchShard:
+    """One upstream sub-request of a fan-out search"""
+    store: str
+    page: int
+    country: str
+
+
+@dataclass
+class FanOutResult:
+    """Merged outcome of a fan-out search"""
+    products: list = field(default_factory=list)
+    completed: list = field(default_factory=list)  # Shards that returned results
+    failed: list = field(default_factory=list)  # Shards that raised an error
+    timed_out: list = field(default_factory=list)  # Shards still running at the deadline
+    elapsed: float = 0.0
+
+    @property
+    def partial(self):
+        """True if some shards did not contribute to the results"""
+        return bool(self.failed or self.timed_out)
+
+
+def product_identity(product):
+    """
+    Get the key used to de-duplicate a product across shards.
+
+    Args:
+        product (Product): A product from the search API
+
+    Returns:
+        str: The product ID, else the offer page URL, else None
+    """
+    if product.product_id:
+        return f"id:{product.product_id}"
+
+    if product.offer and product.offer.offer_page_url:
+        return f"url:{product.offer.offer_page_url}"
+    return None
+
+def merge_products(product_lists):
+    """
+    Merge product lists in order, dropping products already seen.
+
+    Args:
+        product_lists (list): Lists of Product objects
+
+    Returns:
+        list: The merged, de-duplicated products
+    """
+    merged = []
+    seen = set()
+    for products in product_lists:
+        for product in products:
+            identity = product_identity(product)
+            if identity is not None:
+                if identity in seen:
+                    continue
+                seen.add(identity)
+            merged.append(product)
+    return merged
+
+def store_list(search_params):
+    """
+    Split a search's comma-separated stores, keeping their order and spelling.
+
+    Args:
+        search_params (dict): Search parameters
+
+    Returns:
+        list: Distinct store names
+    """
+    stores = []
+    seen = set()
+    for store in str(search_params.get("stores", "Amazon")).split(","):
+        store = store.strip()
+        if store and store.casefold() not in seen:
+            seen.add(store.casefold())
+            stores.append(store)
+    return stores
+
+def fan_out_search(search_params, search, stores=None, pages=None, countries=None,
+                   max_concurrency=MAX_CONCURRENCY, deadline=DEADLINE_SECONDS):
+    """
+    Run a search as concurrent sub-searches, one per shard, and merge the results.
+
+    Every (store, page, country) combination is searched on its own through
+    search, so the wall-clock time is that of the slowest shard rather than
+    the sum of all of them. Shards still running when the deadline passes are
+    left out of the result.
+
+    Args:
+        search_params (dict): The search; shards override its stores, page and country
+        search (callable): search(shard_params) returns a shard's products and raises if
+            it got no answer - it goes through the cache, negative cache and rate limiter
+        stores (list): Stores to search, by default those of search_params
+        pages (list): Page numbers to fetch for every store, by default its page
+        countries (list): Country codes to search in, by default its country
+        max_concurrency (int): Maximum number of sub-searches in flight at once
+        deadline (float): Seconds to wait before returning partial results
+
+    Returns:
+        FanOutResult: Merged products plus per-shard status
+    """
+    result = FanOutResult()
+    query = search_params.get("query")
+    if not query:
+        logging.warning("Empty query provided")
+        return result
+
+    shards = [
+        SearchShard(store=store, page=page, country=country)
+        for store in (stores or store_list(search_params))
+        for page in (pages or [search_params.get("page", 1)])
+        for country in (countries or [search_params.get("country", "us")])
+    ]
+    if not shards:
+        return result
+
+    logging.info(f"Fanning out search for query: {query} across {len(shards)} shards")
+    start = time.monotonic()
+
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(shards))),
+                                  thread_name_prefix="fan-out")
+    try:
+        futures = {}
+        for shard in shards:
+            shard_params = dict(search_params, stores=shard.store, page=shard.page, country=shard.country)
+            futures[executor.submit(search, shard_params)] = shard
+
+        done, not_done = wait(futures, timeout=deadline)
+    finally:
+        # Don't block on stragglers - they finish in the background and cache their shard
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    # Collect in shard order so the merged ranking is deterministic
+    shard_products = {}
+    for future in done:
+        shard = futures[future]
+        try:
+            shard_products[shard] = future.result()
+            result.completed.append(shard)
+        except Exception as e:
+            logging.error(f"Shard {shard} failed: {e}")
+            result.failed.append(shard)
+    result.timed_out = [futures[future] for future in not_done]
+
+    result.products = merge_products(shard_products[shard] for shard in shards if shard in shard_products)
+    result.elapsed = time.monotonic() - start
+
+    logging.info(f"Fan-out search returned {len(result.products)} products from "
+                 f"{len(result.completed)}/{len(shards)} shards in {result.elapsed:.2f}s")
+    return result
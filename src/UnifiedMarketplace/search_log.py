@@ -0,0 +1,161 @@
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func
+from sqlalchemy.dialects import postgresql, sqlite
+
+from cache_keys import make_cache_key, normalize_search_params
+from write_behind import write_queue
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Import models and db within functions to avoid circular imports
+
+SEARCH_LOG_ENABLED = os.environ.get("SEARCH_LOG_ENABLED", "true").lower() == "true"
+SEARCH_LOG_RETENTION_HOURS = float(os.environ.get("SEARCH_LOG_RETENTION_HOURS", 72))  # Must cover the popularity windows
+
+# Dialects with INSERT ... ON CONFLICT DO UPDATE
+_UPSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def _hour(moment):
+    """Round a naive UTC datetime down to the start of its hour"""
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def log_search(search_params):
+    """
+    Count a served search in the background.
+
+    SearchHistory only keeps the searches signed-in users save, so popularity
+    is counted from this log instead, for every search page or API page
+    served, whoever asked for it. The log holds counts per canonical search
+    and hour rather than a row per request, so it grows with the number of
+    distinct searches, not with traffic.
+
+    Args:
+        search_params (dict): The search as served, page and limit included
+    """
+    if not SEARCH_LOG_ENABLED:
+        return
+    params = normalize_search_params(search_params)
+    if not params["query"]:
+        return
+    write_queue.submit("search-log", {
+        "cache_key": make_cache_key(params),
+        "query": params["query"][:255],
+        "parameters": json.dumps(params),
+        "created_at": datetime.utcnow()
+    })
+
+
+def save_search_log_batch(items):
+    """Write-behind handler: add a batch of served searches to the hourly counts"""
+    # Import here to avoid circular imports
+    from models import SearchLog
+    from app import db
+
+    counts = {}
+    for item in items:
+        hour = _hour(item["created_at"])
+        row = counts.get((item["cache_key"], hour))
+        if row is None:
+            counts[(item["cache_key"], hour)] = {"cache_key": item["cache_key"], "hour": hour, "query": item["query"],
+                                                 "parameters": item["parameters"], "searches": 1}
+        else:
+            row["searches"] += 1
+    # Same order in every worker, so concurrent upserts don't deadlock
+    rows = [counts[key] for key in sorted(counts)]
+
+    try:
+        upsert = _UPSERTS.get(db.engine.dialect.name)
+        if upsert is not None:
+            statement = upsert(SearchLog).values(rows)
+            db.session.execute(statement.on_conflict_do_update(
+                index_elements=["cache_key", "hour"],
+                set_={"searches": SearchLog.searches + statement.excluded.searches}
+            ))
+        else:
+            for row in rows:
+                existing = db.session.query(SearchLog).filter_by(cache_key=row["cache_key"], hour=row["hour"]).first()
+                if existing is None:
+                    db.session.add(SearchLog(**row))
+                else:
+                    existing.searches += row["searches"]
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error saving search log: {e}")
+        return len(items)
+
+
+def search_counts(since, until):
+    """
+    Count the searches served in a time window per canonical cache key.
+
+    The log counts whole hours, so the window is widened to the hours it
+    touches.
+
+    Args:
+        since (datetime): Start of the window
+        until (datetime): End of the window, excluded
+
+    Returns:
+        dict: Cache key -> [searches, normalized search parameters]
+    """
+    # Import here to avoid circular imports
+    from models import SearchLog
+    from app import db
+
+    searches = func.sum(SearchLog.searches)
+    rows = db.session.query(SearchLog.cache_key, func.min(SearchLog.parameters), searches).filter(
+        SearchLog.hour >= _hour(since),
+        SearchLog.hour < until
+    ).group_by(SearchLog.cache_key).all()
+    return {cache_key: [int(count), json.loads(parameters)] for cache_key, parameters, count in rows}
+
+
+def popular_queries(since, limit):
+    """
+    Count the searches served since a time per normalized query.
+
+    Args:
+        since (datetime): Start of the window, rounded down to the hour
+        limit (int): Most searched queries returned
+
+    Returns:
+        dict: Normalized query -> searches
+    """
+    # Import here to avoid circular imports
+    from models import SearchLog
+    from app import db
+
+    searches = func.sum(SearchLog.searches)
+    rows = db.session.query(SearchLog.query, searches).filter(
+        SearchLog.hour >= _hour(since)
+    ).group_by(SearchLog.query).order_by(searches.desc()).limit(limit).all()
+    return {query: int(count) for query, count in rows}
+
+
+def purge_search_log(hours=SEARCH_LOG_RETENTION_HOURS):
+    """
+    Delete search log hours older than the retention.
+
+    Returns:
+        dict: Rows deleted
+    """
+    # Import here to avoid circular imports
+    from models import SearchLog
+    from app import db
+
+    cutoff = datetime.utcnow() - timedelta(hours=hours)
+    result = db.session.execute(delete(SearchLog).where(SearchLog.hour < _hour(cutoff)))
+    db.session.commit()
+    logging.info(f"Purged {result.rowcount} search log rows")
+    return {"rows": result.rowcount}
+
+
+write_queue.register("search-log", save_search_log_batch)
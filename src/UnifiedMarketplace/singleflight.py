@@ -0,0 +1,229 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine, text
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Coalescing mode: "off", "process" (threads in one worker) or "database" (all workers)
+COALESCE_MODE = os.environ.get("COALESCE_MODE", "process")
+COALESCE_WAIT_TIMEOUT = float(os.environ.get("COALESCE_WAIT_TIMEOUT", 20))  # Seconds a follower waits for the leader
+COALESCE_POLL_INTERVAL = float(os.environ.get("COALESCE_POLL_INTERVAL", 0.1))  # Seconds between cache re-checks
+COALESCE_LOCK_POOL_SIZE = int(os.environ.get("COALESCE_LOCK_POOL_SIZE", 5))  # Connections holding locks, apart from the app's pool
+
+
+class _Call:
+    """An in-flight call that followers wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def advisory_lock_id(key):
+    """
+    Map a string key to a signed 64-bit Postgres advisory lock ID.
+
+    Args:
+        key (str): The key to lock on
+
+    Returns:
+        int: A stable lock ID for the key
+    """
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+class SingleFlight:
+    """
+    Collapse concurrent calls for the same key into a single execution.
+
+    In "process" mode threads of one worker share the leader's result. In
+    "database" mode the leader also holds a Postgres advisory lock for the key,
+    so leaders in other workers wait and re-check the cache instead of calling
+    upstream themselves. The lock is held on a connection from a small pool of
+    its own, so a slow upstream call doesn't keep one of the app's connections
+    checked out. Other databases fall back to process mode.
+    """
+
+    def __init__(self, mode=COALESCE_MODE, wait_timeout=COALESCE_WAIT_TIMEOUT,
+                 poll_interval=COALESCE_POLL_INTERVAL):
+        """
+        Args:
+            mode (str): "off", "process" or "database"
+            wait_timeout (float): Seconds a follower waits before running the call itself
+            poll_interval (float): Seconds between cache re-checks while another worker leads
+        """
+        self.mode = mode
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._lock_engine = None  # Created on first use in database mode
+
+        # Metrics
+        self.executed = 0  # Calls that actually ran fn
+        self.collapsed = 0  # Calls served by another thread's in-flight call
+        self.remote_collapsed = 0  # Calls served by another worker's result
+        self.wait_timeouts = 0  # Followers that gave up waiting and ran fn
+
+    def do(self, key, fn, recheck=None):
+        """
+        Run fn for key, unless an identical call is already in flight.
+
+        Args:
+            key (str): Identifies identical calls, e.g. the search cache key
+            fn (callable): Produces the result (and is responsible for caching it, see
+                crosses_processes)
+            recheck (callable): Returns the result if another worker already produced
+                it (possibly empty), else None - used in database mode, usually a cache lookup
+
+        Returns:
+            The result of fn, or of the in-flight call that was joined
+        """
+        if self.mode == "off":
+            return self._execute(fn)
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            if call.done.wait(self.wait_timeout):
+                with self._lock:
+                    self.collapsed += 1
+                if call.error is not None:
+                    raise call.error
+                return call.result
+
+            logging.warning(f"Timed out waiting for in-flight call for key: {key}")
+            with self._lock:
+                self.wait_timeouts += 1
+            return self._execute(fn)
+
+        try:
+            if self.mode == "database":
+                call.result = self._do_across_processes(key, fn, recheck)
+            else:
+                call.result = self._execute(fn)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def crosses_processes(self):
+        """
+        Check whether leaders in other workers wait on this worker's calls.
+
+        Their recheck reads the shared cache, so in this mode fn must write its
+        result to the database before returning, not just queue the write.
+
+        Returns:
+            bool: True in database mode on Postgres
+        """
+        # Import here to avoid circular imports
+        from app import db
+
+        return self.mode == "database" and db.engine.dialect.name == "postgresql"
+
+    def stats(self):
+        """
+        Get coalescing counters.
+
+        Returns:
+            dict: Executed, collapsed and timed-out call counts
+        """
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "in_flight": len(self._calls),
+                "executed": self.executed,
+                "collapsed": self.collapsed,
+                "remote_collapsed": self.remote_collapsed,
+                "wait_timeouts": self.wait_timeouts
+            }
+
+    def _execute(self, fn):
+        with self._lock:
+            self.executed += 1
+        return fn()
+
+    def _get_lock_engine(self):
+        """The engine advisory locks are taken on, sharing the app's database and options"""
+        # Import here to avoid circular imports
+        from app import app, db
+
+        with self._lock:
+            if self._lock_engine is None:
+                options = {**app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {}),
+                           "pool_size": COALESCE_LOCK_POOL_SIZE, "max_overflow": COALESCE_LOCK_POOL_SIZE}
+                self._lock_engine = create_engine(db.engine.url, **options)
+            return self._lock_engine
+
+    def _do_across_processes(self, key, fn, recheck):
+        if not self.crosses_processes():
+            return self._execute(fn)
+
+        engine = self._get_lock_engine()
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            # The connection is only kept while the lock is held - followers return it before polling
+            with _advisory_lock(engine, advisory_lock_id(key)) as acquired:
+                if acquired:
+                    # Another worker may have finished while we were waiting for the lock
+                    if recheck is not None:
+                        result = recheck()
+                        if result is not None:
+                            with self._lock:
+                                self.remote_collapsed += 1
+                            return result
+                    return self._execute(fn)
+
+            # Another worker is fetching - wait for its result to land in the cache
+            if recheck is not None:
+                result = recheck()
+                if result is not None:
+                    with self._lock:
+                        self.remote_collapsed += 1
+                    return result
+
+            if time.monotonic() >= deadline:
+                logging.warning(f"Timed out waiting for another worker to fetch key: {key}")
+                with self._lock:
+                    self.wait_timeouts += 1
+                return self._execute(fn)
+
+            time.sleep(self.poll_interval)
+
+
+@contextmanager
+def _advisory_lock(engine, lock_id):
+    """Try to take a session-level advisory lock, releasing it on exit"""
+    with engine.connect() as connection:
+        acquired = connection.execute(
+            text("SELECT pg_try_advisory_lock(:lock_id)"), {"lock_id": lock_id}
+        ).scalar()
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                connection.execute(text("SELECT pg_advisory_unlock(:lock_id)"), {"lock_id": lock_id})
+            connection.commit()
+
+
+# Shared coalescer for upstream product searches
+search_flight = SingleFlight()
@@ -6,13 +6,27 @@
 // Cache duration in minutes
 const CACHE_DURATION = 60;
 
+// Must match CACHE_KEY_VERSION in cache_keys.py - the server renders the
+// canonical key into the page, so entries stored under any other version
+// (including the old raw f-string keys) can never be looked up again
+const CACHE_KEY_VERSION = 'v2';
+
+/**
+ * Check whether a cache key was built by the current server-side key scheme
+ * @param {string} cacheKey - Cache key rendered by the server
+ * @returns {boolean} - True if the key is a current canonical key
+ */
+function isCanonicalKey(cacheKey) {
+    return typeof cacheKey === 'string' && cacheKey.startsWith(`${CACHE_KEY_VERSION}:`);
+}
+
 /**
  * Save search results to localStorage
  * @param {string} cacheKey - Unique identifier for the search
  * @param {Array} products - Product search results
  */
 function saveToCache(cacheKey, products) {
-    if (!cacheKey || !products) return;
+    if (!isCanonicalKey(cacheKey) || !products) return;
     
     try {
         // Create cache object with expiration time
@@ -36,7 +50,7 @@ function saveToCache(cacheKey, products) {
  * @returns {Array|null} - Cached products or null if not found/expired
  */
 function getFromCache(cacheKey) {
-    if (!cacheKey) return null;
+    if (!isCanonicalKey(cacheKey)) return null;
     
     try {
         // Get cache from localStorage
@@ -64,19 +78,26 @@ function getFromCache(cacheKey) {
 }
 
 /**
- * Clear all expired cache entries from localStorage
+ * Clear all expired and legacy-keyed cache entries from localStorage
  */
 function cleanExpiredCache() {
     try {
         const currentTime = new Date().getTime();
         let count = 0;
         
-        // Check all localStorage items
-        for (let i = 0; i < localStorage.length; i++) {
+        // Check all localStorage items (backwards, since we remove while iterating)
+        for (let i = localStorage.length - 1; i >= 0; i--) {
             const key = localStorage.key(i);
             
             // Only process our search cache items
             if (key && key.startsWith('search_')) {
+                // Remove entries stored under an old key scheme
+                if (!isCanonicalKey(key.slice('search_'.length))) {
+                    localStorage.removeItem(key);
+                    count++;
+                    continue;
+                }
+                
                 try {
                     const cacheData = localStorage.getItem(key);
                     const cache = JSON.parse(cacheData);
@@ -90,9 +90,20 @@ document.addEventListener('DOMContentLoaded', function() {
             filterForm.appendChild(applyInput);
         }
         
-        // Set value to trigger API call
         applyInput.value = 'true';
         
+        // Send the search on screen, so narrower filters and new sort orders
+        // are worked out from its results instead of calling the API again
+        let refineInput = document.getElementById('refine-from-input');
+        if (!refineInput) {
+            refineInput = document.createElement('input');
+            refineInput.type = 'hidden';
+            refineInput.id = 'refine-from-input';
+            refineInput.name = 'refine_from';
+            filterForm.appendChild(refineInput);
+        }
+        refineInput.value = window.location.search;
+        
         // Show loading indicator
         document.getElementById('loading-indicator').style.display = 'block';
         document.getElementById('results-container').style.opacity = '0.5';
@@ -0,0 +1,662 @@
+import logging
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, delete, func, or_, select, text
+
+import cache_codec
+from singleflight import advisory_lock_id
+from write_behind import write_queue
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Import models and db within functions to avoid circular imports
+
+# Where users, search history and cached searches live: "sqlalchemy", "supabase" or "memory".
+# Reads and writes go to the primary; writes are copied to the secondary in the background.
+# By default SQLAlchemy is primary (its user IDs are the session IDs) and Supabase, if
+# configured, is the secondary.
+STORAGE_PRIMARY = os.environ.get("STORAGE_PRIMARY", "sqlalchemy")
+STORAGE_SECONDARY = os.environ.get("STORAGE_SECONDARY")  # Same choices, or "none"
+
+
+class StorageError(Exception):
+    """A storage backend failed to read or write"""
+
+
+@dataclass
+class CacheEntry:
+    """A cached search as stored by a backend"""
+    cache_key: str
+    payload: object  # cache_codec bytes, or text (Supabase rows and legacy JSON rows)
+    created_at: datetime
+    expires_at: datetime
+
+
+def _to_datetime(value):
+    """Convert an ISO string from Supabase to a naive UTC datetime"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value is not None and value.tzinfo is not None:
+        value = value.replace(tzinfo=None) - value.utcoffset()
+    return value
+
+
+class StorageBackend(ABC):
+    """
+    Persistence for users, search history and cached searches.
+
+    Users are dictionaries with id, username, email, password_hash and
+    created_at. Search history items are dictionaries with user_id, query,
+    parameters and created_at. Methods raise on failure; lookups return
+    None (or an empty list) when nothing matches. A backend missing any
+    of these methods fails when it is created.
+    """
+    name = "base"
+
+    @abstractmethod
+    def get_user(self, user_id):
+        """Get a user by ID, or None"""
+
+    @abstractmethod
+    def get_user_by_email(self, email):
+        """Get a user by email, or None"""
+
+    @abstractmethod
+    def find_existing_user(self, username, email):
+        """
+        Check whether a username or email is taken, in one lookup.
+
+        Returns:
+            tuple: (user with this username, user with this email), each None if not found
+        """
+
+    @abstractmethod
+    def create_user(self, username, email, password_hash, user_id=None):
+        """
+        Create a user.
+
+        Args:
+            user_id (int): ID to create the user with, defaults to the backend's next ID
+
+        Returns:
+            dict: The created user
+        """
+
+    @abstractmethod
+    def get_search_history(self, user_id, limit=10):
+        """Get a user's most recent searches, newest first"""
+
+    @abstractmethod
+    def save_searches(self, searches):
+        """Save search history items"""
+
+    @abstractmethod
+    def get_cached(self, keys, now):
+        """
+        Get the cached search for the first key that has an unexpired entry.
+
+        Args:
+            keys (list): Cache keys in order of preference
+            now (datetime): Entries expiring before this are ignored
+
+        Returns:
+            CacheEntry: The entry, or None
+        """
+
+    @abstractmethod
+    def store_cached(self, entries, duration_hours):
+        """
+        Insert or replace cached searches.
+
+        Args:
+            entries (list): (cache_key, payload bytes, created_at) tuples, one per key
+            duration_hours (float): Hours until each entry expires
+        """
+
+    @abstractmethod
+    def purge_expired(self, before, chunk_size, pause):
+        """
+        Delete cached searches that expired before a cutoff.
+
+        Returns:
+            dict: "rows" and approximate "bytes" freed, plus backend-specific counts
+        """
+
+
+class SQLAlchemyBackend(StorageBackend):
+    """The app's own database, through Flask-SQLAlchemy"""
+    name = "sqlalchemy"
+
+    @staticmethod
+    def _user_dict(user):
+        if user is None:
+            return None
+        return {
+            "id": user.id,
+            "username": user.username,
+            "email": user.email,
+            "password_hash": user.password_hash,
+            "created_at": user.created_at
+        }
+
+    def get_user(self, user_id):
+        # Import here to avoid circular imports
+        from models import User
+        from app import db
+
+        return self._user_dict(db.session.get(User, user_id))
+
+    def get_user_by_email(self, email):
+        # Import here to avoid circular imports
+        from models import User
+        from app import db
+
+        return self._user_dict(db.session.query(User).filter(User.email == email).first())
+
+    def find_existing_user(self, username, email):
+        # Import here to avoid circular imports
+        from models import User
+        from app import db
+
+        matches = db.session.query(User).filter(or_(User.username == username, User.email == email)).all()
+        existing_user = next((user for user in matches if user.username == username), None)
+        existing_email = next((user for user in matches if user.email == email), None)
+        return self._user_dict(existing_user), self._user_dict(existing_email)
+
+    def create_user(self, username, email, password_hash, user_id=None):
+        # Import here to avoid circular imports
+        from models import User
+        from app import db
+
+        try:
+            user = User(id=user_id, username=username, email=email, password_hash=password_hash)
+            db.session.add(user)
+            db.session.commit()
+            return self._user_dict(user)
+        except Exception as e:
+            db.session.rollback()
+            raise StorageError(f"Error creating user in database: {e}") from e
+
+    def get_search_history(self, user_id, limit=10):
+        # Import here to avoid circular imports
+        from models import SearchHistory
+        from app import db
+
+        searches = db.session.query(SearchHistory).filter(
+            SearchHistory.user_id == user_id
+        ).order_by(SearchHistory.created_at.desc()).limit(limit).all()
+        return [
+            {
+                "id": search.id,
+                "user_id": search.user_id,
+                "query": search.query,
+                "parameters": search.parameters,
+                "created_at": search.created_at
+            }
+            for search in searches
+        ]
+
+    def save_searches(self, searches):
+        # Import here to avoid circular imports
+        from models import SearchHistory
+        from app import db
+
+        # One transaction for the whole batch
+        try:
+            db.session.add_all([SearchHistory(**search) for search in searches])
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            raise StorageError(f"Error saving search history: {e}") from e
+
+    def get_cached(self, keys, now):
+        # Import here to avoid circular imports
+        from models import CachedSearch
+        from app import db
+
+        # Look up all candidate keys in one query and prefer them in order
+        cached_entries = db.session.query(CachedSearch).filter(
+            CachedSearch.cache_key.in_(keys),
+            CachedSearch.expires_at > now
+        ).all()
+        if not cached_entries:
+            return None
+
+        # Prefer keys in order, then the latest row of a key
+        cached_entry = min(cached_entries, key=lambda entry: (keys.index(entry.cache_key), -entry.expires_at.timestamp()))
+        # Rows written before the payload column existed only have JSON text
+        payload = cached_entry.payload if cached_entry.payload is not None else cached_entry.results
+        return CacheEntry(cached_entry.cache_key, payload, cached_entry.created_at, cached_entry.expires_at)
+
+    def store_cached(self, entries, duration_hours):
+        # Import here to avoid circular imports
+        from models import CachedSearch
+        from app import db
+
+        # Later entries for a key win
+        latest = {cache_key: (payload, created_at) for cache_key, payload, created_at in entries}
+
+        try:
+            if db.engine.dialect.name == "postgresql":
+                # The partitioned cache table has no unique constraint on cache_key, so writers
+                # of a key take turns (locks taken in key order) and replace its rows
+                for cache_key in sorted(latest):
+                    db.session.execute(text("SELECT pg_advisory_xact_lock(:lock_id)"),
+                                       {"lock_id": advisory_lock_id(f"cache-write:{cache_key}")})
+                db.session.execute(delete(CachedSearch).where(CachedSearch.cache_key.in_(list(latest))))
+                existing = {}
+            else:
+                # Load all existing entries for these keys in one query
+                existing = {
+                    entry.cache_key: entry
+                    for entry in db.session.query(CachedSearch).filter(CachedSearch.cache_key.in_(list(latest)))
+                }
+
+            for cache_key, (payload, created_at) in latest.items():
+                # Calculate the expiration time
+                expires_at = created_at + timedelta(hours=duration_hours)
+
+                # If entry exists, update it
+                existing_cache = existing.get(cache_key)
+                if existing_cache:
+                    existing_cache.payload = payload
+                    existing_cache.results = None
+                    existing_cache.created_at = created_at
+                    existing_cache.expires_at = expires_at
+                else:
+                    # Create a new cache entry
+                    db.session.add(CachedSearch(
+                        cache_key=cache_key,
+                        payload=payload,
+                        created_at=created_at,
+                        expires_at=expires_at
+                    ))
+
+            # Commit all the changes together
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            raise StorageError(f"Error caching results: {e}") from e
+
+    def purge_expired(self, before, chunk_size, pause):
+        """
+        Delete expired entries with set-based deletes in primary key chunks.
+
+        Each chunk is found by selecting only ids, sized with an aggregate query
+        and removed with a single DELETE, so the large payload columns are never
+        loaded. Chunks commit separately and the purge sleeps between them, which
+        keeps transactions short while traffic is live.
+        """
+        # Import here to avoid circular imports
+        from models import CachedSearch
+        from app import db
+        from migrations import drop_expired_cache_partitions
+
+        stats = {"rows": 0, "bytes": 0, "partitions_dropped": 0}
+        try:
+            # With the partitioned layout, whole days of expired entries go with one DROP TABLE
+            if db.engine.dialect.name == "postgresql":
+                stats["partitions_dropped"] = drop_expired_cache_partitions(before, db.engine)
+
+            last_id = 0
+            while True:
+                # Find the next chunk of expired ids in primary key order
+                ids = db.session.execute(
+                    select(CachedSearch.id)
+                    .where(CachedSearch.expires_at < before, CachedSearch.id > last_id)
+                    .order_by(CachedSearch.id)
+                    .limit(chunk_size)
+                ).scalars().all()
+                if not ids:
+                    break
+
+                chunk = and_(
+                    CachedSearch.id >= ids[0],
+                    CachedSearch.id <= ids[-1],
+                    CachedSearch.expires_at < before
+                )
+                freed_bytes = db.session.execute(
+                    select(
+                        func.coalesce(func.sum(func.length(CachedSearch.payload)), 0) +
+                        func.coalesce(func.sum(func.length(CachedSearch.results)), 0)
+                    ).where(chunk)
+                ).scalar()
+                deleted = db.session.execute(
+                    delete(CachedSearch).where(chunk).execution_options(synchronize_session=False)
+                ).rowcount
+                db.session.commit()
+
+                stats["rows"] += deleted
+                stats["bytes"] += int(freed_bytes or 0)
+                last_id = ids[-1]
+                logging.info(f"Cleared chunk of {deleted} expired cache entries")
+
+                if pause and len(ids) == chunk_size:
+                    time.sleep(pause)
+        except Exception as e:
+            db.session.rollback()
+            raise StorageError(f"Error clearing SQLAlchemy cache: {e}") from e
+
+        return stats
+
+
+class SupabaseBackend(StorageBackend):
+    """Supabase tables, through the supabase_client helpers"""
+    name = "supabase"
+
+    @staticmethod
+    def _user_dict(user):
+        # Copy, as supabase_client caches its rows
+        if not user:
+            return None
+        return dict(user, created_at=_to_datetime(user.get("created_at")))
+
+    def get_user(self, user_id):
+        from supabase_client import get_user_by_id
+        return self._user_dict(get_user_by_id(user_id))
+
+    def get_user_by_email(self, email):
+        from supabase_client import get_user_by_email
+        return self._user_dict(get_user_by_email(email))
+
+    def find_existing_user(self, username, email):
+        from supabase_client import find_existing_user
+
+        existing_user, existing_email = find_existing_user(username, email)
+        return self._user_dict(existing_user), self._user_dict(existing_email)
+
+    def create_user(self, username, email, password_hash, user_id=None):
+        from supabase_client import create_user
+
+        user = create_user(username, email, password_hash, user_id=user_id)
+        if not user:
+            raise StorageError("Error creating user in Supabase")
+        return self._user_dict(user)
+
+    def get_search_history(self, user_id, limit=10):
+        from supabase_client import get_search_history
+
+        searches = get_search_history(user_id, limit)
+        for search in searches:
+            search["created_at"] = _to_datetime(search.get("created_at")) or datetime.utcnow()
+        return searches
+
+    def save_searches(self, searches):
+        from supabase_client import save_searches_many
+
+        if save_searches_many(searches) < 0:
+            raise StorageError("Error saving search history to Supabase")
+
+    def get_cached(self, keys, now):
+        from supabase_client import get_cached_search
+
+        row = get_cached_search(keys[0], fallback_keys=keys[1:], now=now)
+        if not row:
+            return None
+        return CacheEntry(row.get("cache_key", keys[0]), row.get("results", "[]"),
+                          _to_datetime(row["created_at"]), _to_datetime(row["expires_at"]))
+
+    def store_cached(self, entries, duration_hours):
+        from supabase_client import cache_search_results_many
+
+        # The Supabase results column is text, so payloads are stored base64-wrapped
+        written = cache_search_results_many([
+            {"cache_key": cache_key, "results": cache_codec.to_text(payload), "created_at": created_at}
+            for cache_key, payload, created_at in entries
+        ], duration_hours)
+        if written < 0:
+            raise StorageError("Error caching results in Supabase")
+
+    def purge_expired(self, before, chunk_size, pause):
+        from supabase_client import clear_expired_cache
+
+        removed = clear_expired_cache(before=before, chunk_size=chunk_size)
+        if removed < 0:
+            raise StorageError("Error clearing Supabase cache")
+        return {"rows": removed, "bytes": 0}
+
+
+class InMemoryBackend(StorageBackend):
+    """
+    Process-local dictionaries, for load tests and local runs without databases.
+
+    Nothing is shared between workers or survives a restart.
+    """
+    name = "memory"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._users = {}  # id -> user
+        self._next_user_id = 1
+        self._searches = []
+        self._cache = {}  # cache_key -> CacheEntry
+
+    def get_user(self, user_id):
+        with self._lock:
+            user = self._users.get(user_id)
+            return dict(user) if user else None
+
+    def get_user_by_email(self, email):
+        with self._lock:
+            return next((dict(user) for user in self._users.values() if user["email"] == email), None)
+
+    def find_existing_user(self, username, email):
+        with self._lock:
+            existing_user = next((dict(user) for user in self._users.values() if user["username"] == username), None)
+            existing_email = next((dict(user) for user in self._users.values() if user["email"] == email), None)
+            return existing_user, existing_email
+
+    def create_user(self, username, email, password_hash, user_id=None):
+        with self._lock:
+            if any(user["username"] == username or user["email"] == email for user in self._users.values()):
+                raise StorageError("Username or email already exists")
+            if user_id is None:
+                user_id = self._next_user_id
+            self._next_user_id = max(self._next_user_id, user_id + 1)
+            user = {
+                "id": user_id,
+                "username": username,
+                "email": email,
+                "password_hash": password_hash,
+                "created_at": datetime.utcnow()
+            }
+            self._users[user_id] = user
+            return dict(user)
+
+    def get_search_history(self, user_id, limit=10):
+        with self._lock:
+            searches = [dict(search) for search in self._searches if search["user_id"] == user_id]
+        searches.sort(key=lambda search: search["created_at"], reverse=True)
+        return searches[:limit]
+
+    def save_searches(self, searches):
+        with self._lock:
+            for search in searches:
+                self._searches.append(dict(search, created_at=search.get("created_at") or datetime.utcnow()))
+
+    def get_cached(self, keys, now):
+        with self._lock:
+            for cache_key in keys:
+                entry = self._cache.get(cache_key)
+                if entry is not None and entry.expires_at > now:
+                    return entry
+        return None
+
+    def store_cached(self, entries, duration_hours):
+        with self._lock:
+            for cache_key, payload, created_at in entries:
+                self._cache[cache_key] = CacheEntry(cache_key, payload, created_at,
+                                                    created_at + timedelta(hours=duration_hours))
+
+    def purge_expired(self, before, chunk_size, pause):
+        with self._lock:
+            expired = [entry for entry in self._cache.values() if entry.expires_at < before]
+            for entry in expired:
+                del self._cache[entry.cache_key]
+        return {"rows": len(expired), "bytes": sum(len(entry.payload) for entry in expired)}
+
+
+class ReplicatedStorage(StorageBackend):
+    """
+    A primary backend with writes copied to an optional secondary in the background.
+
+    Requests only wait on the primary. Successful writes are queued on the
+    write-behind queue and applied to the secondary, users keeping the ID the
+    primary gave them. If a primary read fails, the secondary is read instead.
+    A login for a user only the secondary knows copies it to the primary,
+    which moves users over when the primary changes.
+    """
+
+    def __init__(self, primary, secondary=None):
+        """
+        Args:
+            primary (StorageBackend): Serves all reads and synchronous writes
+            secondary (StorageBackend): Receives copies of writes, or None
+        """
+        self.primary = primary
+        self.secondary = secondary
+        self.name = f"{primary.name}+{secondary.name}" if secondary else primary.name
+
+    def _read(self, method, *args):
+        try:
+            return getattr(self.primary, method)(*args)
+        except Exception as e:
+            if self.secondary is None:
+                raise
+            logging.error(f"Primary storage {self.primary.name} failed on {method}, "
+                          f"reading {self.secondary.name}: {e}")
+            return getattr(self.secondary, method)(*args)
+
+    def _replicate(self, method, *args):
+        if self.secondary is not None:
+            write_queue.submit("replicate", (method, args))
+
+    def replicate_batch(self, items):
+        """Write-behind handler: apply queued writes to the secondary, returns the number that failed"""
+        failed = 0
+        for method, args in items:
+            try:
+                getattr(self.secondary, method)(*args)
+            except Exception as e:
+                logging.error(f"Replicating {method} to {self.secondary.name} failed: {e}")
+                failed += 1
+        return failed
+
+    def get_user(self, user_id):
+        return self._read("get_user", user_id)
+
+    def get_user_by_email(self, email):
+        user = self._read("get_user_by_email", email)
+        if user is None and self.secondary is not None:
+            secondary_user = self.secondary.get_user_by_email(email)
+            if secondary_user:
+                # The ID may already be taken in the primary, so the user gets a new one
+                logging.info(f"Copying user {email} from {self.secondary.name} to {self.primary.name}")
+                user = self.primary.create_user(secondary_user["username"], secondary_user["email"],
+                                                secondary_user["password_hash"])
+        return user
+
+    def find_existing_user(self, username, email):
+        return self._read("find_existing_user", username, email)
+
+    def create_user(self, username, email, password_hash, user_id=None):
+        user = self.primary.create_user(username, email, password_hash, user_id=user_id)
+        self._replicate("create_user", username, email, password_hash, user["id"])
+        return user
+
+    def get_search_history(self, user_id, limit=10):
+        return self._read("get_search_history", user_id, limit)
+
+    def save_searches(self, searches):
+        self.primary.save_searches(searches)
+        self._replicate("save_searches", searches)
+
+    def get_cached(self, keys, now):
+        return self._read("get_cached", keys, now)
+
+    def store_cached(self, entries, duration_hours):
+        self.primary.store_cached(entries, duration_hours)
+        self._replicate("store_cached", entries, duration_hours)
+
+    def purge_expired(self, before, chunk_size, pause):
+        # Purges run in maintenance jobs, not requests, so both stores are purged directly
+        stats = self.primary.purge_expired(before, chunk_size, pause)
+        if self.secondary is not None:
+            try:
+                stats["secondary"] = self.secondary.purge_expired(before, chunk_size, pause)
+            except Exception as e:
+                logging.error(f"Error purging {self.secondary.name} cache: {e}")
+        return stats
+
+
+BACKENDS = {
+    "sqlalchemy": SQLAlchemyBackend,
+    "supabase": SupabaseBackend,
+    "memory": InMemoryBackend,
+}
+
+_storage = None
+_storage_lock = threading.Lock()
+
+def make_backend(name):
+    """
+    Create a backend by name.
+
+    Args:
+        name (str): "sqlalchemy", "supabase" or "memory"
+
+    Returns:
+        StorageBackend: The backend
+    """
+    try:
+        return BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown storage backend: {name}") from None
+
+def get_storage():
+    """
+    Get the shared storage, created from STORAGE_PRIMARY/STORAGE_SECONDARY on first use.
+
+    Returns:
+        ReplicatedStorage: The configured storage
+    """
+    global _storage
+
+    if _storage is not None:
+        return _storage
+
+    with _storage_lock:
+        if _storage is None:
+            from supabase_client import SUPABASE_URL, SUPABASE_KEY
+
+            secondary = STORAGE_SECONDARY
+            if secondary is None:
+                supabase_configured = bool(SUPABASE_URL and SUPABASE_KEY)
+                secondary = "supabase" if supabase_configured and STORAGE_PRIMARY != "supabase" else "none"
+
+            _storage = ReplicatedStorage(
+                make_backend(STORAGE_PRIMARY),
+                make_backend(secondary) if secondary != "none" else None
+            )
+            logging.info(f"Using storage: {_storage.name}")
+        return _storage
+
+def set_storage(storage):
+    """
+    Replace the shared storage, e.g. with in-memory storage for load tests.
+
+    Args:
+        storage (ReplicatedStorage): The storage to use
+    """
+    global _storage
+
+    with _storage_lock:
+        _storage = storage
+
+write_queue.register("replicate", lambda items: get_storage().replicate_batch(items))
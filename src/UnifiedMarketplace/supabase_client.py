@@ -1,6 +1,9 @@
 import os
 import logging
-from supabase import create_client
+import threading
+from postgrest import ReturnMethod
+
+from user_cache import get_cached_supabase_user, invalidate_user, remember_supabase_user
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG, format="%(asctime)s - %(levelname)s - %(message)s")
@@ -14,86 +17,185 @@ USERS_TABLE = "unified_marketplace_users"
 SEARCH_HISTORY_TABLE = "unified_marketplace_searches"
 CACHE_TABLE = "unified_marketplace_cache"
 
-# If we have environment variables, initializing the client
-if SUPABASE_URL and SUPABASE_KEY:
-    try:
-        supabase_client = create_client(SUPABASE_URL, SUPABASE_KEY)
-        logging.info("Supabase client initialized successfully")
+# Bounds for each bulk request, keeping PostgREST payloads small
+BATCH_MAX_ROWS = int(os.environ.get("SUPABASE_BATCH_MAX_ROWS", 100))
+BATCH_MAX_BYTES = int(os.environ.get("SUPABASE_BATCH_MAX_BYTES", 1024 * 1024))
+
+# Table layouts expected in Supabase - these should match our SQLAlchemy models.
+# Supabase table creation requires using the dashboard, we can't create tables
+# programmatically through the REST API without setting up custom functions
+users_schema = {
+    "id": "serial primary key",
+    "username": "varchar(64) unique not null", 
+    "email": "varchar(120) unique not null",
+    "password_hash": "varchar(256) not null",
+    "created_at": "timestamp default now()"
+}
+
+search_history_schema = {
+    "id": "serial primary key",
+    "user_id": "int not null",
+    "query": "varchar(255) not null",
+    "parameters": "text",
+    "created_at": "timestamp default now()"
+}
+
+cache_schema = {
+    "id": "serial primary key",
+    "cache_key": "varchar(512) unique not null",
+    "results": "text not null",
+    "created_at": "timestamp default now()",
+    "expires_at": "timestamp not null"
+}
+
+# The client is created on first use, not at import, so workers boot without touching the network
+_client = None
+_client_loaded = False
+_client_lock = threading.Lock()
+_tables_checked = None
+
+def get_supabase_client():
+    """
+    Get the shared Supabase client, creating it on first use.
+    
+    Returns:
+        Client: The Supabase client, None if not configured or creation failed
+    """
+    global _client, _client_loaded
+    
+    if _client_loaded:
+        return _client
         
-        # Ensuring tables exist by checking for their presence
-        def check_table_exists(table_name):
+    with _client_lock:
+        if _client_loaded:
+            return _client
+            
+        # If we have environment variables, initializing the client
+        if SUPABASE_URL and SUPABASE_KEY:
             try:
-                # Just fetching one row to see if table exists
-                response = supabase_client.table(table_name).select("*").limit(1).execute()
-                return True
-            except Exception as e:
-                if "404" in str(e) or "does not exist" in str(e).lower():
-                    logging.warning(f"Checking if table {table_name} exists in Supabase")
-                    return False
-                else:
-                    # Some other error
-                    logging.error(f"Error checking table {table_name}: {e}")
-                    return False
-                    
-        # Supabase table creation requires using the dashboard
-# We can't create tables programmatically through the REST API without setting up custom functions
-        def create_table_if_not_exists(table_name, schema):
-            """Checking if a table exists in Supabase"""
-            if check_table_exists(table_name):
-                logging.info(f"Table {table_name} already exists in Supabase")
-                return True
+                # Import here so processes without Supabase don't pay for the import
+                from supabase import create_client
                 
-            # We can't create tables programmatically without special setup
-            logging.warning(f"Table {table_name} doesn't exist in Supabase.")
-            logging.warning(f"Please create it manually in the Supabase dashboard.")
+                _client = create_client(SUPABASE_URL, SUPABASE_KEY)
+                logging.info("Supabase client initialized successfully")
+            except Exception as e:
+                logging.error(f"Error initializing Supabase client: {e}")
+                _client = None
+        else:
+            logging.warning("Supabase URL and/or key not found in environment variables. Using SQLAlchemy with PostgreSQL.")
+            _client = None
+        _client_loaded = True
+        return _client
+
+def set_supabase_client(client):
+    """
+    Replace the shared Supabase client, e.g. with a stand-in for benchmarks.
+    
+    Args:
+        client: A Supabase client, or None to disable Supabase
+    """
+    global _client, _client_loaded, _tables_checked
+    
+    with _client_lock:
+        _client = client
+        _client_loaded = True
+        _tables_checked = None
+
+def check_table_exists(table_name):
+    """
+    Ensuring a table exists by checking for its presence.
+    
+    Args:
+        table_name (str): Supabase table name
+        
+    Returns:
+        bool: True if the table could be queried
+    """
+    client = get_supabase_client()
+    if not client:
+        return False
+        
+    try:
+        # Just fetching one row to see if table exists
+        client.table(table_name).select("*").limit(1).execute()
+        return True
+    except Exception as e:
+        if "404" in str(e) or "does not exist" in str(e).lower():
+            logging.warning(f"Checking if table {table_name} exists in Supabase")
             return False
-            
-        # Defining our table schemas - these should match our SQLAlchemy models
-        users_schema = {
-            "id": "serial primary key",
-            "username": "varchar(64) unique not null", 
-            "email": "varchar(120) unique not null",
-            "password_hash": "varchar(256) not null",
-            "created_at": "timestamp default now()"
-        }
+        else:
+            # Some other error
+            logging.error(f"Error checking table {table_name}: {e}")
+            return False
+
+def check_supabase_tables(force=False):
+    """
+    Check that the required Supabase tables exist, once per process.
+    
+    Run by the init-db command rather than at import, since every check
+    is a network round trip.
+    
+    Args:
+        force (bool): Check again even if a result is already known
         
-        search_history_schema = {
-            "id": "serial primary key",
-            "user_id": "int not null",
-            "query": "varchar(255) not null",
-            "parameters": "text",
-            "created_at": "timestamp default now()"
-        }
+    Returns:
+        bool: True if all tables exist, False if any is missing or Supabase is not configured
+    """
+    global _tables_checked
+    
+    if _tables_checked is not None and not force:
+        return _tables_checked
         
-        cache_schema = {
-            "id": "serial primary key",
-            "cache_key": "varchar(512) unique not null",
-            "results": "text not null",
-            "created_at": "timestamp default now()",
-            "expires_at": "timestamp not null"
-        }
+    if not get_supabase_client():
+        _tables_checked = False
+        return False
         
-        # Checking if required tables exist
-        tables_exist = (
-            check_table_exists(USERS_TABLE) and
-            check_table_exists(SEARCH_HISTORY_TABLE) and
-            check_table_exists(CACHE_TABLE)
-        )
-        
-        if not tables_exist:
-            logging.warning("One or more required Supabase tables don't exist.")
-            logging.warning("To use Supabase for data storage, please create the following tables in the Supabase dashboard:")
-            logging.warning(f"- {USERS_TABLE}")
-            logging.warning(f"- {SEARCH_HISTORY_TABLE}")
-            logging.warning(f"- {CACHE_TABLE}")
-            logging.warning("Using PostgreSQL via SQLAlchemy as fallback for now.")
-            
+    # Checking if required tables exist
+    tables_exist = (
+        check_table_exists(USERS_TABLE) and
+        check_table_exists(SEARCH_HISTORY_TABLE) and
+        check_table_exists(CACHE_TABLE)
+    )
+    
+    if not tables_exist:
+        logging.warning("One or more required Supabase tables don't exist.")
+        logging.warning("To use Supabase for data storage, please create the following tables in the Supabase dashboard:")
+        logging.warning(f"- {USERS_TABLE}")
+        logging.warning(f"- {SEARCH_HISTORY_TABLE}")
+        logging.warning(f"- {CACHE_TABLE}")
+        logging.warning("Using PostgreSQL via SQLAlchemy as fallback for now.")
+        
+    _tables_checked = tables_exist
+    return tables_exist
+
+def get_user_by_id(user_id):
+    """
+    Fetching a user from Supabase by ID.
+    
+    Args:
+        user_id (int): User ID to search for
+    
+    Returns:
+        dict: User data if found, None otherwise
+    """
+    client = get_supabase_client()
+    if not client:
+        logging.warning("Supabase client not initialized. Cannot fetch user.")
+        return None
+        
+    try:
+        response = client.table(USERS_TABLE).select("*").eq("id", user_id).execute()
+        data = response.data
+        
+        if data and len(data) > 0:
+            return data[0]
+        return None
     except Exception as e:
-        logging.error(f"Error initializing Supabase client: {e}")
-        supabase_client = None
-else:
-    logging.warning("Supabase URL and/or key not found in environment variables. Using SQLAlchemy with PostgreSQL.")
-    supabase_client = None
+        if "404" in str(e) or "does not exist" in str(e).lower():
+            logging.warning(f"Table {USERS_TABLE} doesn't exist. Falling back to SQLAlchemy.")
+        else:
+            logging.error(f"Error fetching user by id: {e}")
+        return None
 
 def get_user_by_email(email):
     """
@@ -105,17 +207,24 @@ def get_user_by_email(email):
     Returns:
         dict: User data if found, None otherwise
     """
-    if not supabase_client:
+    client = get_supabase_client()
+    if not client:
         logging.warning("Supabase client not initialized. Cannot fetch user.")
         return None
         
+    # Check the user cache first
+    cached_user = get_cached_supabase_user("email", email)
+    if cached_user is not None:
+        return cached_user
+        
     try:
         # Trying to fetch user, handling case where table doesn't exist
         try:
-            response = supabase_client.table(USERS_TABLE).select("*").eq("email", email).execute()
+            response = client.table(USERS_TABLE).select("*").eq("email", email).execute()
             data = response.data
             
             if data and len(data) > 0:
+                remember_supabase_user(data[0])
                 return data[0]
             return None
         except Exception as inner_e:
@@ -140,17 +249,24 @@ def get_user_by_username(username):
     Returns:
         dict: User data if found, None otherwise
     """
-    if not supabase_client:
+    client = get_supabase_client()
+    if not client:
         logging.warning("Supabase client not initialized. Cannot fetch user.")
         return None
         
+    # Check the user cache first
+    cached_user = get_cached_supabase_user("username", username)
+    if cached_user is not None:
+        return cached_user
+        
     try:
         # Trying to fetch user, handling case where table doesn't exist
         try:
-            response = supabase_client.table(USERS_TABLE).select("*").eq("username", username).execute()
+            response = client.table(USERS_TABLE).select("*").eq("username", username).execute()
             data = response.data
             
             if data and len(data) > 0:
+                remember_supabase_user(data[0])
                 return data[0]
             return None
         except Exception as inner_e:
@@ -165,6 +281,47 @@ def get_user_by_username(username):
         logging.error(f"Error fetching user by username: {e}")
         return None
 
+def _filter_value(value):
+    """Quote a value for a PostgREST or_ filter, which reserves commas, dots and parentheses"""
+    escaped = str(value).replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{escaped}"'
+
+def find_existing_user(username, email):
+    """
+    Check whether a username or email is already registered, in one request.
+    
+    Args:
+        username (str): Username to check
+        email (str): Email to check
+    
+    Returns:
+        tuple: (user with this username, user with this email), each None if not found
+    """
+    client = get_supabase_client()
+    if not client:
+        logging.warning("Supabase client not initialized. Cannot fetch user.")
+        return None, None
+        
+    try:
+        response = client.table(USERS_TABLE).select("*") \
+            .or_(f"username.eq.{_filter_value(username)},email.eq.{_filter_value(email)}") \
+            .execute()
+    except Exception as e:
+        if "404" in str(e) or "does not exist" in str(e).lower():
+            logging.warning(f"Table {USERS_TABLE} doesn't exist. Falling back to SQLAlchemy.")
+        else:
+            logging.error(f"Error checking for existing user: {e}")
+        return None, None
+        
+    existing_user = existing_email = None
+    for user in response.data or []:
+        remember_supabase_user(user)
+        if user.get("username") == username:
+            existing_user = user
+        if user.get("email") == email:
+            existing_email = user
+    return existing_user, existing_email
+
 # Adding a function to manually create the Supabase tables when needed
 # We cannot create tables directly in Supabase through the API without custom functions
 # So we'll instead modifying our approach to insert rows directly, which will work if the tables
@@ -182,7 +339,7 @@ def create_supabase_tables():
     logging.info("Falling back to SQLAlchemy for now.")
     return False
 
-def create_user(username, email, password_hash):
+def create_user(username, email, password_hash, user_id=None):
     """
     Creating a new user in Supabase.
     
@@ -190,11 +347,14 @@ def create_user(username, email, password_hash):
         username (str): Username for new user
         email (str): Email for new user
         password_hash (str): Hashed password
+        user_id (int): ID to create the user with, e.g. when copying a user from
+            another store. Defaults to the next serial ID
         
     Returns:
         dict: Created user data, None if failed
     """
-    if not supabase_client:
+    client = get_supabase_client()
+    if not client:
         logging.warning("Supabase client not initialized. Cannot create user.")
         return None
         
@@ -204,10 +364,13 @@ def create_user(username, email, password_hash):
             "email": email,
             "password_hash": password_hash,
         }
+        if user_id is not None:
+            user_data["id"] = user_id
         
         # Trying to insert the user, and handling case where table doesn't exist
         try:
-            response = supabase_client.table(USERS_TABLE).insert(user_data).execute()
+            response = client.table(USERS_TABLE).insert(user_data).execute()
+            invalidate_user(username=username, email=email)
             
             if response.data and len(response.data) > 0:
                 return response.data[0]
@@ -223,7 +386,7 @@ def create_user(username, email, password_hash):
                 if tables_created:
                     # Trying to insert again
                     try:
-                        response = supabase_client.table(USERS_TABLE).insert(user_data).execute()
+                        response = client.table(USERS_TABLE).insert(user_data).execute()
                         
                         if response.data and len(response.data) > 0:
                             return response.data[0]
@@ -252,14 +415,15 @@ def get_search_history(user_id, limit=10):
     Returns:
         list: Search history items, empty list if none or error
     """
-    if not supabase_client:
+    client = get_supabase_client()
+    if not client:
         logging.warning("Supabase client not initialized. Cannot fetch search history.")
         return []
         
     try:
         # Trying to fetch search history, handling case where table doesn't exist
         try:
-            response = supabase_client.table(SEARCH_HISTORY_TABLE) \
+            response = client.table(SEARCH_HISTORY_TABLE) \
                 .select("*") \
                 .eq("user_id", user_id) \
                 .order("created_at", desc=True) \
@@ -291,7 +455,8 @@ def save_search(user_id, query, parameters):
     Returns:
         dict: Created search record, None if failed
     """
-    if not supabase_client:
+    client = get_supabase_client()
+    if not client:
         logging.warning("Supabase client not initialized. Cannot save search.")
         return None
         
@@ -304,7 +469,7 @@ def save_search(user_id, query, parameters):
         
         # Trying to insert the data, and handling case where table doesn't exist
         try:
-            response = supabase_client.table(SEARCH_HISTORY_TABLE).insert(search_data).execute()
+            response = client.table(SEARCH_HISTORY_TABLE).insert(search_data).execute()
             
             if response.data and len(response.data) > 0:
                 return response.data[0]
@@ -321,36 +486,42 @@ def save_search(user_id, query, parameters):
         logging.error(f"Error saving search: {e}")
         return None
 
-def get_cached_search(cache_key):
+def get_cached_search(cache_key, fallback_keys=None, now=None):
     """
     Getting cached search results.
     
     Args:
         cache_key (str): Unique identifier for the search
+        fallback_keys (list): Older keys for the same search, used if cache_key has no row
+        now (datetime): Entries expiring before this are ignored, defaults to the current time
         
     Returns:
         dict: Cached search data if found and not expired, None otherwise
     """
-    if not supabase_client:
+    client = get_supabase_client()
+    if not client:
         logging.warning("Supabase client not initialized. Cannot get cached search.")
         return None
         
     try:
         import datetime
-        now = datetime.datetime.utcnow().isoformat()
+        now = (now or datetime.datetime.utcnow()).isoformat()
         
         # Trying to fetch cached search, handling case where table doesn't exist
         try:
-            response = supabase_client.table(CACHE_TABLE) \
+            # Fetching all candidate keys in one round trip
+            keys = [cache_key] + [key for key in (fallback_keys or []) if key != cache_key]
+            response = client.table(CACHE_TABLE) \
                 .select("*") \
-                .eq("cache_key", cache_key) \
+                .in_("cache_key", keys) \
                 .gt("expires_at", now) \
                 .execute()
                 
             data = response.data
             
             if data and len(data) > 0:
-                return data[0]
+                # Preferring the newest key style
+                return min(data, key=lambda row: keys.index(row["cache_key"]))
             return None
         except Exception as inner_e:
             # If this is a 404 error (table doesn't exist), logging and returning None
@@ -376,7 +547,8 @@ def cache_search_results(cache_key, results, duration_hours=24):
     Returns:
         dict: Created cache record, None if failed
     """
-    if not supabase_client:
+    client = get_supabase_client()
+    if not client:
         logging.warning("Supabase client not initialized. Cannot cache search results.")
         return None
         
@@ -385,47 +557,18 @@ def cache_search_results(cache_key, results, duration_hours=24):
         from datetime import timedelta
         
         now = datetime.datetime.utcnow()
-        expires_at = (now + timedelta(hours=duration_hours)).isoformat()
+        cache_data = {
+            "cache_key": cache_key,
+            "results": results,
+            "created_at": now.isoformat(),
+            "expires_at": (now + timedelta(hours=duration_hours)).isoformat()
+        }
         
-        # Trying to cache the search results, handling case where table doesn't exist
+        # Upserting on the unique cache_key in one round trip, so concurrent writers can't race
         try:
-            # Checking if this cache key already exists
-            try:
-                existing = supabase_client.table(CACHE_TABLE) \
-                    .select("id") \
-                    .eq("cache_key", cache_key) \
-                    .execute()
-                    
-                if existing.data and len(existing.data) > 0:
-                    # Updating existing cache
-                    cache_id = existing.data[0]["id"]
-                    update_data = {
-                        "results": results,
-                        "created_at": now.isoformat(),
-                        "expires_at": expires_at
-                    }
-                    
-                    response = supabase_client.table(CACHE_TABLE) \
-                        .update(update_data) \
-                        .eq("id", cache_id) \
-                        .execute()
-                else:
-                    # Creating new cache entry
-                    cache_data = {
-                        "cache_key": cache_key,
-                        "results": results,
-                        "created_at": now.isoformat(),
-                        "expires_at": expires_at
-                    }
-                    
-                    response = supabase_client.table(CACHE_TABLE).insert(cache_data).execute()
-            except Exception as inner_e:
-                # If this is a 404 error (table doesn't exist), logging and returning None
-                if "404" in str(inner_e) or "does not exist" in str(inner_e).lower():
-                    logging.warning(f"Table {CACHE_TABLE} doesn't exist. Falling back to SQLAlchemy.")
-                    return None
-                # Otherwise re-raising the exception
-                raise inner_e
+            response = client.table(CACHE_TABLE) \
+                .upsert(cache_data, on_conflict="cache_key") \
+                .execute()
             
             if response.data and len(response.data) > 0:
                 return response.data[0]
@@ -442,27 +585,170 @@ def cache_search_results(cache_key, results, duration_hours=24):
         logging.error(f"Error caching search results: {e}")
         return None
 
-def clear_expired_cache():
+def _chunk_rows(rows, max_rows=BATCH_MAX_ROWS, max_bytes=BATCH_MAX_BYTES):
     """
-    Removing all expired cache entries.
+    Splitting rows into chunks bounded by row count and approximate payload size.
+    
+    Args:
+        rows (list): Row dictionaries to send
+        max_rows (int): Maximum rows per chunk
+        max_bytes (int): Maximum approximate serialized size per chunk
+        
+    Yields:
+        list: Chunks of rows
+    """
+    chunk = []
+    chunk_bytes = 0
+    for row in rows:
+        row_bytes = sum(len(str(value)) for value in row.values())
+        if chunk and (len(chunk) >= max_rows or chunk_bytes + row_bytes > max_bytes):
+            yield chunk
+            chunk = []
+            chunk_bytes = 0
+        chunk.append(row)
+        chunk_bytes += row_bytes
+    if chunk:
+        yield chunk
+
+def cache_search_results_many(entries, duration_hours=24):
+    """
+    Caching many search results with chunked bulk upserts.
+    
+    Args:
+        entries (list): Dictionaries with "cache_key", "results" (str) and
+            optionally "created_at" (datetime, defaults to now)
+        duration_hours (int): Number of hours until each entry expires
+        
+    Returns:
+        int: Number of rows written, -1 if error
+    """
+    client = get_supabase_client()
+    if not client:
+        logging.warning("Supabase client not initialized. Cannot cache search results.")
+        return -1
+        
+    try:
+        import datetime
+        from datetime import timedelta
+        
+        now = datetime.datetime.utcnow()
+        
+        # Keeping only the last entry per key - Postgres rejects an upsert that touches a row twice
+        rows_by_key = {}
+        for entry in entries:
+            created_at = entry.get("created_at") or now
+            rows_by_key[entry["cache_key"]] = {
+                "cache_key": entry["cache_key"],
+                "results": entry["results"],
+                "created_at": created_at.isoformat(),
+                "expires_at": (created_at + timedelta(hours=duration_hours)).isoformat()
+            }
+        
+        written = 0
+        for chunk in _chunk_rows(list(rows_by_key.values())):
+            client.table(CACHE_TABLE) \
+                .upsert(chunk, on_conflict="cache_key", returning=ReturnMethod.minimal) \
+                .execute()
+            written += len(chunk)
+            
+        return written
+    except Exception as e:
+        if "404" in str(e) or "does not exist" in str(e).lower():
+            logging.warning(f"Table {CACHE_TABLE} doesn't exist. Falling back to SQLAlchemy.")
+        else:
+            logging.error(f"Error bulk caching search results: {e}")
+        return -1
+
+def save_searches_many(searches):
+    """
+    Saving many searches to history with chunked multi-row inserts.
+    
+    Args:
+        searches (list): Dictionaries with "user_id", "query", "parameters" and
+            optionally "created_at" (datetime)
+        
+    Returns:
+        int: Number of rows written, -1 if error
+    """
+    client = get_supabase_client()
+    if not client:
+        logging.warning("Supabase client not initialized. Cannot save searches.")
+        return -1
+        
+    try:
+        rows = []
+        for search in searches:
+            row = {
+                "user_id": search["user_id"],
+                "query": search["query"],
+                "parameters": search.get("parameters")
+            }
+            if search.get("created_at"):
+                row["created_at"] = search["created_at"].isoformat()
+            rows.append(row)
+        
+        written = 0
+        for chunk in _chunk_rows(rows):
+            client.table(SEARCH_HISTORY_TABLE) \
+                .insert(chunk, returning=ReturnMethod.minimal) \
+                .execute()
+            written += len(chunk)
+            
+        return written
+    except Exception as e:
+        if "404" in str(e) or "does not exist" in str(e).lower():
+            logging.warning(f"Table {SEARCH_HISTORY_TABLE} doesn't exist. Falling back to SQLAlchemy.")
+        else:
+            logging.error(f"Error bulk saving searches: {e}")
+        return -1
+
+def clear_expired_cache(before=None, chunk_size=BATCH_MAX_ROWS):
+    """
+    Removing all expired cache entries in bounded chunks.
+    
+    Only the ids of expired rows are fetched, never the results column, and
+    each chunk is deleted in its own request so no single statement runs long.
+    
+    Args:
+        before (datetime): Removing entries that expired before this time, defaults to now
+        chunk_size (int): Maximum rows deleted per request
     
     Returns:
         int: Number of removed entries, -1 if error
     """
-    if not supabase_client:
+    client = get_supabase_client()
+    if not client:
         logging.warning("Supabase client not initialized. Cannot clear expired cache.")
         return -1
         
     try:
         import datetime
-        now = datetime.datetime.utcnow().isoformat()
+        cutoff = (before or datetime.datetime.utcnow()).isoformat()
         
-        response = supabase_client.table(CACHE_TABLE) \
-            .delete() \
-            .lt("expires_at", now) \
-            .execute()
+        removed = 0
+        last_id = 0
+        while True:
+            # Finding the next chunk of expired ids in primary key order
+            response = client.table(CACHE_TABLE) \
+                .select("id") \
+                .lt("expires_at", cutoff) \
+                .gt("id", last_id) \
+                .order("id") \
+                .limit(chunk_size) \
+                .execute()
+            ids = [row["id"] for row in response.data or []]
+            if not ids:
+                break
+            
+            client.table(CACHE_TABLE) \
+                .delete(returning=ReturnMethod.minimal) \
+                .in_("id", ids) \
+                .lt("expires_at", cutoff) \
+                .execute()
+            removed += len(ids)
+            last_id = ids[-1]
             
-        return len(response.data) if response.data else 0
+        return removed
     except Exception as e:
         logging.error(f"Error clearing expired cache: {e}")
-        return -1
\ No newline at end of file
+        return -1
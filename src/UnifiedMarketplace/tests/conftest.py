@@ -0,0 +1,78 @@
+"""
+Shared test setup: a throwaway SQLite database, in-memory storage and a fake clock.
+
+Run from the project directory:
+    python -m pytest -q tests
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Keep the run self-contained: a throwaway database, no index on disk, inline writes
+_tmpdir = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmpdir}/test.db"
+os.environ["PRODUCT_INDEX_ENABLED"] = "false"
+os.environ["WRITE_BEHIND_WORKERS"] = "0"
+os.environ["RATE_LIMIT_MODE"] = "off"
+
+# SQLite doesn't take the psycopg2 connect arguments
+import flask_sqlalchemy.extension as extension  # noqa: E402
+_make_engine = extension.SQLAlchemy._make_engine
+
+def _sqlite_engine(self, bind_key, options, app):
+    for option in ("connect_args", "pool_size", "max_overflow"):
+        options.pop(option, None)
+    return _make_engine(self, bind_key, options, app)
+
+extension.SQLAlchemy._make_engine = _sqlite_engine
+
+
+class FakeClock:
+    """Stands in for cache_manager.clock: naive UTC time that only moves when told to"""
+
+    def __init__(self, now=None):
+        self.now = now or datetime(2026, 1, 1, 12, 0, 0)
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, hours=0, seconds=0):
+        self.now += timedelta(hours=hours, seconds=seconds)
+
+
+@pytest.fixture
+def app_module():
+    """The Flask app module, with its tables created"""
+    import app as app_module
+
+    with app_module.app.app_context():
+        app_module.db.create_all()
+    return app_module
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A fake clock installed as cache_manager.clock"""
+    import cache_manager
+
+    fake = FakeClock()
+    monkeypatch.setattr(cache_manager, "clock", fake)
+    return fake
+
+
+@pytest.fixture
+def storage(monkeypatch):
+    """Empty in-memory storage and memory cache for the test"""
+    import storage as storage_module
+    from cache_manager import l1_cache
+
+    memory = storage_module.ReplicatedStorage(storage_module.InMemoryBackend())
+    monkeypatch.setattr(storage_module, "_storage", memory)
+    l1_cache.clear()
+    yield memory
+    l1_cache.clear()
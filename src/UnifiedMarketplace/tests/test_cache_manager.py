@@ -0,0 +1,102 @@
+import threading
+
+import pytest
+
+import cache_manager
+from cache_manager import CACHE_DURATION, CACHE_SOFT_DURATION, cache_results, get_cached_entry, l1_cache
+from refresh_scheduler import RefreshScheduler
+
+PRODUCTS = [
+    {"product_id": f"p{index}", "product_title": f"Product {index}",
+     "offer": {"price": f"${index + 1}.99", "store_name": "Amazon"}}
+    for index in range(3)
+]
+
+
+class BlockingRefresh:
+    """A refresh that counts its calls and doesn't finish until released"""
+
+    def __init__(self):
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self):
+        self.calls += 1
+        self.started.set()
+        self.release.wait(5)
+
+
+@pytest.fixture
+def scheduler(monkeypatch, app_module):
+    """A private refresh scheduler, so counters start at zero"""
+    scheduler = RefreshScheduler(max_workers=2, max_pending=8)
+    monkeypatch.setattr(cache_manager, "refresh_scheduler", scheduler)
+    yield scheduler
+    scheduler.shutdown()
+
+
+@pytest.mark.parametrize("from_storage", [False, True])
+def test_fresh_entry_is_served_without_refresh(clock, storage, scheduler, from_storage):
+    cache_results("fresh", PRODUCTS)
+    clock.advance(hours=CACHE_SOFT_DURATION - 0.1)
+    if from_storage:
+        l1_cache.clear()
+
+    refresh = BlockingRefresh()
+    entry = get_cached_entry("fresh", refresh=refresh)
+
+    assert [product.product_id for product in entry.products] == ["p0", "p1", "p2"]
+    assert not entry.expired
+    assert scheduler.stats()["scheduled"] == 0
+
+
+@pytest.mark.parametrize("from_storage", [False, True])
+def test_soft_expired_entry_is_served_and_refreshed(clock, storage, scheduler, from_storage):
+    cache_results("stale", PRODUCTS)
+    clock.advance(hours=CACHE_SOFT_DURATION + 0.1)
+    if from_storage:
+        l1_cache.clear()
+
+    refresh = BlockingRefresh()
+    entry = get_cached_entry("stale", refresh=refresh)
+
+    assert len(entry.products) == 3
+    assert entry.soft_expires_at <= cache_manager.current_timestamp() < entry.expires_at
+    assert refresh.started.wait(5)
+    refresh.release.set()
+
+
+@pytest.mark.parametrize("from_storage", [False, True])
+def test_hard_expired_entry_is_not_served(clock, storage, scheduler, from_storage):
+    cache_results("expired", PRODUCTS)
+    clock.advance(hours=CACHE_DURATION + 0.1)
+    if from_storage:
+        l1_cache.clear()
+
+    refresh = BlockingRefresh()
+    assert get_cached_entry("expired", refresh=refresh) is None
+    assert scheduler.stats()["scheduled"] == 0
+
+
+def test_one_background_refresh_per_key(clock, storage, scheduler):
+    cache_results("busy", PRODUCTS)
+    cache_results("other", PRODUCTS)
+    clock.advance(hours=CACHE_SOFT_DURATION + 1)
+
+    refresh = BlockingRefresh()
+    for _ in range(5):
+        assert get_cached_entry("busy", refresh=refresh) is not None
+    assert refresh.started.wait(5)
+
+    other = BlockingRefresh()
+    get_cached_entry("other", refresh=other)
+    assert other.started.wait(5)
+
+    stats = scheduler.stats()
+    assert refresh.calls == 1
+    assert stats["scheduled"] == 2
+    assert stats["deduplicated"] == 4
+
+    refresh.release.set()
+    other.release.set()
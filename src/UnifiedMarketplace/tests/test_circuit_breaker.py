@@ -0,0 +1,68 @@
+import pytest
+
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpen
+
+RESET_TIMEOUT = 30
+
+
+class Ticker:
+    """A monotonic clock that only moves when told to"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def ticker():
+    return Ticker()
+
+
+@pytest.fixture
+def half_open(ticker):
+    """A breaker whose probe is in flight, with a call from before it opened still running"""
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=RESET_TIMEOUT, clock=ticker)
+    late = breaker.before_call()
+    for _ in range(2):
+        breaker.record_failure(breaker.before_call())
+    assert breaker.state == OPEN
+
+    ticker.now += RESET_TIMEOUT
+    probe = breaker.before_call()
+    assert probe is not None and late is None
+    return breaker, probe, late
+
+
+def test_late_success_does_not_close_half_open_circuit(half_open):
+    breaker, probe, late = half_open
+    breaker.record_success(late)
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()
+
+    breaker.record_success(probe)
+    assert breaker.state == CLOSED
+
+
+def test_late_failure_does_not_reopen_half_open_circuit(half_open):
+    breaker, probe, late = half_open
+    breaker.record_failure(late)
+    assert breaker.state == HALF_OPEN
+
+    breaker.record_failure(probe)
+    assert breaker.state == OPEN
+    assert breaker.stats()["open_for"] == RESET_TIMEOUT * 2
+
+
+def test_late_release_keeps_the_probe_slot(half_open):
+    breaker, probe, late = half_open
+    breaker.release(late)
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()
+    assert breaker.stats()["probes"] == 1
+
+    # Releasing the probe lets the next call probe instead
+    breaker.release(probe)
+    assert breaker.before_call() == probe + 1
@@ -0,0 +1,104 @@
+import pytest
+
+import api_manager
+import cache_manager
+from cache_keys import lookup_keys
+from cache_manager import EMPTY, ERROR, NegativeCache
+from circuit_breaker import CircuitOpen
+from product_model import normalize_products
+from rate_limiter import RateLimited
+
+EMPTY_TTL = 600
+ERROR_TTL = 60
+
+
+class StubUpstream:
+    """Answers like the search API: products, nothing, or an error, decided by the query"""
+
+    def __init__(self):
+        self.calls = []
+
+    def search(self, params, **kwargs):
+        query = params["q"]
+        self.calls.append(query)
+        if query == "broken":
+            raise api_manager.ProductSearchError("Product search API returned status 503")
+        if query == "shed":
+            raise RateLimited("Shed prefetch request", retry_after=1)
+        if query == "open":
+            raise CircuitOpen(api_manager.API_URL, 30)
+        if query.startswith("typo"):
+            return []
+        return normalize_products([
+            {"product_id": f"{query}-{index}", "product_title": f"{query} {index}",
+             "offer": {"price": f"${index + 1}.99", "store_name": "Amazon"}}
+            for index in range(3)
+        ])
+
+
+@pytest.fixture
+def upstream(monkeypatch, app_module, clock, storage):
+    """A stubbed search API behind a fresh negative cache"""
+    stub = StubUpstream()
+    monkeypatch.setattr(api_manager, "get_client", lambda: stub)
+
+    negative_cache = NegativeCache(empty_ttl=EMPTY_TTL, error_ttl=ERROR_TTL)
+    monkeypatch.setattr(cache_manager, "negative_cache", negative_cache)
+    monkeypatch.setattr(app_module, "negative_cache", negative_cache)
+    return stub
+
+
+def search(app_module, query):
+    with app_module.app.app_context():
+        products, cache_key, _ = app_module.search_products({"query": query})
+    return products, cache_key
+
+
+def test_empty_result_is_cached(app_module, upstream, clock):
+    products, cache_key = search(app_module, "typo lapotp")
+    assert products == []
+    assert app_module.negative_cache.get(cache_key).outcome == EMPTY
+
+    clock.advance(seconds=EMPTY_TTL - 1)
+    search(app_module, "typo lapotp")
+    assert upstream.calls == ["typo lapotp"]
+
+    clock.advance(seconds=2)
+    search(app_module, "typo lapotp")
+    assert upstream.calls == ["typo lapotp"] * 2
+
+
+def test_error_is_cached_with_shorter_ttl(app_module, upstream, clock):
+    products, cache_key = search(app_module, "broken")
+    assert products == []
+    result = app_module.negative_cache.get(cache_key)
+    assert result.outcome == ERROR
+    assert result.expires_at - result.created_at == ERROR_TTL < EMPTY_TTL
+
+    clock.advance(seconds=ERROR_TTL - 1)
+    search(app_module, "broken")
+    assert upstream.calls == ["broken"]
+
+    clock.advance(seconds=2)
+    search(app_module, "broken")
+    assert upstream.calls == ["broken"] * 2
+
+
+@pytest.mark.parametrize("query", ["shed", "open"])
+def test_shed_or_open_circuit_is_not_cached(app_module, upstream, query):
+    products, cache_key = search(app_module, query)
+    assert products == []
+    assert app_module.negative_cache.get(cache_key) is None
+
+    search(app_module, query)
+    assert upstream.calls == [query] * 2
+
+
+def test_results_drop_the_negative_entry(app_module, upstream):
+    cache_key = lookup_keys({"query": "lamp"})[0]
+    app_module.negative_cache.set(cache_key, ERROR)
+
+    with app_module.app.app_context():
+        products, _, _ = app_module.search_products({"query": "lamp"}, force_reload=True)
+    assert len(products) == 3
+    assert app_module.negative_cache.get(cache_key) is None
@@ -0,0 +1,68 @@
+import threading
+import time
+
+import pytest
+
+from prefetcher import ALREADY_CACHED, FETCHED, SHED, Prefetcher
+
+
+class StubPrefetch:
+    """Stands in for app.prefetch_page: returns a set outcome, once released"""
+
+    def __init__(self, outcome=FETCHED):
+        self.outcome = outcome
+        self.calls = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, search_params):
+        self.calls.append(search_params["page"])
+        self.release.wait(5)
+        return self.outcome
+
+
+@pytest.fixture
+def prefetcher():
+    prefetcher = Prefetcher(depth=3, budget=4, budget_window=3600, min_hits=1, workers=2, max_pending=32,
+                            enabled=True)
+    prefetcher._popular_loaded_at = time.monotonic()  # No search log in these tests
+    yield prefetcher
+    prefetcher.shutdown()
+
+
+def serve(prefetcher, prefetch, query, page=2):
+    prefetcher.record_hit({"query": query})
+    return prefetcher.after_serve({"query": query, "page": page}, prefetch)
+
+
+def settle(prefetcher):
+    deadline = time.monotonic() + 5
+    while prefetcher.stats()["workers"]["pending"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_budget_is_reserved_when_scheduling(prefetcher):
+    prefetch = StubPrefetch()
+    prefetch.release.clear()  # Nothing finishes during the burst
+
+    scheduled = sum(len(serve(prefetcher, prefetch, f"query {n}")) for n in range(5))
+    assert scheduled == 4
+    assert prefetcher.stats()["over_budget"] >= 1
+
+    prefetch.release.set()
+    settle(prefetcher)
+    stats = prefetcher.stats()
+    assert stats["fetched"] == 4
+    assert stats["budget_left"] == 0
+
+
+@pytest.mark.parametrize("outcome, counter", [(ALREADY_CACHED, "already_cached"), (SHED, "shed")])
+def test_prefetches_that_cost_nothing_are_refunded(prefetcher, outcome, counter):
+    prefetch = StubPrefetch(outcome)
+    assert serve(prefetcher, prefetch, "lamp") == [3, 4, 5]
+    settle(prefetcher)
+
+    stats = prefetcher.stats()
+    assert stats[counter] == 3
+    assert stats["fetched"] == 0
+    assert stats["budget_left"] == 4
@@ -0,0 +1,30 @@
+from product_index import ProductIndex
+from product_model import normalize_products
+
+RESULTS = [
+    {"product_id": "kettle-1", "product_title": "Electric Kettle 1.7L",
+     "product_description": "Stainless steel body with a borosilicate window",
+     "offer": {"price": "$29.99", "store_name": "Amazon"}},
+    {"product_id": "kettle-2", "product_title": "Gooseneck Kettle",
+     "product_description": "Variable temperature for pour-over coffee",
+     "offer": {"price": "$49.99", "store_name": "Amazon"}},
+]
+
+
+def found(index, query):
+    return [product.product_id for product in index.search({"query": query}).products]
+
+
+def test_description_terms_are_indexed_from_normalized_products(tmp_path):
+    index = ProductIndex(directory=str(tmp_path))
+    # The API client hands over compact products, without the raw dictionary
+    products = normalize_products(RESULTS, full=False)
+    assert all(product.raw is None for product in products)
+    index.add(products, {"query": "kettle"})
+
+    assert found(index, "borosilicate") == ["kettle-1"]
+    assert found(index, "pour-over coffee") == ["kettle-2"]
+
+    # And they survive a save and reload
+    index.save()
+    assert found(ProductIndex(directory=str(tmp_path)), "borosilicate") == ["kettle-1"]
@@ -0,0 +1,41 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from cache_keys import make_cache_key
+from search_log import popular_queries, save_search_log_batch, search_counts
+
+NOW = datetime(2026, 1, 1, 12, 0, 0)
+
+
+def served(query, at):
+    params = {"query": query}
+    return {"cache_key": make_cache_key(params), "query": query, "parameters": json.dumps(params),
+            "created_at": at}
+
+
+@pytest.fixture
+def search_log(app_module):
+    from models import SearchLog
+
+    with app_module.app.app_context():
+        app_module.db.session.query(SearchLog).delete()
+        app_module.db.session.commit()
+        yield SearchLog
+
+
+def test_searches_are_counted_per_key_and_hour(app_module, search_log):
+    save_search_log_batch([served("lamp", NOW + timedelta(minutes=minute)) for minute in (1, 2, 3)]
+                          + [served("kettle", NOW + timedelta(minutes=5))])
+    # A later batch counts up the same rows rather than adding more
+    save_search_log_batch([served("lamp", NOW + timedelta(minutes=50)), served("lamp", NOW + timedelta(hours=1))])
+
+    rows = app_module.db.session.query(search_log).order_by(search_log.hour, search_log.query).all()
+    assert [(row.query, row.hour, row.searches) for row in rows] == [
+        ("kettle", NOW, 1), ("lamp", NOW, 4), ("lamp", NOW + timedelta(hours=1), 1)]
+
+    # Windows count the whole hours they touch
+    counts = search_counts(NOW + timedelta(minutes=30), NOW + timedelta(minutes=40))
+    assert counts[make_cache_key({"query": "lamp"})][0] == 4
+    assert popular_queries(NOW, 10) == {"lamp": 5, "kettle": 1}
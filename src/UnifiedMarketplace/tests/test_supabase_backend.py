@@ -0,0 +1,129 @@
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+import cache_codec
+import supabase_client
+from storage import StorageError, SupabaseBackend
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+from fake_postgrest import FakeSupabaseClient  # noqa: E402
+
+NOW = datetime(2026, 1, 1, 12, 0, 0)
+
+
+class FailingSupabaseClient(FakeSupabaseClient):
+    """Fails every request after the first `succeed` ones with the given error"""
+
+    def __init__(self, error, succeed=0):
+        super().__init__()
+        self.error = error
+        self.succeed = succeed
+
+    def _execute(self, query):
+        if self.requests >= self.succeed:
+            self.requests += 1
+            raise self.error
+        return super()._execute(query)
+
+
+@pytest.fixture
+def use_client(monkeypatch):
+    """Install a fake PostgREST client for the test"""
+    def install(client):
+        monkeypatch.setattr(supabase_client, "_client", client)
+        monkeypatch.setattr(supabase_client, "_client_loaded", True)
+        return client
+    return install
+
+
+def cache_rows(client):
+    return {row["cache_key"]: row for row in client.tables.get(supabase_client.CACHE_TABLE, [])}
+
+
+def test_store_cached_sends_row_bounded_batches(use_client):
+    client = use_client(FakeSupabaseClient())
+    entries = [(f"v2:{index:032x}", cache_codec.encode([{"product_id": str(index)}]), NOW)
+               for index in range(supabase_client.BATCH_MAX_ROWS * 2 + 50)]
+
+    SupabaseBackend().store_cached(entries, 24)
+
+    assert client.requests == 3
+    rows = cache_rows(client)
+    assert len(rows) == len(entries)
+    assert cache_codec.decode(rows["v2:" + "0" * 32]["results"]) == [{"product_id": "0"}]
+
+
+def test_store_cached_sends_size_bounded_batches(use_client):
+    client = use_client(FakeSupabaseClient())
+    payload = b"x" * (supabase_client.BATCH_MAX_BYTES // 3)
+    entries = [(f"key-{index}", payload, NOW) for index in range(7)]
+
+    SupabaseBackend().store_cached(entries, 24)
+
+    # Base64-wrapped payloads are a third larger, so two fit per request
+    assert client.requests == 4
+    assert len(cache_rows(client)) == 7
+
+
+def test_store_cached_upserts_on_cache_key(use_client):
+    client = use_client(FakeSupabaseClient())
+    backend = SupabaseBackend()
+
+    # Within a batch the last entry for a key wins - Postgres rejects touching a row twice
+    backend.store_cached([("lamp", cache_codec.encode(["old"]), NOW),
+                          ("lamp", cache_codec.encode(["new"]), NOW)], 24)
+    assert len(client.tables[supabase_client.CACHE_TABLE]) == 1
+
+    later = NOW + timedelta(hours=2)
+    backend.store_cached([("lamp", cache_codec.encode(["newer"]), later)], 24)
+    rows = cache_rows(client)
+    assert len(client.tables[supabase_client.CACHE_TABLE]) == 1
+    assert cache_codec.decode(rows["lamp"]["results"]) == ["newer"]
+    assert rows["lamp"]["expires_at"] == (later + timedelta(hours=24)).isoformat()
+
+    entry = backend.get_cached(["lamp"], later)
+    assert cache_codec.decode(entry.payload) == ["newer"]
+
+
+def test_save_searches_inserts_in_batches(use_client):
+    client = use_client(FakeSupabaseClient())
+    searches = [{"user_id": index % 3, "query": f"query {index}", "parameters": "{}", "created_at": NOW}
+                for index in range(supabase_client.BATCH_MAX_ROWS + 1)]
+
+    SupabaseBackend().save_searches(searches)
+
+    assert client.requests == 2
+    rows = client.tables[supabase_client.SEARCH_HISTORY_TABLE]
+    assert [row["query"] for row in rows] == [search["query"] for search in searches]
+    assert rows[0]["created_at"] == NOW.isoformat()
+
+
+@pytest.mark.parametrize("error", [
+    Exception("500 Internal Server Error"),
+    Exception('relation "unified_marketplace_cache" does not exist'),
+])
+def test_store_cached_raises_storage_error(use_client, error):
+    use_client(FailingSupabaseClient(error))
+    with pytest.raises(StorageError):
+        SupabaseBackend().store_cached([("lamp", cache_codec.encode(["lamp"]), NOW)], 24)
+
+
+def test_save_searches_raises_storage_error_mid_batch(use_client):
+    client = use_client(FailingSupabaseClient(Exception("connection reset"), succeed=1))
+    searches = [{"user_id": 1, "query": f"query {index}", "parameters": None}
+                for index in range(supabase_client.BATCH_MAX_ROWS + 1)]
+
+    with pytest.raises(StorageError):
+        SupabaseBackend().save_searches(searches)
+    assert client.requests == 2
+    assert len(client.tables[supabase_client.SEARCH_HISTORY_TABLE]) == supabase_client.BATCH_MAX_ROWS
+
+
+def test_missing_client_raises_storage_error(use_client):
+    use_client(None)
+    with pytest.raises(StorageError):
+        SupabaseBackend().store_cached([("lamp", cache_codec.encode(["lamp"]), NOW)], 24)
@@ -0,0 +1,23 @@
+import threading
+
+from flask import current_app
+
+from write_behind import WriteBehindQueue
+
+
+def test_inline_write_from_a_thread_without_app_context(app_module):
+    # No workers, so every write is made inline by the submitting thread
+    write_queue = WriteBehindQueue(workers=0)
+    written = []
+    write_queue.register("item", lambda items: written.extend((current_app.name, item) for item in items))
+
+    results = []
+    thread = threading.Thread(target=lambda: results.append(write_queue.submit("item", 1)))
+    thread.start()
+    thread.join(5)
+    with app_module.app.app_context():
+        results.append(write_queue.submit("item", 2))
+
+    assert results == [True, True]
+    assert written == [(app_module.app.name, 1), (app_module.app.name, 2)]
+    assert write_queue.stats()["failed"] == 0
@@ -0,0 +1,97 @@
+import logging
+import os
+from dataclasses import dataclass
+from datetime import datetime
+
+from flask_login import UserMixin
+
+from memory_cache import LRUCache
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Each worker has its own cache, so another worker's change to a user shows up here within the TTL
+USER_CACHE_TTL = float(os.environ.get("USER_CACHE_TTL", 300))  # Seconds
+USER_CACHE_MAX_ENTRIES = int(os.environ.get("USER_CACHE_MAX_ENTRIES", 10000))
+
+# Keys: "id:<id>" -> SessionUser, "supabase-email:<email>" / "supabase-username:<username>" -> Supabase row
+user_cache = LRUCache(max_entries=USER_CACHE_MAX_ENTRIES, ttl=USER_CACHE_TTL)
+
+
+@dataclass(frozen=True, eq=False)
+class SessionUser(UserMixin):
+    """
+    Read-only snapshot of the logged-in user, used as Flask-Login's current_user.
+
+    Holds only what pages render, so it can be cached between requests
+    without a database session. The password hash is deliberately left out.
+    """
+    id: int
+    username: str
+    email: str
+    created_at: datetime = None
+
+    @classmethod
+    def from_dict(cls, user):
+        """
+        Args:
+            user (dict): A user from storage
+
+        Returns:
+            SessionUser: The snapshot
+        """
+        return cls(id=user["id"], username=user["username"], email=user["email"],
+                   created_at=user.get("created_at"))
+
+
+def load_session_user(user_id):
+    """
+    Get the session user for an ID, from the cache or storage.
+
+    Args:
+        user_id (int): The user ID
+
+    Returns:
+        SessionUser: The user, None if not found
+    """
+    # Import here to avoid circular imports
+    from storage import get_storage
+
+    key = f"id:{user_id}"
+    session_user = user_cache.get(key)
+    if session_user is not None:
+        return session_user
+
+    user = get_storage().get_user(user_id)
+    if user is None:
+        return None  # Not cached, so a user created later is found straight away
+
+    session_user = SessionUser.from_dict(user)
+    user_cache.set(key, session_user)
+    return session_user
+
+def get_cached_supabase_user(field, value):
+    """Get a cached Supabase user row looked up by "email" or "username", or None"""
+    return user_cache.get(f"supabase-{field}:{value}")
+
+def remember_supabase_user(user):
+    """Cache a Supabase user row under both its email and username"""
+    if user:
+        user_cache.set(f"supabase-email:{user.get('email')}", user)
+        user_cache.set(f"supabase-username:{user.get('username')}", user)
+
+def invalidate_user(user_id=None, username=None, email=None):
+    """
+    Drop every cached entry for a user after it is created or changed.
+
+    Args:
+        user_id (int): The user ID
+        username (str): The username
+        email (str): The email address
+    """
+    if user_id is not None:
+        user_cache.delete(f"id:{user_id}")
+    if username is not None:
+        user_cache.delete(f"supabase-username:{username}")
+    if email is not None:
+        user_cache.delete(f"supabase-email:{email}")
@@ -0,0 +1,170 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from cache_keys import lookup_keys
+from search_log import search_counts
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Import the app within functions to avoid circular imports
+
+WARMUP_TOP_K = int(os.environ.get("WARMUP_TOP_K", 50))  # Most searched canonical searches warmed per run
+WARMUP_WINDOW_HOURS = float(os.environ.get("WARMUP_WINDOW_HOURS", 24))  # Search log window popularity is counted over
+WARMUP_WORKERS = int(os.environ.get("WARMUP_WORKERS", 4))
+WARMUP_RATE = float(os.environ.get("WARMUP_RATE", 1))  # API calls started per second, on top of the rate limiter
+WARMUP_COVERAGE_HOURS = 1  # Coverage is measured over the hour after a warm-up
+
+# Outcomes of warming one search
+WARMED = "warmed"
+ALREADY_WARM = "already_warm"
+EMPTY = "empty"  # No results, or the API failed - negatively cached
+SKIPPED = "skipped"  # Shed by the rate limiter or the circuit breaker, or errored
+
+
+@dataclass
+class PopularSearch:
+    """A canonical search and how often it was run"""
+    cache_key: str
+    params: dict  # Normalized search parameters, page and limit included
+    searches: int
+
+
+def top_searches(limit=WARMUP_TOP_K, hours=WARMUP_WINDOW_HOURS, until=None):
+    """
+    Get the most searched canonical searches of a sliding window of the search log.
+
+    Args:
+        limit (int): Number of searches to return
+        hours (float): Length of the window
+        until (datetime): End of the window, now by default
+
+    Returns:
+        list: PopularSearch objects, most searched first
+    """
+    until = until or datetime.utcnow()
+    counts = search_counts(until - timedelta(hours=hours), until)
+    popular = sorted(counts.items(), key=lambda item: item[1][0], reverse=True)[:limit]
+    return [PopularSearch(cache_key, params, searches) for cache_key, (searches, params) in popular]
+
+
+def warmup_coverage(at=None, limit=WARMUP_TOP_K, hours=WARMUP_WINDOW_HOURS):
+    """
+    Measure how many of the next hour's searches a warm-up would have covered.
+
+    Replays history: picks the top searches as a warm-up run at `at` would
+    have, then counts the share of the searches served in the following hour
+    that were for one of them.
+
+    Args:
+        at (datetime): Time of the simulated warm-up, rounded down to the hour -
+            an hour ago by default
+        limit (int): Searches warmed
+        hours (float): Window popularity is counted over
+
+    Returns:
+        dict: Window start, searches in the following hour, those covered,
+            and coverage as a fraction or None if there were no searches
+    """
+    at = at or datetime.utcnow() - timedelta(hours=WARMUP_COVERAGE_HOURS)
+    # The search log counts whole hours, so replay from the start of one
+    at = at.replace(minute=0, second=0, microsecond=0)
+    warm = {search.cache_key for search in top_searches(limit, hours, until=at)}
+    counts = search_counts(at, at + timedelta(hours=WARMUP_COVERAGE_HOURS))
+
+    searches = sum(count for count, _ in counts.values())
+    covered = sum(count for cache_key, (count, _) in counts.items() if cache_key in warm)
+    return {
+        "window_start": at.isoformat(),
+        "searches": searches,
+        "covered": covered,
+        "coverage": round(covered / searches, 4) if searches else None
+    }
+
+
+class _Pacer:
+    """Space out calls so no more than rate start per second, across threads"""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate > 0 else 0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def _warm_one(search, pacer):
+    """Fetch and cache one search unless it is already fresh in the cache"""
+    # Import here to avoid circular imports
+    from app import app, search_products
+    from cache_manager import current_timestamp, get_cached_entry, negative_cache
+    from rate_limiter import PRIORITY_BACKGROUND
+
+    with app.app_context():
+        cache_key, *legacy_keys = lookup_keys(search.params)
+        entry = get_cached_entry(cache_key, fallback_keys=legacy_keys)
+        if entry and entry.products and entry.soft_expires_at > current_timestamp():
+            return ALREADY_WARM
+
+        # Stale entries are reloaded now rather than on their next read
+        pacer.wait()
+        try:
+            products, _, _ = search_products(search.params, force_reload=entry is not None,
+                                             priority=PRIORITY_BACKGROUND)
+        except Exception as e:
+            logging.error(f"Error warming cache for {cache_key}: {e}")
+            return SKIPPED
+        if products:
+            return WARMED
+        return EMPTY if negative_cache.get(cache_key) else SKIPPED
+
+
+def warm_cache(limit=WARMUP_TOP_K, hours=WARMUP_WINDOW_HOURS, workers=WARMUP_WORKERS,
+               rate=WARMUP_RATE, dry_run=False):
+    """
+    Pre-populate the cache with the most searched searches of the search log.
+
+    Searches already fresh in the cache are left alone. The rest are fetched
+    in parallel at background priority, paced to rate calls per second so
+    interactive searches keep most of the API quota.
+
+    Args:
+        limit (int): Number of top searches to warm
+        hours (float): Search log window popularity is counted over
+        workers (int): Searches fetched at once
+        rate (float): API calls started per second, 0 for no pacing
+        dry_run (bool): Only pick the searches, don't fetch them
+
+    Returns:
+        dict: Searches picked, counts per outcome, duration in seconds, and
+            the coverage the same warm-up would have had an hour ago
+    """
+    start = time.monotonic()
+    popular = top_searches(limit, hours)
+    outcomes = {WARMED: 0, ALREADY_WARM: 0, EMPTY: 0, SKIPPED: 0}
+
+    if not dry_run and popular:
+        pacer = _Pacer(rate)
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="cache-warmup") as pool:
+            for outcome in pool.map(lambda search: _warm_one(search, pacer), popular):
+                outcomes[outcome] += 1
+
+    summary = {
+        "searches": len(popular),
+        **outcomes,
+        "seconds": round(time.monotonic() - start, 2),
+        "coverage": warmup_coverage(limit=limit, hours=hours)
+    }
+    logging.info(f"Cache warm-up finished: {summary}")
+    return summary
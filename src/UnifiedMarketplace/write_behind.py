@@ -0,0 +1,247 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+
+from flask import has_app_context
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG, format="%(asctime)s - %(levelname)s - %(message)s")
+
+WRITE_BEHIND_WORKERS = int(os.environ.get("WRITE_BEHIND_WORKERS", 2))  # 0 writes everything inline
+WRITE_BEHIND_QUEUE_SIZE = int(os.environ.get("WRITE_BEHIND_QUEUE_SIZE", 1000))
+WRITE_BEHIND_BATCH_SIZE = int(os.environ.get("WRITE_BEHIND_BATCH_SIZE", 50))
+WRITE_BEHIND_LINGER = float(os.environ.get("WRITE_BEHIND_LINGER", 0.05))  # Seconds to wait for a batch to fill
+WRITE_BEHIND_SHUTDOWN_TIMEOUT = float(os.environ.get("WRITE_BEHIND_SHUTDOWN_TIMEOUT", 10))
+
+# What to do when the queue is full: "inline" (write in the caller), "block" or "drop"
+WRITE_BEHIND_FULL_POLICY = os.environ.get("WRITE_BEHIND_FULL_POLICY", "inline")
+WRITE_BEHIND_BLOCK_TIMEOUT = float(os.environ.get("WRITE_BEHIND_BLOCK_TIMEOUT", 1))  # "block" waits this long, then drops
+
+_STOP = object()
+
+
+class WriteBehindQueue:
+    """
+    Bounded in-process queue that batches database writes on background threads.
+
+    Each kind of write has a handler that receives a list of items and writes
+    them together. Handlers run inside a Flask app context. Pending writes are
+    flushed when the process exits.
+    """
+
+    def __init__(self, workers=WRITE_BEHIND_WORKERS, maxsize=WRITE_BEHIND_QUEUE_SIZE,
+                 batch_size=WRITE_BEHIND_BATCH_SIZE, linger=WRITE_BEHIND_LINGER,
+                 full_policy=WRITE_BEHIND_FULL_POLICY, block_timeout=WRITE_BEHIND_BLOCK_TIMEOUT):
+        """
+        Args:
+            workers (int): Background writer threads, 0 to write inline
+            maxsize (int): Maximum queued items
+            batch_size (int): Maximum items handed to a handler at once
+            linger (float): Seconds a worker waits for more items before writing a partial batch
+            full_policy (str): "inline", "block" or "drop" when the queue is full
+            block_timeout (float): Seconds "block" waits for space before dropping
+        """
+        self.workers = workers
+        self.batch_size = batch_size
+        self.linger = linger
+        self.full_policy = full_policy
+        self.block_timeout = block_timeout
+
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._handlers = {}
+        self._threads = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._closed = False
+
+        # Counters
+        self.enqueued = 0
+        self.written = 0
+        self.failed = 0
+        self.dropped = 0
+        self.inline = 0
+        self.batches = 0
+
+    def register(self, kind, handler):
+        """
+        Register the batch writer for a kind of item.
+
+        Args:
+            kind (str): Name used when submitting items
+            handler (callable): Called with a list of items to write, returns the
+                number of items that failed (or None if all were written)
+        """
+        self._handlers[kind] = handler
+
+    def submit(self, kind, item):
+        """
+        Queue an item to be written in the background.
+
+        Args:
+            kind (str): A registered kind
+            item: Passed to the kind's handler
+
+        Returns:
+            bool: False if the item was dropped
+        """
+        if kind not in self._handlers:
+            raise KeyError(f"No write-behind handler registered for {kind}")
+
+        if self.workers <= 0 or self._closed:
+            return self._write_inline(kind, item)
+
+        # Handlers that queue follow-up writes (replication) run on a worker, which must never
+        # wait for queue space it is the one to free - a full queue is written inline there
+        on_worker = getattr(self._local, "is_worker", False)
+
+        self._start_workers()
+        try:
+            if self.full_policy == "block" and not on_worker:
+                self._queue.put((kind, item), timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait((kind, item))
+        except queue.Full:
+            if self.full_policy == "inline" or on_worker:
+                return self._write_inline(kind, item)
+            with self._lock:
+                self.dropped += 1
+            logging.warning(f"Write-behind queue full, dropped {kind} write")
+            return False
+
+        with self._lock:
+            self.enqueued += 1
+        return True
+
+    def flush(self, timeout=None):
+        """
+        Wait until every queued item has been written.
+
+        Args:
+            timeout (float): Maximum seconds to wait
+
+        Returns:
+            bool: True if the queue drained in time
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def shutdown(self, timeout=WRITE_BEHIND_SHUTDOWN_TIMEOUT):
+        """Write everything still queued and stop the workers"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            threads = list(self._threads)
+
+        if not threads:
+            return
+
+        logging.info(f"Flushing {self._queue.qsize()} pending write-behind items")
+        for _ in threads:
+            self._queue.put(_STOP)
+        deadline = time.monotonic() + timeout
+        for thread in threads:
+            thread.join(max(0, deadline - time.monotonic()))
+
+    def stats(self):
+        """
+        Get queue counters.
+
+        Returns:
+            dict: Queue depth and enqueued/written/failed/dropped counts
+        """
+        with self._lock:
+            return {
+                "queued": self._queue.qsize(),
+                "enqueued": self.enqueued,
+                "written": self.written,
+                "failed": self.failed,
+                "dropped": self.dropped,
+                "inline": self.inline,
+                "batches": self.batches
+            }
+
+    def _start_workers(self):
+        if self._threads:
+            return
+        with self._lock:
+            if self._threads or self._closed:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"write-behind-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            atexit.register(self.shutdown)
+
+    def _write_inline(self, kind, item):
+        with self._lock:
+            self.inline += 1
+        # Callers may be background threads (prefetch, warm-up, refreshes) without an app context
+        return self._write(kind, [item], in_app_context=has_app_context())
+
+    def _worker(self):
+        self._local.is_worker = True
+        stopping = False
+        while not stopping:
+            first = self._queue.get()
+            if first is _STOP:
+                self._queue.task_done()
+                break
+
+            # Collect a batch, waiting briefly for it to fill
+            batch = [first]
+            deadline = time.monotonic() + self.linger
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    self._queue.task_done()
+                    stopping = True  # Write this batch, then exit
+                    break
+                batch.append(item)
+
+            by_kind = defaultdict(list)
+            for kind, item in batch:
+                by_kind[kind].append(item)
+            try:
+                for kind, items in by_kind.items():
+                    self._write(kind, items)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, kind, items, in_app_context=False):
+        try:
+            if in_app_context:
+                failed = self._handlers[kind](items) or 0
+            else:
+                # Import here to avoid circular imports
+                from app import app
+
+                with app.app_context():
+                    failed = self._handlers[kind](items) or 0
+        except Exception as e:
+            logging.error(f"Write-behind {kind} batch of {len(items)} failed: {e}")
+            failed = len(items)
+
+        with self._lock:
+            self.written += len(items) - failed
+            self.failed += failed
+            self.batches += 1
+        return failed == 0
+
+
+# Shared write-behind queue for cache and search history writes
+write_queue = WriteBehindQueue()